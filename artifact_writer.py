@@ -0,0 +1,161 @@
+import itertools
+import queue
+import threading
+import time
+
+
+class ArtifactWriter:
+    """This class runs the saving of the run artefacts (depth, poses, ...) on background threads.
+
+    Each job is a function with its arguments. The jobs that share the same key are
+    always run by the same thread, in the order in which they are submitted, so
+    the jobs that append to the same file (e.g. pose.txt) keep the frame order.
+
+    The errors raised by the jobs are reported back in the caller thread by the
+    next call to submit, check, flush or close.
+
+    Usage example:
+        writer = ArtifactWriter(workers=2)
+        writer.submit(save_depth, depth_path, depth)
+        writer.submit(save_pose_txt, args, name, pose, key="pose.txt")
+        writer.close()
+    """
+
+    def __init__(self, workers=2, max_queue=64):
+        """Build the writer
+
+        Args:
+            workers (int): the number of writing threads, if it is 0 the jobs are run in the caller thread. Defaults to 2
+            max_queue (int): the max number of jobs waiting for each thread, submit blocks when it is reached. Defaults to 64
+        """
+        self.workers = workers
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._work, args=(q,), daemon=True)
+            for q in self._queues
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._round_robin = itertools.cycle(range(max(workers, 1)))
+        self._lock = threading.Lock()
+        self._errors = []
+        self._closed = False
+
+        self.jobs = 0
+        self.write_time = 0.0
+        self.max_write_time = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.max_queue_depth = 0
+
+    def submit(self, function, *args, key=None):
+        """Add a job to the queue
+
+        Args:
+            function (callable): the function that writes the artefact
+            *args: the arguments of the function
+            key (hashable): the jobs with the same key are run in order. Defaults to None
+
+        Raises:
+            RuntimeError: if a previous job has failed or the writer is closed
+        """
+        self.check()
+        if self._closed:
+            raise RuntimeError("the writer is closed")
+        if self.workers == 0:
+            self._run(function, args, time.perf_counter())
+            return
+        if key is None:
+            worker = next(self._round_robin)
+        else:
+            worker = hash(key) % self.workers
+        self._queues[worker].put((function, args, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, self.get_queue_depth())
+
+    def get_queue_depth(self):
+        """Get the number of jobs waiting to be written"""
+        return sum(q.qsize() for q in self._queues)
+
+    def check(self):
+        """Raise the first error of the jobs run so far
+
+        Raises:
+            RuntimeError: if a job has failed
+        """
+        with self._lock:
+            if self._errors:
+                error = self._errors[0]
+                raise RuntimeError(f"failed to write an artefact: {error}") from error
+
+    def flush(self):
+        """Wait until all the submitted jobs are written
+
+        Raises:
+            RuntimeError: if a job has failed
+        """
+        for q in self._queues:
+            q.join()
+        self.check()
+
+    def close(self):
+        """Write all the submitted jobs and stop the threads
+
+        Raises:
+            RuntimeError: if a job has failed
+        """
+        if not self._closed:
+            self._closed = True
+            for q in self._queues:
+                q.put(None)
+            for thread in self._threads:
+                thread.join()
+        self.check()
+
+    def get_stats(self):
+        """Get the statistics of the writer
+
+        Returns:
+            a dict with the number of jobs, the current and max queue depth, the mean and max
+            write time and the mean and max latency (from submit to the end of the write) in seconds
+        """
+        with self._lock:
+            jobs = max(self.jobs, 1)
+            return {
+                "jobs": self.jobs,
+                "queue_depth": self.get_queue_depth(),
+                "max_queue_depth": self.max_queue_depth,
+                "mean_write_time": self.write_time / jobs,
+                "max_write_time": self.max_write_time,
+                "mean_latency": self.latency / jobs,
+                "max_latency": self.max_latency,
+            }
+
+    def _work(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                jobs.task_done()
+                return
+            self._run(*job)
+            jobs.task_done()
+
+    def _run(self, function, args, t_submit):
+        t_start = time.perf_counter()
+        try:
+            function(*args)
+        except Exception as error:
+            with self._lock:
+                self._errors.append(error)
+        t_end = time.perf_counter()
+        with self._lock:
+            self.jobs += 1
+            self.write_time += t_end - t_start
+            self.max_write_time = max(self.max_write_time, t_end - t_start)
+            self.latency += t_end - t_submit
+            self.max_latency = max(self.max_latency, t_end - t_submit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,125 @@
+"""Benchmark of KittiEvalOdom.calc_sequence_errors against the original per-segment loop.
+
+Run from the repository root:
+    python benchmarks/bench_kitti_eval.py --frames 5000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from kitti_odometry import KittiEvalOdom
+
+
+class LoopKittiEvalOdom(KittiEvalOdom):
+    """The original implementation, with a linear scan and three inversions per segment"""
+
+    def trajectory_distances(self, poses):
+        dist = [0]
+        sort_frame_idx = sorted(poses.keys())
+        for i in range(len(sort_frame_idx) - 1):
+            P1 = poses[sort_frame_idx[i]]
+            P2 = poses[sort_frame_idx[i + 1]]
+            dx = P1[0, 3] - P2[0, 3]
+            dy = P1[1, 3] - P2[1, 3]
+            dz = P1[2, 3] - P2[2, 3]
+            dist.append(dist[i] + np.sqrt(dx * dx + dy * dy + dz * dz))
+        return dist
+
+    def last_frame_from_segment_length(self, dist, first_frame, length):
+        for i in range(first_frame, len(dist), 1):
+            if dist[i] > (dist[first_frame] + length):
+                return i
+        return -1
+
+    def calc_sequence_errors(self, poses_gt, poses_result):
+        err = []
+        dist = self.trajectory_distances(poses_gt)
+        self.step_size = 10
+        for first_frame in range(0, len(poses_gt), self.step_size):
+            for i in range(self.num_lengths):
+                len_ = self.lengths[i]
+                last_frame = self.last_frame_from_segment_length(
+                    dist, first_frame, len_
+                )
+                if (
+                    last_frame == -1
+                    or not (last_frame in poses_result.keys())
+                    or not (first_frame in poses_result.keys())
+                ):
+                    continue
+                pose_delta_gt = np.dot(
+                    np.linalg.inv(poses_gt[first_frame]), poses_gt[last_frame]
+                )
+                pose_delta_result = np.dot(
+                    np.linalg.inv(poses_result[first_frame]), poses_result[last_frame]
+                )
+                pose_error = np.dot(np.linalg.inv(pose_delta_result), pose_delta_gt)
+                r_err = self.rotation_error(pose_error)
+                t_err = self.translation_error(pose_error)
+                num_frames = last_frame - first_frame + 1.0
+                speed = len_ / (0.1 * num_frames)
+                err.append([first_frame, r_err / len_, t_err / len_, len_, speed])
+        return err
+
+
+def random_trajectory(num_frames, seed, noise=0.0):
+    """Build a KITTI-like trajectory: about 1m per frame with a slowly changing heading"""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.01, num_frames))
+    steps = np.stack(
+        [np.sin(heading), rng.normal(0, 0.01, num_frames), np.cos(heading)], axis=1
+    )
+    positions = np.cumsum(steps * rng.uniform(0.5, 1.5, (num_frames, 1)), axis=0)
+    poses = {}
+    for i in range(num_frames):
+        angle = heading[i] + rng.normal(0, noise)
+        pose = np.eye(4)
+        pose[0, 0] = pose[2, 2] = np.cos(angle)
+        pose[0, 2] = np.sin(angle)
+        pose[2, 0] = -np.sin(angle)
+        pose[:3, 3] = positions[i] + rng.normal(0, noise, 3)
+        poses[i] = pose
+    return poses
+
+
+def run(args):
+    poses_gt = random_trajectory(args.frames, seed=0)
+    poses_result = random_trajectory(args.frames, seed=0, noise=0.05)
+    # drop some frames, as a run that is lost for a while
+    for i in range(args.frames // 3, args.frames // 3 + 50):
+        poses_result.pop(i, None)
+
+    timings = {}
+    errors = {}
+    for name, evaluator in [
+        ("loop", LoopKittiEvalOdom()),
+        ("vectorized", KittiEvalOdom()),
+    ]:
+        t_start = time.perf_counter()
+        errors[name] = evaluator.calc_sequence_errors(poses_gt, poses_result)
+        timings[name] = time.perf_counter() - t_start
+        print("{:>12}: {:8.3f}s".format(name, timings[name]))
+
+    identical = errors["loop"] == errors["vectorized"]
+    print("segments: {}".format(len(errors["vectorized"])))
+    print("speedup: {:.1f}x".format(timings["loop"] / timings["vectorized"]))
+    print("identical results: {}".format(identical))
+    if not identical:
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser(
+    description="Compare the vectorized KITTI sequence errors with the original loop"
+)
+parser.add_argument(
+    "--frames", type=int, default=5000, help="number of frames of the trajectory"
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    run(args)
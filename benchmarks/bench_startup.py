@@ -0,0 +1,159 @@
+"""Startup benchmark of slampy and the runners, checked against a tracked budget.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --output startup.json
+
+Every measure runs in a fresh interpreter, so the module caches of a previous
+measure do not hide the import cost. The import measures time only the import
+statement; first_frame times, in the same process, the import of run.py, the
+construction of a System on MockSlam, the loading of the first image and its
+tracking. The median of --repeats runs is compared with the budget of
+benchmarks/startup_budget.json, and the script exits with 1 when a measure is
+over its budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BUDGET_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "startup_budget.json"
+)
+MOCK_SETTINGS = os.path.join(ROOT, "settings_mock.yaml")
+
+IMPORT_SCRIPT = """
+import time
+t_start = time.perf_counter()
+import {module}
+print(time.perf_counter() - t_start)
+"""
+
+FIRST_FRAME_SCRIPT = """
+import time
+t_start = time.perf_counter()
+import run
+import slampy
+from utils import load_image
+app = slampy.System({settings!r}, slampy.Sensor.MONOCULAR)
+app.process_image_mono(load_image({image!r}), 0.0)
+app.get_pose_to_target()
+print(time.perf_counter() - t_start)
+"""
+
+# name: script run in a fresh interpreter, it prints the measured seconds
+MEASURES = {
+    "import_slampy": IMPORT_SCRIPT.format(module="slampy"),
+    "import_utils": IMPORT_SCRIPT.format(module="utils"),
+    "import_kitti_odometry": IMPORT_SCRIPT.format(module="kitti_odometry"),
+    "import_run": IMPORT_SCRIPT.format(module="run"),
+    "import_run_MONO_IMU": IMPORT_SCRIPT.format(module="run_MONO_IMU"),
+}
+
+
+def measure(script):
+    """Run a script in a fresh interpreter, from the repository root, and get the seconds it prints"""
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    return float(output.split()[-1])
+
+
+def run_measures(repeats):
+    """Run every measure
+
+    Args:
+        repeats (int): the number of runs of each measure
+
+    Returns:
+        a dict that maps each measure to a dict with the seconds of each run ("samples") and their median
+    """
+    import cv2
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "000000.png")
+        cv2.imwrite(image, np.zeros((370, 1226, 3), dtype=np.uint8))
+        scripts = dict(MEASURES)
+        scripts["first_frame"] = FIRST_FRAME_SCRIPT.format(
+            settings=MOCK_SETTINGS, image=image
+        )
+        for name, script in scripts.items():
+            samples = [measure(script) for _ in range(repeats)]
+            results[name] = {"samples": samples, "median": float(np.median(samples))}
+    return results
+
+
+def check_budget(results, budget):
+    """Compare the medians with the budget
+
+    Args:
+        results (dict): the results of run_measures
+        budget (dict): maps a measure to its max median, in seconds
+
+    Returns:
+        the list of the measures over their budget
+    """
+    over = []
+    for name, stats in results.items():
+        limit = budget.get(name)
+        verdict = "no budget"
+        if limit is not None:
+            verdict = "ok" if stats["median"] <= limit else "OVER BUDGET"
+            if stats["median"] > limit:
+                over.append(name)
+        print(
+            "{:>24}: {:8.1f}ms (budget {}) {}".format(
+                name,
+                stats["median"] * 1e3,
+                "-" if limit is None else "{:.0f}ms".format(limit * 1e3),
+                verdict,
+            )
+        )
+    return over
+
+
+def main(args):
+    results = run_measures(args.repeats)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results saved in {args.output}")
+    with open(args.budget) as f:
+        budget = json.load(f)
+    if check_budget(results, budget):
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser(
+    description="Measure the import time and the time to the first frame, and check them against the budget"
+)
+
+parser.add_argument(
+    "--repeats", type=int, default=5, help="number of runs of each measure"
+)
+
+parser.add_argument(
+    "--budget",
+    type=str,
+    default=BUDGET_FILE,
+    help="the json file with the max median of each measure, in seconds",
+)
+
+parser.add_argument(
+    "--output", type=str, default=None, help="where do we save the results?"
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    main(args)
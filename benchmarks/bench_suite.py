@@ -0,0 +1,320 @@
+"""Throughput benchmarks of the wrapper, run on the MockSlam method, with JSON baselines.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py run --output current.json
+    python benchmarks/bench_suite.py compare benchmarks/baseline.json current.json
+
+benchmarks/baseline.json holds the results of the current version; the times
+depend on the machine, so a baseline is comparable only with runs made on the
+same one.
+
+Each benchmark is repeated --repeats times and the time per operation of each
+repeat is stored. compare reports a regression only when the median time grows
+more than --threshold and more than --noise times the spread of the two runs.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+import slampy
+from kitti_odometry import KittiEvalOdom
+from utils import save_depth, save_pose, save_pose_txt, save_sparse_depth
+from bench_kitti_eval import random_trajectory
+
+MOCK_SETTINGS = os.path.join(ROOT, "settings_mock.yaml")
+IMAGE_SHAPE = (370, 1226, 3)
+
+
+def _mock_system(frames=0):
+    """Build a System on MockSlam, with frames already processed"""
+    app = slampy.System(MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    image = np.zeros(IMAGE_SHAPE, dtype=np.uint8)
+    for i in range(frames):
+        app.process_image_mono(image, i * 0.1)
+    return app, image
+
+
+def bench_process(frames):
+    """System.process_image_mono on MockSlam, per frame"""
+    app, image = _mock_system()
+    t_start = time.perf_counter()
+    for i in range(frames):
+        app.process_image_mono(image, i * 0.1)
+    return (time.perf_counter() - t_start) / frames
+
+
+def _bench_getter(name, frames):
+    app, image = _mock_system(frames=3)
+    getter = getattr(app, name)
+    elapsed = 0.0
+    for i in range(frames):
+        app.process_image_mono(image, (i + 3) * 0.1)
+        t_start = time.perf_counter()
+        getter()
+        elapsed += time.perf_counter() - t_start
+    return elapsed / frames
+
+
+def bench_get_pose(frames):
+    """System.get_pose_to_target, first call of each frame"""
+    return _bench_getter("get_pose_to_target", frames)
+
+
+def bench_get_depth(frames):
+    """System.get_depth, first call of each frame"""
+    return _bench_getter("get_depth", frames)
+
+
+def bench_get_sparse_depth(frames):
+    """System.get_sparse_depth, first call of each frame"""
+    return _bench_getter("get_sparse_depth", frames)
+
+
+def bench_get_point_cloud_colored(frames):
+    """System.get_point_cloud_colored, first call of each frame"""
+    return _bench_getter("get_point_cloud_colored", frames)
+
+
+def bench_run_loop(frames):
+    """run.run on a synthetic KITTI_VO sequence, per frame, w/o evaluation"""
+    import cv2
+    from run import parser as run_parser
+    from run import run
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = os.path.join(tmp, "sequence")
+        os.makedirs(os.path.join(dataset, "data"))
+        image = np.random.default_rng(0).integers(0, 255, IMAGE_SHAPE, np.uint8)
+        for i in range(frames):
+            cv2.imwrite(os.path.join(dataset, "data", f"{i:06d}.png"), image)
+        with open(os.path.join(dataset, "times.txt"), "w") as f:
+            f.writelines(f"{i * 0.1:e}\n" for i in range(frames))
+
+        args = run_parser.parse_args(
+            [
+                "--dataset",
+                dataset,
+                "--settings",
+                MOCK_SETTINGS,
+                "--dest",
+                os.path.join(tmp, "results"),
+                "--data_type",
+                "KITTI_VO",
+                "--is_bash",
+            ]
+        )
+        t_start = time.perf_counter()
+        run(args)
+        return (time.perf_counter() - t_start) / frames
+
+
+def bench_save_depth(frames):
+    """utils.save_depth of a dense depth map"""
+    return _bench_saver(save_depth, "get_depth", frames)
+
+
+def bench_save_sparse_depth(frames):
+    """utils.save_sparse_depth of a sparse depth"""
+    return _bench_saver(save_sparse_depth, "get_sparse_depth", frames)
+
+
+def _bench_saver(saver, getter, frames):
+    app, _ = _mock_system(frames=3)
+    depth = getattr(app, getter)()
+    with tempfile.TemporaryDirectory() as tmp:
+        t_start = time.perf_counter()
+        for i in range(frames):
+            saver(os.path.join(tmp, f"{i:06d}"), depth)
+        return (time.perf_counter() - t_start) / frames
+
+
+def bench_save_pose(frames):
+    """utils.save_pose and utils.save_pose_txt of a pose"""
+    app, _ = _mock_system(frames=3)
+    pose = app.get_pose_to_target()
+    with tempfile.TemporaryDirectory() as tmp:
+        args = argparse.Namespace(dest=tmp)
+        t_start = time.perf_counter()
+        for i in range(frames):
+            save_pose(os.path.join(tmp, f"{i:06d}"), pose)
+            save_pose_txt(args, f"{i:06d}", pose)
+        return (time.perf_counter() - t_start) / frames
+
+
+def bench_kitti_eval(frames):
+    """KittiEvalOdom sequence errors, ATE and RPE, per frame of the trajectory"""
+    poses_gt = random_trajectory(frames, seed=0)
+    poses_result = random_trajectory(frames, seed=0, noise=0.05)
+    eval_tool = KittiEvalOdom()
+    t_start = time.perf_counter()
+    eval_tool.calc_sequence_errors(poses_gt, poses_result)
+    eval_tool.compute_ATE(poses_gt, poses_result)
+    eval_tool.compute_RPE(poses_gt, poses_result)
+    return (time.perf_counter() - t_start) / frames
+
+
+# name: (function, frames of a repeat)
+BENCHMARKS = {
+    "process_image_mono": (bench_process, 500),
+    "get_pose_to_target": (bench_get_pose, 500),
+    "get_depth": (bench_get_depth, 200),
+    "get_sparse_depth": (bench_get_sparse_depth, 200),
+    "get_point_cloud_colored": (bench_get_point_cloud_colored, 100),
+    "run_loop": (bench_run_loop, 100),
+    "save_depth": (bench_save_depth, 50),
+    "save_sparse_depth": (bench_save_sparse_depth, 200),
+    "save_pose": (bench_save_pose, 500),
+    "kitti_eval": (bench_kitti_eval, 2000),
+}
+
+
+def run_benchmarks(names, repeats, scale=1.0):
+    """Run the benchmarks
+
+    Args:
+        names (list): the names of the benchmarks to run
+        repeats (int): the number of repeats of each benchmark
+        scale (float): scale factor of the number of frames of each repeat. Defaults to 1.0
+
+    Returns:
+        a dict that maps each name to a dict with the seconds per operation of each
+        repeat ("samples"), their median and their median absolute deviation ("mad")
+    """
+    results = {}
+    for name in names:
+        function, frames = BENCHMARKS[name]
+        frames = max(int(frames * scale), 1)
+        samples = [function(frames) for _ in range(repeats)]
+        median = float(np.median(samples))
+        results[name] = {
+            "frames": frames,
+            "samples": samples,
+            "median": median,
+            "mad": float(np.median(np.abs(np.asarray(samples) - median))),
+        }
+        print(
+            "{:>24}: {:10.1f}us/op (+- {:.1f})".format(
+                name, median * 1e6, results[name]["mad"] * 1e6
+            )
+        )
+    return results
+
+
+def compare(baseline, current, threshold=0.1, noise=3.0):
+    """Compare two benchmark results
+
+    A benchmark is a regression (or an improvement) when the median changes more
+    than threshold and more than noise times the sum of the two mad.
+
+    Args:
+        baseline (dict): the results of the baseline
+        current (dict): the new results
+        threshold (float): the min relative change. Defaults to 0.1
+        noise (float): the min change in units of mad. Defaults to 3.0
+
+    Returns:
+        a dict that maps each benchmark in both the results to (ratio, verdict),
+        where verdict is "regression", "improvement" or "same"
+    """
+    report = {}
+    for name in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[name], current[name]
+        change = new["median"] - old["median"]
+        ratio = new["median"] / old["median"]
+        significant = abs(change) > noise * (old["mad"] + new["mad"])
+        if significant and ratio > 1 + threshold:
+            verdict = "regression"
+        elif significant and ratio < 1 - threshold:
+            verdict = "improvement"
+        else:
+            verdict = "same"
+        report[name] = (ratio, verdict)
+    return report
+
+
+def main(args):
+    if args.command == "run":
+        names = args.only if args.only else list(BENCHMARKS)
+        results = run_benchmarks(names, args.repeats, args.scale)
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "machine": platform.machine(),
+                        "node": platform.node(),
+                        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"results saved in {args.output}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        with open(args.current) as f:
+            current = json.load(f)["results"]
+        report = compare(baseline, current, args.threshold, args.noise)
+        for name, (ratio, verdict) in report.items():
+            print("{:>24}: {:6.2f}x {}".format(name, ratio, verdict))
+        if any(verdict == "regression" for _, verdict in report.values()):
+            sys.exit(1)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the wrapper on MockSlam and compare the results with a baseline"
+)
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+run_command = subparsers.add_parser("run", help="run the benchmarks")
+run_command.add_argument(
+    "--output", type=str, default="bench.json", help="where do we save the results?"
+)
+run_command.add_argument(
+    "--only",
+    type=str,
+    nargs="+",
+    choices=list(BENCHMARKS),
+    help="run only these benchmarks",
+)
+run_command.add_argument(
+    "--repeats", type=int, default=5, help="number of repeats of each benchmark"
+)
+run_command.add_argument(
+    "--scale",
+    type=float,
+    default=1.0,
+    help="scale factor of the number of frames of each repeat",
+)
+
+compare_command = subparsers.add_parser("compare", help="compare two results")
+compare_command.add_argument("baseline", type=str, help="the baseline json file")
+compare_command.add_argument("current", type=str, help="the new json file")
+compare_command.add_argument(
+    "--threshold",
+    type=float,
+    default=0.1,
+    help="min relative change of the median to report",
+)
+compare_command.add_argument(
+    "--noise",
+    type=float,
+    default=3.0,
+    help="min change of the median, in units of median absolute deviation",
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    main(args)
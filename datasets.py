@@ -0,0 +1,467 @@
+import copy
+import functools
+import os
+from collections import namedtuple
+from collections.abc import Sequence
+from datetime import datetime
+import numpy as np
+from utils import load_image
+
+# the registered dataset types, name: Dataset subclass
+DATASETS = {}
+
+
+def register_dataset(name):
+    """Register a Dataset subclass with a name, to open it with open_dataset
+
+    Examples:
+        >>> @register_dataset("MY_FORMAT")
+        ... class MyDataset(Dataset):
+        ...     ...
+    """
+
+    def decorator(cls):
+        DATASETS[name] = cls
+        return cls
+
+    return decorator
+
+
+def open_dataset(data_type, path, **kwargs):
+    """Open a dataset of a registered type
+
+    Args:
+        data_type (str): the registered name of the type (e.g. KITTI_VO)
+        path (str): the path to the sequence
+        **kwargs: the other arguments of the Dataset subclass
+
+    Returns:
+        the Dataset
+    """
+    if data_type not in DATASETS:
+        raise ValueError(
+            f"unknown dataset type {data_type}, expected one of {sorted(DATASETS)}"
+        )
+    return DATASETS[data_type](path, **kwargs)
+
+
+class Frame(namedtuple("Frame", ["timestamp", "reference"])):
+    """A frame of a dataset: its timestamp in seconds and the reference (e.g. the filename) passed to the loader"""
+
+    __slots__ = ()
+
+
+class TextIndex:
+    """This class gives random access to the lines of a text file, through a memory map.
+
+    Only the start and the end of each line are kept in memory (16 bytes per line),
+    the lines are decoded when they are read. The empty lines are skipped and, if
+    comment is set, the lines that start with it too.
+    """
+
+    def __init__(self, path, comment="#"):
+        """Index the lines of a file
+
+        Args:
+            path (str): the path to the text file
+            comment (str): the lines that start with this character are skipped, None to keep them. Defaults to "#"
+        """
+        self.path = path
+        self.comment = comment
+        data = self._map()
+        newlines = np.flatnonzero(data == ord("\n"))
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [len(data)]))
+        keep = ends > starts
+        if comment is not None:
+            keep[keep] = data[starts[keep]] != ord(comment)
+        self.starts = starts[keep]
+        self.ends = ends[keep]
+
+    def _map(self):
+        if os.path.getsize(self.path) == 0:
+            self._data = np.empty(0, dtype=np.uint8)
+        else:
+            self._data = np.memmap(self.path, dtype=np.uint8, mode="r")
+        return self._data
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        """Get a line, w/o the line terminator"""
+        return (
+            self._data[self.starts[index] : self.ends[index]]
+            .tobytes()
+            .decode()
+            .rstrip()
+        )
+
+    def __getstate__(self):
+        # the memory map is opened again by the process that unpickles the index
+        state = self.__dict__.copy()
+        del state["_data"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._map()
+
+
+class Dataset:
+    """This class is the base of the lazy datasets: a sequence of frames with their timestamps.
+
+    The frames are not listed in advance, each one is built from the index of its
+    dataset when it is accessed, so opening a dataset costs only the indexing of its
+    files and the memory does not grow with the frames. A dataset supports len,
+    random access (dataset[i] is a Frame) and slicing (dataset[start:stop:stride]
+    is a lazy view of the same dataset).
+
+    The images are decoded by `loader`, from the frame reference, and the
+    prefetchers can be plugged in on `references`, as in the usage example.
+
+    A new format is a subclass that implements _num_frames, _timestamp and
+    _reference, registered with register_dataset. If its frames can be decoded
+    only in order (sequential is true, e.g. a video) it is streamed by its own
+    prefetcher, as VideoDataset.
+
+    Usage example:
+        dataset = open_dataset("KITTI_VO", "/media/Datasets/KITTI_VO/dataset/sequences/10")
+        prefetcher = ImagePrefetcher(dataset.references, loader=dataset.loader)
+        for frame, image in dataset.stream(prefetcher):
+            app.process_image_mono(image, frame.timestamp)
+    """
+
+    # true if the frames can be decoded only in order
+    sequential = False
+
+    def __init__(self, path, loader=None, gray=False, reduction=1):
+        """Open the dataset
+
+        Args:
+            path (str): the path to the sequence
+            loader (callable): the function that decodes a frame from its reference, None for utils.load_image. Defaults to None
+            gray (bool): if true, the default loader decodes the images in grayscale. Defaults to False
+            reduction (int): the default loader decodes the images at 1/reduction of their resolution. Defaults to 1
+        """
+        self.path = path
+        self.gray = gray
+        self.reduction = reduction
+        if loader is None:
+            loader = load_image
+            if gray or reduction != 1:
+                loader = functools.partial(load_image, gray=gray, reduction=reduction)
+        self.loader = loader
+        self._range = range(self._num_frames())
+
+    def _num_frames(self):
+        """Get the number of frames of the whole dataset"""
+        raise NotImplementedError
+
+    def _timestamp(self, index):
+        """Get the timestamp of frame index of the whole dataset"""
+        raise NotImplementedError
+
+    def _reference(self, index):
+        """Get the reference of frame index of the whole dataset"""
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self._range)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            view = copy.copy(self)
+            view._range = self._range[index]
+            return view
+        index = self._range[index]
+        return Frame(self._timestamp(index), self._reference(index))
+
+    def __iter__(self):
+        for index in self._range:
+            yield Frame(self._timestamp(index), self._reference(index))
+
+    def frame_index(self, index):
+        """Get the index in the whole dataset of the frame index of this (sliced) dataset"""
+        return self._range[index]
+
+    @property
+    def references(self):
+        """The lazy sequence of the frame references, to pass to a prefetcher"""
+        return _References(self)
+
+    @property
+    def timestamps(self):
+        """The timestamps of all the frames, as an ndarray"""
+        return np.array([self._timestamp(index) for index in self._range])
+
+    def load(self, index):
+        """Decode the frame index with the loader"""
+        return self.loader(self._reference(self._range[index]))
+
+    def stream(self, prefetcher):
+        """Iterate over the frames and their images
+
+        Args:
+            prefetcher: an iterable over the decoded images of `references`, in order
+
+        Returns:
+            an iterator over (Frame, image)
+        """
+        return zip(self, prefetcher)
+
+
+class _References(Sequence):
+    """The frame references of a dataset, read on demand"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _References(self.dataset[index])
+        return self.dataset._reference(self.dataset.frame_index(index))
+
+
+@register_dataset("KITTI_VO")
+class KittiVODataset(Dataset):
+    """KITTI odometry sequence: path/data/xxxxxx.png and path/times.txt, with a timestamp for each line"""
+
+    def __init__(self, path, **kwargs):
+        self.times = TextIndex(os.path.join(path, "times.txt"), comment=None)
+        super().__init__(path, **kwargs)
+
+    def _num_frames(self):
+        return len(self.times)
+
+    def _timestamp(self, index):
+        return float(self.times[index])
+
+    def _reference(self, index):
+        return os.path.join(self.path, "data", str(index).zfill(6) + ".png")
+
+
+@register_dataset("KITTI")
+class KittiDataset(Dataset):
+    """KITTI raw sequence: path/data/xxxxxxxxxx.png and path/timestamps.txt, with a date for each line
+
+    The timestamps are the seconds from the first frame.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.times = TextIndex(os.path.join(path, "timestamps.txt"), comment=None)
+        super().__init__(path, **kwargs)
+        self.t0 = self._date(0) if len(self.times) > 0 else None
+
+    def _date(self, index):
+        # the dates have the nanoseconds, strptime accepts up to the microseconds
+        return datetime.strptime(self.times[index][:-3], "%Y-%m-%d %H:%M:%S.%f")
+
+    def _num_frames(self):
+        return len(self.times)
+
+    def _timestamp(self, index):
+        difference = self._date(index) - self.t0
+        return difference.seconds + difference.microseconds / 1000000
+
+    def _reference(self, index):
+        return os.path.join(self.path, "data", str(index).zfill(10) + ".png")
+
+
+@register_dataset("TUM")
+class TumDataset(Dataset):
+    """TUM RGB-D sequence: path/rgb.txt, with the timestamp and the image filename for each line"""
+
+    def __init__(self, path, file_name="rgb.txt", **kwargs):
+        self.lines = TextIndex(os.path.join(path, file_name))
+        super().__init__(path, **kwargs)
+
+    def _num_frames(self):
+        return len(self.lines)
+
+    def _timestamp(self, index):
+        return float(self.lines[index].split(" ")[0])
+
+    def _reference(self, index):
+        return os.path.join(self.path, self.lines[index].split(" ")[1])
+
+
+@register_dataset("OTHERS")
+class OthersDataset(Dataset):
+    """Generic sequence: the png files of path/data, in name order, and path/times.txt with a timestamp for each line
+
+    The filenames are listed when the dataset is opened.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.times = TextIndex(os.path.join(path, "times.txt"))
+        self.framenames = sorted(
+            name
+            for name in os.listdir(os.path.join(path, "data"))
+            if name.endswith(".png")
+        )
+        super().__init__(path, **kwargs)
+
+    def _num_frames(self):
+        return len(self.framenames)
+
+    def _timestamp(self, index):
+        return float(self.times[index])
+
+    def _reference(self, index):
+        return os.path.join(self.path, "data", self.framenames[index])
+
+
+@register_dataset("TUM_VI")
+class TumVIDataset(Dataset):
+    """TUM visual-inertial sequence: path/mav0/cam0/data/xxxx.png and path/mav0/cam0/times.txt"""
+
+    def __init__(self, path, **kwargs):
+        self.lines = TextIndex(os.path.join(path, "mav0/cam0/times.txt"))
+        super().__init__(path, **kwargs)
+
+    def _num_frames(self):
+        return len(self.lines)
+
+    def _timestamp(self, index):
+        return float(self.lines[index].split()[1])
+
+    def _reference(self, index):
+        return os.path.join(
+            self.path, "mav0/cam0/data", self.lines[index].split()[0] + ".png"
+        )
+
+
+@register_dataset("EUROC")
+class EuRoCDataset(Dataset):
+    """EuRoC sequence: path/mav0/cam0/data/xxxx.png and path/mav0/cam0/data.csv, with the timestamps in nanoseconds"""
+
+    def __init__(self, path, **kwargs):
+        self.lines = TextIndex(os.path.join(path, "mav0/cam0/data.csv"))
+        super().__init__(path, **kwargs)
+
+    def _num_frames(self):
+        return len(self.lines)
+
+    def _timestamp(self, index):
+        return float(self.lines[index].split(",")[0]) * 1e-9
+
+    def _reference(self, index):
+        return os.path.join(
+            self.path, "mav0/cam0/data", self.lines[index].split(",")[1].strip()
+        )
+
+
+@register_dataset("VIDEO")
+class VideoDataset(Dataset):
+    """Video file (e.g. MP4 or MKV) read with cv2.VideoCapture, the path is the video file
+
+    The frame references are the frame numbers as 6 digits strings. The timestamps
+    are read from a sidecar times.txt, a timestamp for each line, if it exists next
+    to the video (or it is given as times_file), otherwise they are the presentation
+    timestamps of the container. These are known only when a frame is decoded, so
+    `timestamps` and `dataset[i]` give the nominal time (frame number / fps) and
+    `stream` gives the real ones.
+
+    The frames are decoded in order by prefetch.VideoPrefetcher, `load` seeks the
+    video for each frame and it is meant only for random accesses.
+    """
+
+    sequential = True
+
+    def __init__(self, path, loader=None, times_file=None, **kwargs):
+        """Open the video
+
+        Args:
+            path (str): the path to the video file
+            loader (callable): the function that decodes a frame from its reference. Defaults to load_frame
+            times_file (str): the file with the timestamps, None to use times.txt next to the video if it exists. Defaults to None
+            kwargs: gray and reduction of Dataset, applied by convert_frame
+        """
+        import cv2
+
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f"failed to open video {path}")
+        self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = capture.get(cv2.CAP_PROP_FPS)
+        capture.release()
+
+        if times_file is None:
+            times_file = os.path.join(os.path.dirname(path), "times.txt")
+            if not os.path.exists(times_file):
+                times_file = None
+        self.times = None if times_file is None else TextIndex(times_file)
+        super().__init__(path, self.load_frame if loader is None else loader, **kwargs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and index.step is not None and index.step < 0:
+            raise ValueError(
+                "the frames of a video are decoded in order, a slice cannot reverse them"
+            )
+        return super().__getitem__(index)
+
+    def _num_frames(self):
+        if self.times is not None:
+            return min(self.frame_count, len(self.times))
+        return self.frame_count
+
+    def _timestamp(self, index):
+        if self.times is not None:
+            return float(self.times[index])
+        return index / self.fps if self.fps > 0 else 0.0
+
+    def _reference(self, index):
+        return str(index).zfill(6)
+
+    def load_frame(self, reference):
+        """Decode a frame, from its reference, as an RGB ndarray
+
+        Raises:
+            ValueError: if the frame cannot be decoded
+        """
+        import cv2
+
+        capture = cv2.VideoCapture(self.path)
+        try:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(reference))
+            ok, image = capture.read()
+        finally:
+            capture.release()
+        if not ok:
+            raise ValueError(f"failed to decode frame {reference} of {self.path}")
+        return self.convert_frame(image)
+
+    def convert_frame(self, image):
+        """Convert a BGR frame of the video to the format of the dataset
+
+        The video is decoded at its full resolution, so the reduction is a resize.
+
+        Returns:
+            the RGB frame, or the grayscale one if gray is set, at 1/reduction of the resolution
+        """
+        import cv2
+
+        if self.reduction != 1:
+            height, width = image.shape[:2]
+            image = cv2.resize(
+                image,
+                (width // self.reduction, height // self.reduction),
+                interpolation=cv2.INTER_AREA,
+            )
+        if self.gray:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    def stream(self, prefetcher):
+        """Iterate over the frames and their images, decoded in order by a prefetch.VideoPrefetcher
+
+        Returns:
+            an iterator over (Frame, image), with the presentation timestamps if there is no times file
+        """
+        for index, (pts, image) in zip(self._range, prefetcher):
+            timestamp = self._timestamp(index) if self.times is not None else pts
+            yield Frame(timestamp, self._reference(index)), image
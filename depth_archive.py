@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+
+DEPTH_ARCHIVE_EXT = ".dar"
+MAGIC = b"SLAMPYDA"
+VERSION = 1
+# magic, version, offset of the index
+FOOTER = struct.Struct("<8sIQ")
+
+
+class DepthArchiveWriter:
+    """This class writes a sequence of depth maps in a single depth archive file.
+
+    The depths are stored as 16 bit integers (depth * scale, as in the KITTI png files)
+    in chunks of chunk_size frames, each chunk optionally compressed with zlib. The
+    index with the position of the chunks and the frame names is written by close.
+
+    Usage example:
+        with DepthArchiveWriter("depth.dar") as archive:
+            archive.append(depth, "000000")
+    """
+
+    def __init__(self, filename, scale=256.0, chunk_size=64, compress=False):
+        """Build the writer
+
+        Args:
+            filename (str): path to the archive file
+            scale (float): the depth is stored as depth * scale. Defaults to 256.0
+            chunk_size (int): the number of frames stored in each chunk. Defaults to 64
+            compress (bool): if true, compress each chunk with zlib. Defaults to False
+        """
+        self.filename = filename
+        self.scale = scale
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.shape = None
+        self.names = []
+        self.chunks = []  # [offset, nbytes, nframes]
+        self._pending = []
+        self._file = open(filename, "wb")
+
+    def append(self, depth, name=None):
+        """Add a depth map to the archive
+
+        Args:
+            depth: ndarray HxW with the depth, the values <= 0 are stored as 0 (invalid)
+            name (str): the name of the frame, used to find it when reading. Defaults to the frame index
+        """
+        depth = np.clip(np.nan_to_num(np.asarray(depth) * self.scale), 0, 65535)
+        self.append_raw(depth.astype(np.uint16), name)
+
+    def append_raw(self, depth_raw, name=None):
+        """Add a depth map already converted to 16 bit integers
+
+        Args:
+            depth_raw: ndarray HxW of uint16 (e.g. the content of a 16 bit png file)
+            name (str): the name of the frame. Defaults to the frame index
+
+        Raises:
+            ValueError: if the shape is different from the one of the first frame
+        """
+        if self.shape is None:
+            self.shape = depth_raw.shape
+        elif depth_raw.shape != self.shape:
+            raise ValueError(
+                f"depth shape {depth_raw.shape} differs from archive shape {self.shape}"
+            )
+        self.names.append(str(len(self.names)) if name is None else str(name))
+        self._pending.append(np.ascontiguousarray(depth_raw, dtype=np.uint16))
+        if len(self._pending) == self.chunk_size:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        data = np.stack(self._pending).tobytes()
+        if self.compress:
+            data = zlib.compress(data)
+        self.chunks.append([self._file.tell(), len(data), len(self._pending)])
+        self._file.write(data)
+        self._pending = []
+
+    def close(self):
+        """Write the remaining frames and the index, and close the file"""
+        if self._file.closed:
+            return
+        if self._pending:
+            self._write_chunk()
+        index = {
+            "shape": list(self.shape) if self.shape is not None else [0, 0],
+            "scale": self.scale,
+            "compress": self.compress,
+            "chunks": self.chunks,
+            "names": self.names,
+        }
+        index_offset = self._file.tell()
+        self._file.write(json.dumps(index).encode())
+        self._file.write(FOOTER.pack(MAGIC, VERSION, index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DepthArchiveReader:
+    """This class reads the depth maps of a depth archive with random access.
+
+    The uncompressed archives are memory mapped, so reading a frame or a slice of
+    frames does not copy nor decode anything. The compressed chunks are decompressed
+    on demand and the last one is kept in memory.
+
+    Usage example:
+        archive = DepthArchiveReader("depth.dar")
+        depth = archive.get_depth(archive.index_of("000010"))
+        depths_raw = archive[10:20]
+    """
+
+    def __init__(self, filename):
+        """Open the archive
+
+        Args:
+            filename (str): path to the archive file
+
+        Raises:
+            ValueError: if the file is not a depth archive
+        """
+        self.filename = filename
+        self._data = np.memmap(filename, dtype=np.uint8, mode="r")
+        magic, version, index_offset = FOOTER.unpack(
+            self._data[-FOOTER.size :].tobytes()
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} is not a depth archive")
+        index = json.loads(self._data[index_offset : -FOOTER.size].tobytes())
+        self.shape = tuple(index["shape"])
+        self.scale = index["scale"]
+        self.compress = index["compress"]
+        self.chunks = index["chunks"]
+        self.names = index["names"]
+        self._name_to_index = {name: i for i, name in enumerate(self.names)}
+        self._chunk_starts = np.cumsum([0] + [c[2] for c in self.chunks])
+        self._cached_chunk = (None, None)
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, name):
+        """Get the index of a frame from its name
+
+        Raises:
+            KeyError: if there is not a frame with this name
+        """
+        return self._name_to_index[str(name)]
+
+    def __contains__(self, name):
+        return str(name) in self._name_to_index
+
+    def _chunk(self, chunk_id):
+        """Get the frames of a chunk as ndarray NxHxW of uint16"""
+        offset, nbytes, nframes = self.chunks[chunk_id]
+        if not self.compress:
+            return (
+                self._data[offset : offset + nbytes]
+                .view(np.uint16)
+                .reshape((nframes,) + self.shape)
+            )
+        if self._cached_chunk[0] != chunk_id:
+            data = zlib.decompress(self._data[offset : offset + nbytes].tobytes())
+            frames = np.frombuffer(data, dtype=np.uint16).reshape(
+                (nframes,) + self.shape
+            )
+            self._cached_chunk = (chunk_id, frames)
+        return self._cached_chunk[1]
+
+    def __getitem__(self, item):
+        """Get the 16 bit depth of a frame (HxW) or of a slice of frames (NxHxW)"""
+        if isinstance(item, slice):
+            indices = range(*item.indices(len(self)))
+            if len(indices) == 0:
+                return np.empty((0,) + self.shape, dtype=np.uint16)
+            first_chunk = np.searchsorted(self._chunk_starts, indices[0], "right") - 1
+            last_chunk = np.searchsorted(self._chunk_starts, indices[-1], "right") - 1
+            if first_chunk == last_chunk and indices.step > 0:
+                start = self._chunk_starts[first_chunk]
+                return self._chunk(first_chunk)[
+                    indices.start - start : indices.stop - start : indices.step
+                ]
+            return np.stack([self[i] for i in indices])
+        if item < 0:
+            item += len(self)
+        if item < 0 or item >= len(self):
+            raise IndexError(f"frame {item} out of range")
+        chunk_id = np.searchsorted(self._chunk_starts, item, "right") - 1
+        return self._chunk(chunk_id)[item - self._chunk_starts[chunk_id]]
+
+    def get_depth(self, item):
+        """Get the depth of a frame (or of a slice of frames) as float, the invalid values are 0"""
+        return self[item] / self.scale
+
+
+def pack_png_dir(src_dir, filename, scale=256.0, chunk_size=64, compress=False):
+    """Pack all the 16 bit png depth files of a directory in a depth archive
+
+    Args:
+        src_dir (str): directory with the png files, the frame names are the filenames w/o extension
+        filename (str): path to the new archive
+        scale (float): the scale used in the png files. Defaults to 256.0
+        chunk_size (int): the number of frames stored in each chunk. Defaults to 64
+        compress (bool): if true, compress each chunk with zlib. Defaults to False
+    """
+    import cv2
+
+    with DepthArchiveWriter(filename, scale, chunk_size, compress) as archive:
+        for png_name in sorted(os.listdir(src_dir)):
+            if png_name.endswith(".png"):
+                depth_raw = cv2.imread(os.path.join(src_dir, png_name), -1)
+                if depth_raw is None:
+                    raise ValueError(f"failed to load depth {png_name}")
+                archive.append_raw(depth_raw, os.path.splitext(png_name)[0])
+
+
+parser = argparse.ArgumentParser(
+    description="Pack a directory of 16 bit png depth files in a single depth archive"
+)
+parser.add_argument("src_dir", type=str, help="directory with the png files")
+parser.add_argument(
+    "dest", type=str, help=f"path to the new archive ({DEPTH_ARCHIVE_EXT} file)"
+)
+parser.add_argument(
+    "--scale", type=float, default=256.0, help="scale used in the png files"
+)
+parser.add_argument(
+    "--chunk_size", type=int, default=64, help="number of frames in each chunk"
+)
+parser.add_argument(
+    "--compress",
+    default=False,
+    action="store_true",
+    help="If set, compress each chunk with zlib",
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    pack_png_dir(args.src_dir, args.dest, args.scale, args.chunk_size, args.compress)
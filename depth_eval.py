@@ -0,0 +1,224 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from glob import glob
+import numpy as np
+from depth_archive import DEPTH_ARCHIVE_EXT, DepthArchiveReader, DepthArchiveWriter
+from utils import compute_depth_errors, load_sparse_depth, save_depth_err_results
+
+# the value written by save_depth for the invalid depth
+INVALID_PNG_DEPTH = 0
+
+
+def _gt_cache_path(gt_dir, png_names):
+    """Get the path of the depth archive cache of a gt directory, keyed on its png files"""
+    last_mtime = max(
+        os.stat(os.path.join(gt_dir, name)).st_mtime_ns for name in png_names
+    )
+    return os.path.join(
+        gt_dir, ".depth.{}.{}{}".format(len(png_names), last_mtime, DEPTH_ARCHIVE_EXT)
+    )
+
+
+def build_gt_cache(gt_dir, workers=None):
+    """Decode the 16 bit png gt depths of a directory in a depth archive, next to them
+
+    The archive is not compressed, so it is read as a memory map, and it is
+    reused until a png file is added, removed or changed. If the directory is
+    read-only the archive is not saved.
+
+    Args:
+        gt_dir (str): directory with the png files, the frame names are the filenames w/o extension
+        workers (int): the number of decoding threads, None for the default of ThreadPoolExecutor. Defaults to None
+
+    Returns:
+        the path to the archive, None if it can not be saved
+    """
+    import cv2
+
+    png_names = sorted(name for name in os.listdir(gt_dir) if name.endswith(".png"))
+    if len(png_names) == 0:
+        raise ValueError(f"no png depth in {gt_dir}")
+    cache_path = _gt_cache_path(gt_dir, png_names)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    def decode(png_name):
+        depth_raw = cv2.imread(os.path.join(gt_dir, png_name), -1)
+        if depth_raw is None:
+            raise ValueError(f"failed to load depth {png_name}")
+        return depth_raw
+
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        with DepthArchiveWriter(tmp_path) as archive, ThreadPoolExecutor(
+            workers
+        ) as executor:
+            for png_name, depth_raw in zip(png_names, executor.map(decode, png_names)):
+                archive.append_raw(depth_raw, os.path.splitext(png_name)[0])
+        os.replace(tmp_path, cache_path)
+        for old_cache in glob(os.path.join(gt_dir, ".depth.*" + DEPTH_ARCHIVE_EXT)):
+            if old_cache != cache_path:
+                os.remove(old_cache)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return cache_path
+
+
+def list_predictions(pred_dir):
+    """Get the format and the frame names of the depths saved by run.py
+
+    Args:
+        pred_dir (str): the dest directory of run.py
+
+    Returns:
+        format ("archive", "sparse" or "png") and the sorted list of frame names
+    """
+    archive_path = os.path.join(pred_dir, "depth" + DEPTH_ARCHIVE_EXT)
+    if os.path.exists(archive_path):
+        return "archive", list(DepthArchiveReader(archive_path).names)
+    depth_dir = os.path.join(pred_dir, "depth")
+    names = sorted(os.listdir(depth_dir))
+    if any(name.endswith(".npz") for name in names):
+        return "sparse", [name[:-4] for name in names if name.endswith(".npz")]
+    return "png", [name[:-4] for name in names if name.endswith(".png")]
+
+
+def _open_gt(gt_depth):
+    """Get a function that returns the 16 bit gt depth of a frame name, None if it is not found"""
+    if gt_depth.endswith(DEPTH_ARCHIVE_EXT):
+        archive = DepthArchiveReader(gt_depth)
+        return lambda name: archive[archive.index_of(name)] if name in archive else None
+
+    import cv2
+
+    return lambda name: cv2.imread(os.path.join(gt_depth, name + ".png"), -1)
+
+
+def _open_predictions(pred_dir, pred_format):
+    """Get a function that returns the predicted depth of a frame name"""
+    if pred_format == "archive":
+        archive = DepthArchiveReader(
+            os.path.join(pred_dir, "depth" + DEPTH_ARCHIVE_EXT)
+        )
+        return lambda name: archive.get_depth(archive.index_of(name))
+    depth_dir = os.path.join(pred_dir, "depth")
+    if pred_format == "sparse":
+        return lambda name: load_sparse_depth(os.path.join(depth_dir, name + ".npz"))
+
+    import cv2
+
+    def load_png(name):
+        depth_raw = cv2.imread(os.path.join(depth_dir, name + ".png"), -1)
+        depth = depth_raw / 256
+        depth[depth_raw == INVALID_PNG_DEPTH] = -1
+        return depth
+
+    return load_png
+
+
+def _eval_frames(job):
+    """Compute the errors of a chunk of frames in a worker process"""
+    pred_dir, pred_format, gt_depth, data_type, names = job
+    load_prediction = _open_predictions(pred_dir, pred_format)
+    load_gt = _open_gt(gt_depth)
+    errors = []
+    for name in names:
+        gt_raw = load_gt(name)
+        if gt_raw is None:
+            print("gt path err {}".format(name))
+            continue
+        err = compute_depth_errors(load_prediction(name), gt_raw, data_type)
+        if err is not None:
+            errors.append((name, err))
+    return errors
+
+
+def eval_depth(pred_dir, gt_depth, data_type, workers=None, use_cache=True):
+    """Evaluate the depths saved by run.py against the gt, with a pool of processes
+
+    Args:
+        pred_dir (str): the dest directory of run.py
+        gt_depth (str): the gt depths, as directory of 16 bit png files or as depth archive
+        data_type (str): the dataset type, KITTI_VO or TUM
+        workers (int): the number of worker processes, None for one per CPU. Defaults to None
+        use_cache (bool): if true, decode the png gt in a depth archive reused by the next evaluations. Defaults to True
+
+    Returns:
+        a list with (frame name, error) of each frame with gt, in frame order
+    """
+    pred_format, names = list_predictions(pred_dir)
+    if use_cache and not gt_depth.endswith(DEPTH_ARCHIVE_EXT):
+        gt_depth = build_gt_cache(gt_depth) or gt_depth
+
+    workers = workers or os.cpu_count()
+    chunk_size = max(len(names) // (workers * 4), 1)
+    jobs = [
+        (pred_dir, pred_format, gt_depth, data_type, names[i : i + chunk_size])
+        for i in range(0, len(names), chunk_size)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [error for chunk in executor.map(_eval_frames, jobs) for error in chunk]
+
+
+def main(args):
+    errors = eval_depth(
+        args.dest, args.gt_depth, args.data_type, args.workers, not args.no_cache
+    )
+    if len(errors) == 0:
+        print("no depth to evaluate")
+        return
+
+    save_results = os.path.join(args.dest, "depth_results.txt")
+    if os.path.exists(save_results):
+        os.remove(save_results)
+    for name, err in errors:
+        save_depth_err_results(save_results, name, err, verbose=False)
+    mean_errors = np.array([err for _, err in errors]).mean(0)
+    save_depth_err_results(save_results, "mean values", mean_errors)
+    print("{} frames, results saved in {}".format(len(errors), save_results))
+
+
+parser = argparse.ArgumentParser(
+    description="Evaluate offline, with a pool of processes, the depths saved by run.py"
+)
+
+parser.add_argument(
+    "--dest",
+    type=str,
+    default="./results_kitty_vo_10",
+    help="the dest directory of run.py, with the depths to evaluate",
+)
+parser.add_argument(
+    "--gt_depth",
+    type=str,
+    default="/media/Datasets/KITTI_VO_SGM/10/depth",
+    help="the gt depth files of the dataset, as a directory of png files or a depth archive file",
+)
+parser.add_argument(
+    "--data_type",
+    type=str,
+    help="which dataset type",
+    default="KITTI_VO",
+    choices=["TUM", "KITTI_VO"],
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="number of worker processes, one per CPU if not set",
+)
+parser.add_argument(
+    "--no_cache",
+    default=False,
+    action="store_true",
+    help="If set, do not decode the png gt depths in a depth archive cache",
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    main(args)
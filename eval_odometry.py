@@ -0,0 +1,95 @@
+import argparse
+import os
+import numpy as np
+from kitti_odometry import eval_sequences
+
+
+def main(args):
+    sequences = [
+        (
+            name,
+            os.path.join(args.gt_dir, name + ".txt"),
+            os.path.join(args.results_dir, name, "pose.txt"),
+        )
+        for name in args.sequences
+    ]
+    if not os.path.exists(args.dest):
+        os.makedirs(args.dest)
+
+    results, summary = eval_sequences(
+        sequences, args.dest, args.align, args.workers, args.plot
+    )
+
+    print("-------------------- Summary ------------------------------")
+    for result in results:
+        print(
+            "{}: t_err {:.2f} r_err {:.2f} ATE {:.2f}".format(
+                result["name"],
+                result["t_err"] * 100,
+                result["r_err"] / np.pi * 180 * 100,
+                result["ate"],
+            )
+        )
+    print(
+        "KITTI benchmark: t_err {:.2f} r_err {:.2f}".format(
+            summary["kitti_t_err"] * 100,
+            summary["kitti_r_err"] / np.pi * 180 * 100,
+        )
+    )
+    print("summary saved in {}".format(os.path.join(args.dest, "summary.txt")))
+
+
+parser = argparse.ArgumentParser(
+    description="Evaluate the poses of many sequences in parallel and write a single summary"
+)
+
+parser.add_argument(
+    "--gt_dir",
+    type=str,
+    default="/media/Datasets/KITTI_VO/dataset/poses",
+    help="directory with the gt pose files, saved as <sequence>.txt",
+)
+parser.add_argument(
+    "--results_dir",
+    type=str,
+    default="./results_kitty_vo",
+    help="directory with the results of run.py, saved as <sequence>/pose.txt",
+)
+parser.add_argument(
+    "--sequences",
+    type=str,
+    nargs="+",
+    default=["{:02d}".format(i) for i in range(11)],
+    help="the names of the sequences to evaluate",
+)
+parser.add_argument(
+    "--dest",
+    type=str,
+    default="./results_kitty_vo/eval",
+    help="where do we save the evaluation?",
+)
+parser.add_argument(
+    "--align",
+    type=str,
+    choices=["scale", "scale_7dof", "7dof", "6dof"],
+    default="7dof",
+    help="alignment type",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="number of worker processes, one per CPU if not set",
+)
+parser.add_argument(
+    "--plot",
+    default=False,
+    action="store_true",
+    help="If set, plot the trajectory and the errors of each sequence",
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    main(args)
@@ -1,10 +1,70 @@
 # Copyright (C) Huangying Zhan 2019. All rights reserved.
 # https://github.com/Huangying-Zhan/kitti-odom-eval
 import copy
-from matplotlib import pyplot as plt
 import numpy as np
 import os
 from glob import glob
+from sidecar_cache import load_cached
+
+
+def cumulative_distances(translations):
+    """Compute distance for each position w.r.t the first one, along the path
+    Args:
+        translations (Nx3 array): positions of the trajectory
+    Returns:
+        dist (N array): distance of each position w.r.t the first one
+    """
+    if len(translations) == 0:
+        return np.zeros(0)
+    delta = translations[:-1] - translations[1:]
+    steps = np.square(delta[:, 0]) + np.square(delta[:, 1]) + np.square(delta[:, 2])
+    return np.cumsum(np.concatenate(([0.0], np.sqrt(steps))))
+
+
+def load_pose_array(file_name, use_cache=True):
+    """Load poses from txt (KITTI format) as arrays
+    Each line in the file should follow one of the following structures
+        (1) idx pose(3x4 matrix in terms of 12 numbers)
+        (2) pose(3x4 matrix in terms of 12 numbers)
+
+    The parsed poses are saved in a binary sidecar next to the txt file
+    (.<file name>.<size>.<mtime>.npy), so the next loads of the same file
+    are a memory map of the sidecar.
+
+    Args:
+        file_name (str): txt file path
+        use_cache (bool): if true, read and write the binary sidecar. Defaults to True
+    Returns:
+        frame_idx (N array): the index of each pose
+        poses (Nx4x4 array): the poses
+        dist (N array): the distance of each pose w.r.t the first one, along the path
+    """
+    data = load_cached(file_name, _parse_pose_file, use_cache, mmap_mode="r")
+    poses = np.zeros((data.shape[0], 4, 4))
+    poses[:, :3, :] = data[:, 1:13].reshape(-1, 3, 4)
+    poses[:, 3, 3] = 1.0
+    return np.array(data[:, 0]), poses, np.array(data[:, 13])
+
+
+def _parse_pose_file(file_name):
+    """Parse a pose file in an array with the frame index, the 12 pose values and the distance of each pose"""
+    values = np.loadtxt(file_name, ndmin=2)
+    if values.shape[1] == 13:
+        frame_idx = values[:, 0]
+    elif values.shape[1] == 12 or values.shape[0] == 0:
+        frame_idx = np.arange(values.shape[0], dtype=np.float64)
+    else:
+        raise ValueError(
+            "{} has {} values per line, expected 12 or 13".format(
+                file_name, values.shape[1]
+            )
+        )
+    pose_values = values[:, -12:].reshape(-1, 12)
+    order = np.argsort(frame_idx, kind="stable")
+    translations = pose_values[order][:, [3, 7, 11]]
+    dist = np.empty(len(frame_idx))
+    dist[order] = cumulative_distances(translations)
+    return np.column_stack((frame_idx, pose_values, dist))
 
 
 def scale_lse_solver(X, Y):
@@ -43,33 +103,215 @@ def umeyama_alignment(x, y, with_scale=False):
 
     # variance, eq. 36
     # "transpose" for column subtraction
-    sigma_x = 1.0 / n * (np.linalg.norm(x - mean_x[:, np.newaxis]) ** 2)
+    x_centered = x - mean_x[:, np.newaxis]
+    sigma_x = 1.0 / n * np.sum(np.square(x_centered))
 
     # covariance matrix, eq. 38
-    outer_sum = np.zeros((m, m))
-    for i in range(n):
-        outer_sum += np.outer((y[:, i] - mean_y), (x[:, i] - mean_x))
-    cov_xy = np.multiply(1.0 / n, outer_sum)
+    cov_xy = 1.0 / n * (y - mean_y[:, np.newaxis]).dot(x_centered.T)
+
+    return umeyama_from_moments(mean_x, mean_y, sigma_x, cov_xy, with_scale)
+
+
+def umeyama_from_moments(mean_x, mean_y, sigma_x, cov_xy, with_scale=False):
+    """
+    Solves the Umeyama alignment from the first and second moments of the points,
+    for a single set of points or for a batch of B sets at once.
+    :param mean_x: (B)xm mean of the current points
+    :param mean_y: (B)xm mean of the reference points
+    :param sigma_x: (B) variance of the current points, eq. 36
+    :param cov_xy: (B)xmxm covariance matrix, eq. 38
+    :param with_scale: set to True to align also the scale (default: 1.0 scale)
+    :return: r, t, c - rotation matrix, translation vector and scale factor
+    """
+    m = cov_xy.shape[-1]
 
     # SVD (text betw. eq. 38 and 39)
     u, d, v = np.linalg.svd(cov_xy)
 
     # S matrix, eq. 43
-    s = np.eye(m)
-    if np.linalg.det(u) * np.linalg.det(v) < 0.0:
-        # Ensure a RHS coordinate system (Kabsch algorithm).
-        s[m - 1, m - 1] = -1
+    s = np.ones(d.shape)
+    # Ensure a RHS coordinate system (Kabsch algorithm).
+    s[..., m - 1] = np.where(np.linalg.det(u) * np.linalg.det(v) < 0.0, -1.0, 1.0)
 
     # rotation, eq. 40
-    r = u.dot(s).dot(v)
+    r = (u * s[..., np.newaxis, :]) @ v
 
     # scale & translation, eq. 42 and 41
-    c = 1 / sigma_x * np.trace(np.diag(d).dot(s)) if with_scale else 1.0
-    t = mean_y - np.multiply(c, r.dot(mean_x))
-
+    if with_scale:
+        c = 1 / sigma_x * np.sum(d * s, axis=-1)
+    else:
+        c = np.ones(np.shape(sigma_x))
+    t = mean_y - c[..., np.newaxis] * np.einsum("...ij,...j->...i", r, mean_x)
+
+    if r.ndim == 2:
+        c = float(c)
     return r, t, c
 
 
+class UmeyamaAccumulator:
+    """This class keeps the running sums needed to align two sets of points that grow over time.
+
+    The points are added (or removed) as they arrive, and the alignment can be
+    solved at any time in O(1), without visiting the points again.
+
+    Usage example:
+        accumulator = UmeyamaAccumulator()
+        for xyz_result, xyz_gt in stream:
+            accumulator.add(xyz_result, xyz_gt)
+        r, t, c = accumulator.solve("sim3")
+    """
+
+    def __init__(self, dim=3):
+        """Build an empty accumulator
+
+        Args:
+            dim (int): the dimension of the points. Defaults to 3
+        """
+        # the moments are kept centered on the running means (as in the parallel
+        # variance algorithm), so they do not cancel when the points are far from the origin
+        self.n = 0
+        self.mean_x = np.zeros(dim)
+        self.mean_y = np.zeros(dim)
+        self.m_xx = 0.0  # sum of the squared norms of x - mean_x
+        self.m_yy = 0.0  # sum of the squared norms of y - mean_y
+        # sum of the outer products (y - mean_y) (x - mean_x)^T
+        self.m_yx = np.zeros((dim, dim))
+
+    def add(self, x, y, weight=1.0):
+        """Add a pair of points, or a set of pairs
+
+        Args:
+            x (m or mxn array): current points
+            y (m or mxn array): reference points
+            weight (float): 1 to add the points, -1 to remove points added before. Defaults to 1.0
+        """
+        x = np.asarray(x, dtype=np.float64).reshape(len(self.mean_x), -1)
+        y = np.asarray(y, dtype=np.float64).reshape(len(self.mean_y), -1)
+        n_batch = weight * x.shape[1]
+        n = self.n + n_batch
+        if n == 0:
+            self.__init__(len(self.mean_x))
+            return
+        batch_mean_x = x.mean(axis=1)
+        batch_mean_y = y.mean(axis=1)
+        centered_x = x - batch_mean_x[:, np.newaxis]
+        centered_y = y - batch_mean_y[:, np.newaxis]
+        delta_x = batch_mean_x - self.mean_x
+        delta_y = batch_mean_y - self.mean_y
+        # the moments of the union, from the moments of the two sets
+        factor = self.n * n_batch / n
+        self.m_xx += weight * np.sum(np.square(centered_x)) + factor * delta_x.dot(
+            delta_x
+        )
+        self.m_yy += weight * np.sum(np.square(centered_y)) + factor * delta_y.dot(
+            delta_y
+        )
+        self.m_yx += weight * centered_y.dot(centered_x.T) + factor * np.outer(
+            delta_y, delta_x
+        )
+        self.mean_x += delta_x * n_batch / n
+        self.mean_y += delta_y * n_batch / n
+        self.n = n
+
+    def remove(self, x, y):
+        """Remove a pair of points (or a set of pairs) added before"""
+        self.add(x, y, weight=-1.0)
+
+    def solve(self, mode="sim3"):
+        """Solve the alignment of the points added so far
+
+        Args:
+            mode (str): "sim3" (rotation, translation and scale), "se3" (rotation and translation) or "scale" (scale only). Defaults to "sim3"
+
+        Returns:
+            r, t, c - rotation matrix, translation vector and scale factor, such that c * r @ x + t ~ y
+        """
+        dim = len(self.mean_x)
+        if mode == "scale":
+            # same solution of scale_lse_solver, from the moments about the origin
+            sum_yx = self.m_yx + self.n * np.outer(self.mean_y, self.mean_x)
+            sum_xx = self.m_xx + self.n * self.mean_x.dot(self.mean_x)
+            c = np.trace(sum_yx) / sum_xx
+            return np.eye(dim), np.zeros(dim), float(c)
+        if mode not in ("sim3", "se3"):
+            raise ValueError(f"unknown alignment mode {mode}")
+        return umeyama_from_moments(
+            self.mean_x,
+            self.mean_y,
+            self.m_xx / self.n,
+            self.m_yx / self.n,
+            mode == "sim3",
+        )
+
+    def rmse(self, r, t, c):
+        """Compute the RMSE of the aligned points, sqrt(mean(|c * r @ x + t - y|^2))
+
+        The squared error is a difference of moments that are much larger than the
+        error when it is small compared with the extent of the trajectory, so the
+        result agrees with the RMSE computed on the points to about 1e-7 relative.
+
+        Args:
+            r (mxm array): rotation matrix
+            t (m array): translation vector
+            c (float): scale factor
+
+        Returns:
+            the root mean square of the alignment error
+        """
+        if self.n <= 0:
+            return 0.0
+        # the error of the means plus the error of the centered points
+        mean_error = c * r.dot(self.mean_x) + t - self.mean_y
+        squared_error = (
+            self.n * mean_error.dot(mean_error)
+            + c * c * self.m_xx
+            + self.m_yy
+            - 2 * c * np.sum(r * self.m_yx)
+        )
+        return float(np.sqrt(max(squared_error, 0.0) / self.n))
+
+
+def umeyama_windows(x, y, window, step=1, with_scale=False):
+    """
+    Solves the Umeyama alignment of every window of consecutive points at once,
+    e.g. for a sliding-window drift analysis.
+    :param x: mxn matrix of points, m = dimension, n = nr. of data points
+    :param y: mxn matrix of points, m = dimension, n = nr. of data points
+    :param window: nr. of points in each window
+    :param step: nr. of points between the start of two windows (default: 1)
+    :param with_scale: set to True to align also the scale (default: 1.0 scale)
+    :return: starts, r, t, c - the first point of each window and the batched
+             rotation matrices, translation vectors and scale factors
+    """
+    if x.shape != y.shape:
+        assert False, "x.shape not equal to y.shape"
+
+    # center the points to limit the cancellation in the prefix sums
+    offset_x = x.mean(axis=1)
+    offset_y = y.mean(axis=1)
+    xc = (x - offset_x[:, np.newaxis]).T
+    yc = (y - offset_y[:, np.newaxis]).T
+
+    def window_sums(values):
+        prefix = np.concatenate((np.zeros((1,) + values.shape[1:]), values))
+        prefix = np.cumsum(prefix, axis=0)
+        return prefix[starts + window] - prefix[starts]
+
+    starts = np.arange(0, x.shape[1] - window + 1, step)
+    mean_x = window_sums(xc) / window
+    mean_y = window_sums(yc) / window
+    sigma_x = window_sums(np.sum(np.square(xc), axis=1)) / window - np.sum(
+        np.square(mean_x), axis=1
+    )
+    cov_xy = window_sums(yc[:, :, np.newaxis] * xc[:, np.newaxis, :]) / window
+    cov_xy -= mean_y[:, :, np.newaxis] * mean_x[:, np.newaxis, :]
+
+    r, t, c = umeyama_from_moments(mean_x, mean_y, sigma_x, cov_xy, with_scale)
+    # move the translation back to the original coordinates
+    t = t + offset_y - c[:, np.newaxis] * (r @ offset_x)
+    return starts, r, t, c
+
+
 class KittiEvalOdom:
     """Evaluate odometry result
     Usage example:
@@ -81,7 +323,7 @@ class KittiEvalOdom:
         self.lengths = [100, 200, 300, 400, 500, 600, 700, 800]
         self.num_lengths = len(self.lengths)
 
-    def load_poses_from_txt(self, file_name):
+    def load_poses_from_txt(self, file_name, use_cache=True):
         """Load poses from txt (KITTI format)
         Each line in the file should follow one of the following structures
             (1) idx pose(3x4 matrix in terms of 12 numbers)
@@ -89,29 +331,15 @@ class KittiEvalOdom:
 
         Args:
             file_name (str): txt file path
+            use_cache (bool): if true, use the binary sidecar of load_pose_array. Defaults to True
         Returns:
             poses (dict): {idx: 4x4 array}
         """
-        f = open(file_name, "r")
-        if not f:
-            print("error to open gt files on {}".format(file_name))
-            return
-        s = f.readlines()
-        f.close()
-        poses = {}
-        for cnt, line in enumerate(s):
-            P = np.eye(4)
-            line_split = [float(i) for i in line.split(" ") if i != ""]
-            withIdx = len(line_split) == 13
-            for row in range(3):
-                for col in range(4):
-                    P[row, col] = line_split[row * 4 + col + withIdx]
-            if withIdx:
-                frame_idx = line_split[0]
-            else:
-                frame_idx = cnt
-            poses[frame_idx] = P
-        return poses
+        frame_idx, poses, _ = load_pose_array(file_name, use_cache)
+        return {
+            (int(idx) if idx.is_integer() else idx): pose
+            for idx, pose in zip(frame_idx.tolist(), poses)
+        }
 
     def trajectory_distances(self, poses):
         """Compute distance for each pose w.r.t frame-0
@@ -120,43 +348,34 @@ class KittiEvalOdom:
         Returns:
             dist (float list): distance of each pose w.r.t frame-0
         """
-        dist = [0]
         sort_frame_idx = sorted(poses.keys())
-        for i in range(len(sort_frame_idx) - 1):
-            cur_frame_idx = sort_frame_idx[i]
-            next_frame_idx = sort_frame_idx[i + 1]
-            P1 = poses[cur_frame_idx]
-            P2 = poses[next_frame_idx]
-            dx = P1[0, 3] - P2[0, 3]
-            dy = P1[1, 3] - P2[1, 3]
-            dz = P1[2, 3] - P2[2, 3]
-            dist.append(dist[i] + np.sqrt(dx ** 2 + dy ** 2 + dz ** 2))
-        return dist
+        translations = np.array([poses[idx][:3, 3] for idx in sort_frame_idx])
+        return cumulative_distances(translations).tolist()
 
     def rotation_error(self, pose_error):
         """Compute rotation error
         Args:
-            pose_error (4x4 array): relative pose error
+            pose_error (...x4x4 array): relative pose error
         Returns:
-            rot_error (float): rotation error
+            rot_error (float or array): rotation error
         """
-        a = pose_error[0, 0]
-        b = pose_error[1, 1]
-        c = pose_error[2, 2]
+        a = pose_error[..., 0, 0]
+        b = pose_error[..., 1, 1]
+        c = pose_error[..., 2, 2]
         d = 0.5 * (a + b + c - 1.0)
-        rot_error = np.arccos(max(min(d, 1.0), -1.0))
+        rot_error = np.arccos(np.clip(d, -1.0, 1.0))
         return rot_error
 
     def translation_error(self, pose_error):
         """Compute translation error
         Args:
-            pose_error (4x4 array): relative pose error
+            pose_error (...x4x4 array): relative pose error
         Returns:
-            trans_error (float): translation error
+            trans_error (float or array): translation error
         """
-        dx = pose_error[0, 3]
-        dy = pose_error[1, 3]
-        dz = pose_error[2, 3]
+        dx = pose_error[..., 0, 3]
+        dy = pose_error[..., 1, 3]
+        dz = pose_error[..., 2, 3]
         trans_error = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
         return trans_error
 
@@ -170,10 +389,10 @@ class KittiEvalOdom:
         Returns:
             i (int) / -1: end-frame index. if not found return -1
         """
-        for i in range(first_frame, len(dist), 1):
-            if dist[i] > (dist[first_frame] + length):
-                return i
-        return -1
+        # dist is not decreasing, so the first frame farther than the required
+        # distance is found with a binary search
+        i = int(np.searchsorted(dist, dist[first_frame] + length, side="right"))
+        return i if i < len(dist) else -1
 
     def calc_sequence_errors(self, poses_gt, poses_result):
         """calculate sequence error
@@ -188,43 +407,45 @@ class KittiEvalOdom:
                 - length: evaluation trajectory length
                 - speed: car speed (#FIXME: 10FPS is assumed)
         """
-        err = []
-        dist = self.trajectory_distances(poses_gt)
         self.step_size = 10
-
-        for first_frame in range(0, len(poses_gt), self.step_size):
-            for i in range(self.num_lengths):
-                len_ = self.lengths[i]
-                last_frame = self.last_frame_from_segment_length(
-                    dist, first_frame, len_
-                )
-
-                # Continue if sequence not long enough
-                if (
-                    last_frame == -1
-                    or not (last_frame in poses_result.keys())
-                    or not (first_frame in poses_result.keys())
-                ):
-                    continue
-
-                # compute rotational and translational errors
-                pose_delta_gt = np.dot(
-                    np.linalg.inv(poses_gt[first_frame]), poses_gt[last_frame]
-                )
-                pose_delta_result = np.dot(
-                    np.linalg.inv(poses_result[first_frame]), poses_result[last_frame]
-                )
-                pose_error = np.dot(np.linalg.inv(pose_delta_result), pose_delta_gt)
-
-                r_err = self.rotation_error(pose_error)
-                t_err = self.translation_error(pose_error)
-
-                # compute speed
-                num_frames = last_frame - first_frame + 1.0
-                speed = len_ / (0.1 * num_frames)
-
-                err.append([first_frame, r_err / len_, t_err / len_, len_, speed])
-        return err
+        num_frames = len(poses_gt)
+        dist = np.asarray(self.trajectory_distances(poses_gt))
+
+        # all the (first_frame, length) segments, in the order first_frame, length
+        first_frames = np.arange(0, num_frames, self.step_size)
+        lengths = np.array(self.lengths, dtype=float)
+        first = np.repeat(first_frames, self.num_lengths)
+        len_ = np.tile(lengths, len(first_frames))
+        last = np.searchsorted(dist, dist[first] + len_, side="right")
+
+        # keep the segments that end inside the sequence and are in the results
+        in_result = np.array([idx in poses_result for idx in range(num_frames + 1)])
+        valid = (last < num_frames) & in_result[first] & in_result[last]
+        first, last, len_ = first[valid], last[valid], len_[valid]
+        if len(first) == 0:
+            return []
+
+        # compute rotational and translational errors
+        gt_first = np.stack([poses_gt[i] for i in first])
+        gt_last = np.stack([poses_gt[i] for i in last])
+        result_first = np.stack([poses_result[i] for i in first])
+        result_last = np.stack([poses_result[i] for i in last])
+        pose_delta_gt = np.linalg.inv(gt_first) @ gt_last
+        pose_delta_result = np.linalg.inv(result_first) @ result_last
+        pose_error = np.linalg.inv(pose_delta_result) @ pose_delta_gt
+
+        r_err = self.rotation_error(pose_error)
+        t_err = self.translation_error(pose_error)
+
+        # compute speed
+        speed = len_ / (0.1 * (last - first + 1.0))
+
+        return [
+            [int(f), r / l, t / l, int(l), v]
+            for f, r, t, l, v in zip(
+                first, r_err.tolist(), t_err.tolist(), len_.tolist(), speed.tolist()
+            )
+        ]
 
     def save_sequence_errors(self, err, file_name):
         """Save sequence error
@@ -270,6 +491,8 @@ class KittiEvalOdom:
             poses_result (dict): {idx: 4x4 array}; predicted poses
             file_name (str): the results file named.
         """
+        from matplotlib import pyplot as plt
+
         print("plot_trajectory")
         plot_keys = ["Ground Truth", file_name]
         fontsize_ = 20
@@ -307,6 +530,8 @@ class KittiEvalOdom:
             avg_segment_errs (dict): {100:[avg_t_err, avg_r_err],...}
             file_name (str): the results file named.
         """
+        from matplotlib import pyplot as plt
+
         # Translation error
         print("plot_error")
         plot_y = []
@@ -497,28 +722,58 @@ class KittiEvalOdom:
                 - 7dof: optimize 7dof for alignment and evaluation
                 - 6dof: optimize 6dof for alignment and evaluation
         """
-        # Initialization
-        gt_pose_path = args.gt_pose_txt
-        result_dir = args.dest
-        alignment = args.align
-
-        ave_t_errs = []
-        ave_r_errs = []
-        seq_ate = []
-        seq_rpe_trans = []
-        seq_rpe_rot = []
-
         if args.named is None:
             file_name = "eval"
         else:
             file_name = args.named
 
+        result = self.eval_sequence(
+            args.gt_pose_txt,
+            args.dest + "/pose.txt",
+            args.dest,
+            args.align,
+            file_name,
+            plot=not args.is_bash,
+        )
+
+        print("-------------------- For Copying ------------------------------")
+        print("{0:.2f}".format(result["t_err"] * 100))
+        print("{0:.2f}".format(result["r_err"] / np.pi * 180 * 100))
+        print("{0:.2f}".format(result["ate"]))
+        print("{0:.3f}".format(result["rpe_trans"]))
+        print("{0:.3f}".format(result["rpe_rot"] * 180 / np.pi))
+
+    def eval_sequence(
+        self,
+        gt_pose_path,
+        result_pose_path,
+        result_dir,
+        alignment="7dof",
+        file_name="eval",
+        plot=True,
+    ):
+        """Evaulate a sequence
+        Args:
+            gt_pose_path (str): ground truth poses txt file
+            result_pose_path (str): pose predictions txt file
+            result_dir (str): directory where the errors, the plots and pose_result.txt are saved
+            alignment (str): if not None, optimize poses by
+                - scale: optimize scale factor for trajectory alignment and evaluation
+                - scale_7dof: optimize 7dof for alignment and use scale for trajectory evaluation
+                - 7dof: optimize 7dof for alignment and evaluation
+                - 6dof: optimize 6dof for alignment and evaluation
+            file_name (str): the name of the sequence, used for the saved files. Defaults to "eval"
+            plot (bool): if true, plot the trajectory and the errors. Defaults to True
+        Returns:
+            result (dict): t_err, r_err (average segment errors), ate, rpe_trans, rpe_rot,
+                num_segments, sum_t_err, sum_r_err (to average the segments of more sequences)
+                and avg_segment_errs ({100:[avg_t_err, avg_r_err],...})
+        """
         # Create result directory
         error_dir = result_dir + "/errors"
         self.plot_path_dir = result_dir + "/plot_path"
         self.plot_error_dir = result_dir + "/plot_error"
         result_txt = os.path.join(result_dir, "pose_result.txt")
-        f = open(result_txt, "w")
 
         if not os.path.exists(error_dir):
             os.makedirs(error_dir)
@@ -528,7 +783,7 @@ class KittiEvalOdom:
             os.makedirs(self.plot_error_dir)
 
         poses_gt = self.load_poses_from_txt(gt_pose_path)
-        poses_result = self.load_poses_from_txt(result_dir + "/pose.txt")
+        poses_result = self.load_poses_from_txt(result_pose_path, use_cache=False)
         self.result_file_name = result_dir + "/eval_pose.txt"
 
         # Pose alignment to first frame
@@ -537,7 +792,10 @@ class KittiEvalOdom:
         gt_0 = poses_gt[idx_0]
         for cnt in poses_result:
             poses_result[cnt] = np.linalg.inv(pred_0) @ poses_result[cnt]
-            poses_gt[int(cnt)] = np.linalg.inv(gt_0) @ poses_gt[cnt]
+        # all the gt poses are moved, also the ones of the frames without a result,
+        # otherwise the segment lengths are measured across the two reference frames
+        for cnt in poses_gt:
+            poses_gt[cnt] = np.linalg.inv(gt_0) @ poses_gt[cnt]
 
         if alignment == "scale":
             poses_result = self.scale_optimization(poses_gt, poses_result)
@@ -570,48 +828,120 @@ class KittiEvalOdom:
                 if alignment == "7dof" or alignment == "6dof":
                     poses_result[cnt] = align_transformation @ poses_result[cnt]
 
-            # compute sequence errors
-            seq_err = self.calc_sequence_errors(poses_gt, poses_result)
-            self.save_sequence_errors(seq_err, error_dir + "/" + file_name)
-
-            # Compute segment errors
-            avg_segment_errs = self.compute_segment_error(seq_err)
-
-            # compute overall error
-            ave_t_err, ave_r_err = self.compute_overall_err(seq_err)
-            print("Translational error (%): ", ave_t_err * 100)
-            print("Rotational error (deg/100m): ", ave_r_err / np.pi * 180 * 100)
-            ave_t_errs.append(ave_t_err)
-            ave_r_errs.append(ave_r_err)
-
-            # Compute ATE
-            ate = self.compute_ATE(poses_gt, poses_result)
-            seq_ate.append(ate)
-            print("ATE (m): ", ate)
-
-            # Compute RPE
-            rpe_trans, rpe_rot = self.compute_RPE(poses_gt, poses_result)
-            seq_rpe_trans.append(rpe_trans)
-            seq_rpe_rot.append(rpe_rot)
-            print("RPE (m): ", rpe_trans)
-            print("RPE (deg): ", rpe_rot * 180 / np.pi)
-
-            # Plotting
-            if not args.is_bash:
-                self.plot_trajectory(poses_gt, poses_result, file_name)
-                self.plot_error(avg_segment_errs, file_name)
-
-            # Save result summary
+        # compute sequence errors
+        seq_err = self.calc_sequence_errors(poses_gt, poses_result)
+        self.save_sequence_errors(seq_err, error_dir + "/" + file_name)
+
+        # Compute segment errors
+        avg_segment_errs = self.compute_segment_error(seq_err)
+
+        # compute overall error
+        ave_t_err, ave_r_err = self.compute_overall_err(seq_err)
+        print("Translational error (%): ", ave_t_err * 100)
+        print("Rotational error (deg/100m): ", ave_r_err / np.pi * 180 * 100)
+
+        # Compute ATE
+        ate = self.compute_ATE(poses_gt, poses_result)
+        print("ATE (m): ", ate)
+
+        # Compute RPE
+        rpe_trans, rpe_rot = self.compute_RPE(poses_gt, poses_result)
+        print("RPE (m): ", rpe_trans)
+        print("RPE (deg): ", rpe_rot * 180 / np.pi)
+
+        # Plotting
+        if plot:
+            self.plot_trajectory(poses_gt, poses_result, file_name)
+            self.plot_error(avg_segment_errs, file_name)
+
+        # Save result summary
+        with open(result_txt, "w") as f:
             self.write_result(
                 f, file_name, [ave_t_err, ave_r_err, ate, rpe_trans, rpe_rot]
             )
 
-        f.close()
-
-        print("-------------------- For Copying ------------------------------")
-        for i in range(len(ave_t_errs)):
-            print("{0:.2f}".format(ave_t_errs[i] * 100))
-            print("{0:.2f}".format(ave_r_errs[i] / np.pi * 180 * 100))
-            print("{0:.2f}".format(seq_ate[i]))
-            print("{0:.3f}".format(seq_rpe_trans[i]))
-            print("{0:.3f}".format(seq_rpe_rot[i] * 180 / np.pi))
+        return {
+            "t_err": ave_t_err,
+            "r_err": ave_r_err,
+            "ate": ate,
+            "rpe_trans": rpe_trans,
+            "rpe_rot": rpe_rot,
+            "num_segments": len(seq_err),
+            "sum_t_err": float(sum(err[2] for err in seq_err)),
+            "sum_r_err": float(sum(err[1] for err in seq_err)),
+            "avg_segment_errs": avg_segment_errs,
+        }
+
+
+def _eval_sequence_job(job):
+    """Evaluate one sequence of eval_sequences in a worker process"""
+    name, gt_pose_path, result_pose_path, result_dir, alignment, plot = job
+    result = KittiEvalOdom().eval_sequence(
+        gt_pose_path, result_pose_path, result_dir, alignment, name, plot
+    )
+    result["name"] = name
+    return result
+
+
+def eval_sequences(sequences, dest, alignment="7dof", workers=None, plot=False):
+    """Evaluate many sequences in parallel and write a single summary
+    Args:
+        sequences (list): (name, gt pose txt file, result pose txt file) of each sequence
+        dest (str): directory of the results, each sequence is saved in dest/name
+        alignment (str): the alignment of KittiEvalOdom.eval_sequence. Defaults to "7dof"
+        workers (int): the number of worker processes, None for one per CPU. Defaults to None
+        plot (bool): if true, plot the trajectory and the errors of each sequence. Defaults to False
+    Returns:
+        results (list): the result dict of each sequence, in the given order
+        summary (dict): the averages over the sequences (mean of the sequence values) and the
+            KITTI benchmark t_err, r_err (mean over the segments of all the sequences)
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = [
+        (name, gt_path, result_path, os.path.join(dest, name), alignment, plot)
+        for name, gt_path, result_path in sequences
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_eval_sequence_job, jobs))
+
+    summary = {
+        key: float(np.mean([result[key] for result in results]))
+        for key in ["t_err", "r_err", "ate", "rpe_trans", "rpe_rot"]
+    }
+    num_segments = sum(result["num_segments"] for result in results)
+    summary["kitti_t_err"] = (
+        sum(result["sum_t_err"] for result in results) / num_segments
+        if num_segments > 0
+        else 0
+    )
+    summary["kitti_r_err"] = (
+        sum(result["sum_r_err"] for result in results) / num_segments
+        if num_segments > 0
+        else 0
+    )
+
+    with open(os.path.join(dest, "summary.txt"), "w") as f:
+        eval_tool = KittiEvalOdom()
+        for result in results:
+            eval_tool.write_result(
+                f,
+                result["name"],
+                [
+                    result[key]
+                    for key in ["t_err", "r_err", "ate", "rpe_trans", "rpe_rot"]
+                ],
+            )
+        eval_tool.write_result(
+            f,
+            "mean of the sequences",
+            [summary[key] for key in ["t_err", "r_err", "ate", "rpe_trans", "rpe_rot"]],
+        )
+        f.writelines(
+            "KITTI benchmark ({} segments): \n".format(num_segments)
+            + "Trans. err. (%): \t {:.3f} \n".format(summary["kitti_t_err"] * 100)
+            + "Rot. err. (deg/100m): \t {:.3f} \n".format(
+                summary["kitti_r_err"] / np.pi * 180 * 100
+            )
+        )
+    return results, summary
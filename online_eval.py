@@ -0,0 +1,232 @@
+import json
+import numpy as np
+from kitti_odometry import KittiEvalOdom, UmeyamaAccumulator, load_pose_array
+
+
+class OnlineOdometryEval:
+    """This class evaluates the trajectory while it is produced, against a preloaded ground truth.
+
+    Each new pose updates, in O(1) amortized time, the same metrics of
+    KittiEvalOdom.eval_sequence: the ATE after the alignment, the RPE between
+    consecutive frames and the KITTI errors of the segments of 100-800m. The
+    alignment is solved from running sums (UmeyamaAccumulator), and the segments
+    are fixed by the ground truth distances, so each segment is computed once,
+    when its last frame arrives. Only the translational errors depend on the
+    alignment scale, and they are recomputed, vectorized, when a snapshot is taken.
+
+    Usage example:
+        online_eval = OnlineOdometryEval("poses/00.txt", snapshot_every=100, abort_ate=50)
+        for idx, image in enumerate(images):
+            if app.process_image_mono(image, timestamps[idx]) == slampy.State.OK:
+                online_eval.add(idx, app.get_pose_to_target())
+            if online_eval.diverged:
+                break
+        print(online_eval.snapshot())
+    """
+
+    def __init__(
+        self,
+        gt_pose_txt,
+        alignment="7dof",
+        snapshot_every=100,
+        snapshot_file=None,
+        abort_ate=None,
+    ):
+        """Load the ground truth and precompute the segments
+
+        Args:
+            gt_pose_txt (str): the gt pose file, in KITTI format
+            alignment (str): the alignment of KittiEvalOdom.eval_sequence (scale, scale_7dof, 7dof or 6dof). Defaults to "7dof"
+            snapshot_every (int): take a snapshot every snapshot_every added poses, 0 to take them only on request. Defaults to 100
+            snapshot_file (str): if set, each snapshot is appended to this file as a json line. Defaults to None
+            abort_ate (float): if set, diverged becomes true when the ATE of a snapshot is over this threshold. Defaults to None
+        """
+        frame_idx, poses, dist = load_pose_array(gt_pose_txt)
+        order = np.argsort(frame_idx, kind="stable")
+        self.gt_idx = frame_idx[order]
+        self.gt_poses = poses[order]
+        self.gt_dist = dist[order]
+        self.alignment = alignment
+        self.snapshot_every = snapshot_every
+        self.snapshot_file = snapshot_file
+        self.abort_ate = abort_ate
+        self.eval_tool = KittiEvalOdom()
+
+        # the segments of calc_sequence_errors, sorted by their last frame
+        self.step_size = 10
+        num_frames = len(self.gt_idx)
+        lengths = np.array(self.eval_tool.lengths, dtype=float)
+        first = np.repeat(np.arange(0, num_frames, self.step_size), len(lengths))
+        length = np.tile(lengths, len(first) // len(lengths))
+        last = np.searchsorted(self.gt_dist, self.gt_dist[first] + length, "right")
+        inside = last < num_frames
+        order = np.argsort(last[inside], kind="stable")
+        self.segment_first = first[inside][order]
+        self.segment_last = last[inside][order]
+        self.segment_length = length[inside][order]
+
+        num_segments = len(self.segment_first)
+        self.segment_done_length = np.ones(num_segments)
+        self.segment_r_err = np.zeros(num_segments)
+        self.segment_gt_delta = np.zeros((num_segments, 3))
+        self.segment_result_delta = np.zeros((num_segments, 3))
+        self.rpe_r_err = np.zeros(num_frames)
+        self.rpe_gt_delta = np.zeros((num_frames, 3))
+        self.rpe_result_delta = np.zeros((num_frames, 3))
+        self.snapshots = []
+        self.reset()
+
+    def reset(self):
+        """Drop all the poses added so far"""
+        self.accumulator = UmeyamaAccumulator()
+        self.num_poses = 0
+        self.num_segments = 0
+        self.num_rpe = 0
+        self.diverged = False
+        # (inverse of the first result pose, inverse of its gt pose)
+        self._origin = None
+        self._previous = None  # (row, result pose) of the last added frame
+        self._segment_starts = {}  # row: result pose of the frames that start a segment
+
+    def _row(self, frame_id):
+        """Get the row of the gt of a frame, None if the gt does not have the frame"""
+        row = int(np.searchsorted(self.gt_idx, frame_id))
+        if row < len(self.gt_idx) and self.gt_idx[row] == frame_id:
+            return row
+        return None
+
+    def add(self, frame_id, pose):
+        """Add the pose of a frame, the frames must be added in increasing order
+
+        Args:
+            frame_id (int): the index of the frame, as in the gt file
+            pose: the 4x4 pose 0->T of the frame (as saved in pose.txt)
+
+        Returns:
+            the new snapshot, if one has been taken, otherwise None
+        """
+        row = self._row(frame_id)
+        if row is None or pose is None:
+            return None
+        if self._origin is None:
+            self._origin = (np.linalg.inv(pose), np.linalg.inv(self.gt_poses[row]))
+        # the poses are aligned to the first frame, as in KittiEvalOdom.eval_sequence
+        result = self._origin[0] @ pose
+        gt = self._origin[1] @ self.gt_poses[row]
+        self.accumulator.add(result[:3, 3], gt[:3, 3])
+        self.num_poses += 1
+
+        # like compute_RPE, the pair that starts at frame 0 is not counted
+        if (
+            self._previous is not None
+            and self._previous[0] == row - 1
+            and self.gt_idx[row - 1] != 0
+        ):
+            gt_previous = self._origin[1] @ self.gt_poses[row - 1]
+            self._add_relative_error(
+                "rpe", self.num_rpe, gt_previous, gt, self._previous[1], result
+            )
+            self.num_rpe += 1
+        self._previous = (row, result)
+
+        if row % self.step_size == 0:
+            self._segment_starts[row] = result
+        start = np.searchsorted(self.segment_last, row, "left")
+        end = np.searchsorted(self.segment_last, row, "right")
+        for segment in range(start, end):
+            first = self.segment_first[segment]
+            if first in self._segment_starts:
+                gt_first = self._origin[1] @ self.gt_poses[first]
+                self._add_relative_error(
+                    "segment",
+                    self.num_segments,
+                    gt_first,
+                    gt,
+                    self._segment_starts[first],
+                    result,
+                )
+                self.segment_done_length[self.num_segments] = self.segment_length[
+                    segment
+                ]
+                self.num_segments += 1
+
+        if self.snapshot_every > 0 and self.num_poses % self.snapshot_every == 0:
+            return self.snapshot()
+        return None
+
+    def _add_relative_error(self, kind, index, gt_1, gt_2, result_1, result_2):
+        """Store the rotation error and the relative translations between two frames
+
+        The translational error depends on the scale of the alignment, |gt_delta - scale * result_delta|,
+        so the relative translations are stored and the error is computed in snapshot
+        """
+        gt_rel = np.linalg.inv(gt_1) @ gt_2
+        result_rel = np.linalg.inv(result_1) @ result_2
+        r_err = self.eval_tool.rotation_error(np.linalg.inv(result_rel) @ gt_rel)
+        getattr(self, kind + "_r_err")[index] = r_err
+        getattr(self, kind + "_gt_delta")[index] = gt_rel[:3, 3]
+        getattr(self, kind + "_result_delta")[index] = result_rel[:3, 3]
+
+    def solve_alignment(self):
+        """Solve the alignment of the poses added so far
+
+        Returns:
+            r, t, c - rotation matrix, translation vector and scale factor applied to the result positions
+        """
+        if self.alignment == "7dof" or self.alignment == "6dof":
+            mode = "sim3" if self.alignment == "7dof" else "se3"
+            return self.accumulator.solve(mode)
+        if self.alignment == "scale_7dof":
+            _, _, c = self.accumulator.solve("sim3")
+        elif self.alignment == "scale":
+            _, _, c = self.accumulator.solve("scale")
+        else:
+            c = 1.0
+        return np.eye(3), np.zeros(3), c
+
+    def snapshot(self):
+        """Compute the metrics of the poses added so far
+
+        Returns:
+            a dict with frames (the number of poses), t_err, r_err (average segment
+            errors), segments (their number), ate, rpe_trans, rpe_rot and scale
+        """
+        if self.num_poses < 3:
+            r, t, c = np.eye(3), np.zeros(3), 1.0
+        else:
+            r, t, c = self.solve_alignment()
+
+        n = self.num_segments
+        t_err = np.linalg.norm(
+            self.segment_gt_delta[:n] - c * self.segment_result_delta[:n], axis=1
+        )
+        rpe_trans = np.linalg.norm(
+            self.rpe_gt_delta[: self.num_rpe]
+            - c * self.rpe_result_delta[: self.num_rpe],
+            axis=1,
+        )
+        snapshot = {
+            "frames": self.num_poses,
+            "t_err": float(np.mean(t_err / self.segment_done_length[:n]))
+            if n > 0
+            else 0.0,
+            "r_err": float(
+                np.mean(self.segment_r_err[:n] / self.segment_done_length[:n])
+            )
+            if n > 0
+            else 0.0,
+            "segments": n,
+            "ate": self.accumulator.rmse(r, t, c),
+            "rpe_trans": float(np.mean(rpe_trans)) if self.num_rpe > 0 else 0.0,
+            "rpe_rot": float(np.mean(self.rpe_r_err[: self.num_rpe]))
+            if self.num_rpe > 0
+            else 0.0,
+            "scale": float(c),
+        }
+        self.snapshots.append(snapshot)
+        if self.snapshot_file is not None:
+            with open(self.snapshot_file, "a") as f:
+                f.write(json.dumps(snapshot) + "\n")
+        if self.abort_ate is not None and snapshot["ate"] > self.abort_ate:
+            self.diverged = True
+        return snapshot
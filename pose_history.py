@@ -0,0 +1,200 @@
+import numpy as np
+
+
+# the layout of a frame stored in the PoseHistory
+FRAME_DTYPE = np.dtype(
+    [("pose", np.float64, (4, 4)), ("timestamp", np.float64), ("state", np.int8)]
+)
+
+
+def inverse_pose(pose):
+    """Invert a rigid transformation (or a stack of them) in closed form
+
+    Args:
+        pose: ndarray ...x4x4 with the pose matrices (as R|t in homogeneous notation)
+
+    Returns:
+        ndarray ...x4x4 with the inverse poses, R^T|-R^T t
+    """
+    pose = np.asarray(pose)
+    rotation_t = np.swapaxes(pose[..., :3, :3], -1, -2)
+    inverse = np.zeros(pose.shape)
+    inverse[..., :3, :3] = rotation_t
+    inverse[..., :3, 3] = -np.einsum("...ij,...j->...i", rotation_t, pose[..., :3, 3])
+    inverse[..., 3, 3] = 1.0
+    return inverse
+
+
+class PoseHistory:
+    """This class stores the pose, the timestamp and the tracking state of every processed frame.
+
+    The frames are stored in fixed size chunks of a structured ndarray (FRAME_DTYPE), indexed
+    by the frame number, so the access to any frame is O(1). The pose of the frames that are
+    not tracked is stored as NaN. If max_frames is set, the oldest chunks are dropped once the
+    history holds more than max_frames frames.
+    """
+
+    def __init__(self, chunk_size=1024, max_frames=None):
+        """Build an empty history
+
+        Args:
+            chunk_size (int): the number of frames in each chunk. Defaults to 1024
+            max_frames (int): the number of recent frames that are kept at least, None to keep all the frames. Defaults to None
+        """
+        self.chunk_size = chunk_size
+        self.max_frames = max_frames
+        self.clear()
+
+    def clear(self):
+        """Drop all the frames"""
+        self._chunks = []
+        self.first_frame = 0  # the index of the first frame of the first chunk
+        self.num_frames = 0  # the number of frames added since the creation
+
+    def __len__(self):
+        return self.num_frames
+
+    def append(self, pose, timestamp, state):
+        """Add a new frame to the history
+
+        Args:
+            pose: the 4x4 pose 0->T of the frame, None if the frame is not tracked
+            timestamp (float): the timestamp of the frame
+            state (State): the tracking state of the frame
+
+        Returns:
+            the index of the new frame
+        """
+        offset = self.num_frames - self.first_frame
+        if offset == len(self._chunks) * self.chunk_size:
+            self._chunks.append(np.empty(self.chunk_size, dtype=FRAME_DTYPE))
+        chunk, index = self._chunks[-1], offset % self.chunk_size
+        chunk["pose"][index] = np.nan if pose is None else pose
+        chunk["timestamp"][index] = timestamp
+        chunk["state"][index] = state.value
+        self.num_frames += 1
+
+        if self.max_frames is not None:
+            while (
+                self.num_frames - self.first_frame - self.chunk_size >= self.max_frames
+            ):
+                self._chunks.pop(0)
+                self.first_frame += self.chunk_size
+        return self.num_frames - 1
+
+    def _frame(self, frame_id):
+        """Get the record of a frame, None if the frame has been dropped or not exists yet"""
+        if frame_id < 0:
+            frame_id += self.num_frames
+        if frame_id < self.first_frame or frame_id >= self.num_frames:
+            return None
+        offset = frame_id - self.first_frame
+        return self._chunks[offset // self.chunk_size][offset % self.chunk_size]
+
+    def get_pose(self, frame_id):
+        """Get the pose 0->T of a frame
+
+        Args:
+            frame_id (int): the index of the frame, negative values count from the last frame
+
+        Returns:
+            a copy of the 4x4 pose, None if the frame is not tracked or it is not stored
+        """
+        frame = self._frame(frame_id)
+        if frame is None or np.isnan(frame["pose"][0, 0]):
+            return None
+        return frame["pose"].copy()
+
+    def get_timestamp(self, frame_id):
+        """Get the timestamp of a frame, None if the frame is not stored"""
+        frame = self._frame(frame_id)
+        return None if frame is None else float(frame["timestamp"])
+
+    def get_state_value(self, frame_id):
+        """Get the value of the State of a frame, None if the frame is not stored"""
+        frame = self._frame(frame_id)
+        return None if frame is None else int(frame["state"])
+
+    def get_relative_pose(self, from_frame, to_frame):
+        """Get the pose between two frames
+
+        Args:
+            from_frame (int): the index of the frame X
+            to_frame (int): the index of the frame T
+
+        Returns:
+            the 4x4 pose X->T, computed as (0->T) * inv(0->X), None if one of the frames is not tracked or not stored
+        """
+        pose_from = self.get_pose(from_frame)
+        pose_to = self.get_pose(to_frame)
+        if pose_from is None or pose_to is None:
+            return None
+        return np.dot(pose_to, inverse_pose(pose_from))
+
+    def frame_at(self, timestamp):
+        """Get the index of the last stored frame acquired before or at the timestamp
+
+        Args:
+            timestamp (float): the timestamp to search
+
+        Returns:
+            the frame index, None if all the stored frames are newer than the timestamp
+        """
+        frames = self.to_array()
+        position = np.searchsorted(frames["timestamp"], timestamp, side="right")
+        return None if position == 0 else self.first_frame + int(position) - 1
+
+    def to_array(self):
+        """Get the stored frames as a single FRAME_DTYPE ndarray
+
+        Note: if the frames are in more than one chunk they are copied, use save for large histories
+
+        Returns:
+            the ndarray of the stored frames, from first_frame to the last one
+        """
+        count = self.num_frames - self.first_frame
+        if len(self._chunks) == 1:
+            return self._chunks[0][:count]
+        if count == 0:
+            return np.empty(0, dtype=FRAME_DTYPE)
+        return np.concatenate(self._chunks)[:count]
+
+    def get_tracked_poses(self):
+        """Get the poses of the stored frames that are tracked, as ndarray Nx4x4"""
+        poses = self.to_array()["pose"]
+        return poses[~np.isnan(poses[:, 0, 0])]
+
+    def save(self, filename):
+        """Save the stored frames in a .npy file, writing the chunks one by one
+
+        Args:
+            filename (str): path to the .npy file
+        """
+        count = self.num_frames - self.first_frame
+        out = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=FRAME_DTYPE, shape=(count,)
+        )
+        for i, chunk in enumerate(self._chunks):
+            start = i * self.chunk_size
+            end = min(start + self.chunk_size, count)
+            out[start:end] = chunk[: end - start]
+        out.flush()
+        del out
+
+    @classmethod
+    def load(cls, filename, mmap_mode="r"):
+        """Load a history saved with save, by default as memory map
+
+        Args:
+            filename (str): path to the .npy file
+            mmap_mode (str): the mode of np.load, None to read the file in memory. Defaults to "r"
+
+        Returns:
+            a PoseHistory with all the frames in a single chunk, indexed from 0
+        """
+        frames = np.load(filename, mmap_mode=mmap_mode)
+        history = cls(chunk_size=max(len(frames), 1))
+        if len(frames) > 0:
+            history._chunks = [frames]
+        history.num_frames = len(frames)
+        return history
@@ -0,0 +1,452 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import numpy as np
+from shm_ring import SharedFrameRing
+from utils import load_image
+
+
+class ImagePrefetcher:
+    """This class decodes the images of a sequence on a thread pool, ahead of the tracking loop.
+
+    The decoded images are returned in the same order of the filenames, while the
+    next ones are decoded in background and kept in a bounded queue.
+
+    Usage example:
+        with ImagePrefetcher(image_filenames, depth=8) as prefetcher:
+            for image in prefetcher:
+                app.process_image_mono(image, tframe)
+    """
+
+    def __init__(
+        self, filenames, loader=load_image, depth=8, workers=2, max_bytes=None
+    ):
+        """Build the prefetcher
+
+        Args:
+            filenames (list): the image filenames, in the order in which they are processed
+            loader (callable): function that loads an image, or a tuple of images (e.g. a stereo pair), from its filename. Defaults to utils.load_image
+            depth (int): the max number of images decoded in advance, if it is 0 the images are decoded in the caller thread. Defaults to 8
+            workers (int): the number of decoding threads. Defaults to 2
+            max_bytes (int): the max memory used by the images in the queue, None for no limit. Defaults to None
+        """
+        self.filenames = filenames
+        self.loader = loader
+        self.depth = depth
+        self.workers = workers
+        self.max_bytes = max_bytes
+
+        self._queue = deque()
+        self._next = 0
+        self._frame_bytes = None
+        self._executor = None
+
+        self.frames = 0
+        self.starved = 0
+        self.wait_time = 0.0
+        self.max_queue = 0
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for filename in self.filenames:
+                image = self.loader(filename)
+                self.frames += 1
+                yield image
+            return
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            self._fill()
+            while self._queue:
+                future = self._queue.popleft()
+                if not future.done():
+                    # the tracking is waiting for the decoding
+                    self.starved += 1
+                    t_start = time.perf_counter()
+                    image = future.result()
+                    self.wait_time += time.perf_counter() - t_start
+                else:
+                    image = future.result()
+                self.frames += 1
+                self._frame_bytes = sum(part.nbytes for part in _as_parts(image))
+                self._fill()
+                yield image
+        finally:
+            self.close()
+
+    def _fill(self):
+        """Submit new decoding jobs until the queue is full or the memory cap is reached"""
+        while self._next < len(self.filenames) and len(self._queue) < self.depth:
+            if (
+                self._queue
+                and self.max_bytes is not None
+                and self._frame_bytes is not None
+                and (len(self._queue) + 1) * self._frame_bytes > self.max_bytes
+            ):
+                break
+            self._queue.append(
+                self._executor.submit(self.loader, self.filenames[self._next])
+            )
+            self._next += 1
+        self.max_queue = max(self.max_queue, len(self._queue))
+
+    def close(self):
+        """Stop the decoding threads and drop the images not yet consumed"""
+        for future in self._queue:
+            future.cancel()
+        self._queue.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_stats(self):
+        """Get the statistics of the prefetching
+
+        Returns:
+            a dict with the number of decoded frames, the number of times the consumer
+            waited for a frame (starved), the total waiting time in seconds and the max queue length
+        """
+        return {
+            "frames": self.frames,
+            "starved": self.starved,
+            "wait_time": self.wait_time,
+            "max_queue": self.max_queue,
+        }
+
+
+def _as_parts(frame):
+    """Get the images of a frame returned by a loader, as a tuple"""
+    return tuple(frame) if isinstance(frame, (tuple, list)) else (frame,)
+
+
+def _decode_worker(ring_spec, filenames, first, step, loader, ready, released, errors):
+    """Decode the frames first, first + step, ... in the shared ring, in a worker process
+
+    When the decoding of a frame fails, its slot is invalidated and the frame index
+    and the error are sent to the consumer in errors.
+    """
+    ring = SharedFrameRing.attach(ring_spec)
+    parent = os.getppid()
+    try:
+        for seq in range(first, len(filenames), step):
+            # backpressure: the slot is free when the consumer has released frame seq - slots
+            with released.get_lock():
+                free = released.value > seq - ring.slots
+            while not free:
+                time.sleep(0.0005)
+                if os.getppid() != parent:
+                    return
+                free = released.value > seq - ring.slots
+            try:
+                ring.write(seq, _as_parts(loader(filenames[seq])))
+            except Exception as e:
+                errors.put((seq, f"{type(e).__name__}: {e}"))
+                ring.invalidate(seq)
+            ready[seq % ring.slots].release()
+    finally:
+        ring.close()
+
+
+def _get_error(errors, seq):
+    """Get the error sent by the worker that failed to decode the frame seq"""
+    while True:
+        # the worker sends the error before marking the slot as ready
+        failed, error = errors.get()
+        if failed == seq:
+            return error
+
+
+class ProcessPrefetcher:
+    """This class decodes the frames of a sequence in worker processes, ahead of the tracking loop.
+
+    The workers write the decoded frames in a SharedFrameRing and the frames are
+    returned as ndarray views of the shared memory, so they are neither pickled
+    nor copied. A frame is the image returned by the loader or, for stereo and
+    RGB-D, the tuple of images it returns; every frame must have the shapes and the
+    dtypes of the first one, that is decoded in the caller to size the ring.
+
+    A frame returned by the iterator is valid only until the next one is requested,
+    then its slot is given back to the workers. The workers wait for a free slot
+    before decoding (backpressure), so at most `depth` frames are decoded in advance.
+
+    Usage example:
+        with ProcessPrefetcher(image_filenames, depth=8, workers=2) as prefetcher:
+            for image in prefetcher:
+                app.process_image_mono(image, tframe)
+    """
+
+    def __init__(
+        self, filenames, loader=load_image, depth=8, workers=2, max_bytes=None
+    ):
+        """Build the prefetcher
+
+        Args:
+            filenames (list): the frames to decode, in the order in which they are processed, each one is passed to loader
+            loader (callable): a picklable function (e.g. a module function) that loads a frame. Defaults to utils.load_image
+            depth (int): the max number of frames decoded in advance. Defaults to 8
+            workers (int): the number of decoding processes. Defaults to 2
+            max_bytes (int): the max memory used by the frames decoded in advance, None for no limit. Defaults to None
+        """
+        self.filenames = filenames
+        self.loader = loader
+        self.depth = max(depth, 1)
+        self.workers = max(workers, 1)
+        self.max_bytes = max_bytes
+
+        self._ring = None
+        self._processes = []
+
+        self.frames = 0
+        self.starved = 0
+        self.wait_time = 0.0
+        self.max_queue = 0
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __iter__(self):
+        if len(self.filenames) == 0:
+            return
+        first = _as_parts(self.loader(self.filenames[0]))
+        depth = self.depth
+        if self.max_bytes is not None:
+            frame_bytes = sum(part.nbytes for part in first)
+            depth = max(min(depth, self.max_bytes // frame_bytes), 1)
+        # the consumer holds the slot of the current frame
+        slots = depth + 1
+
+        context = multiprocessing.get_context("spawn")
+        self._ring = SharedFrameRing(
+            [(part.shape, part.dtype) for part in first], slots
+        )
+        self._ring.write(0, first)
+        del first
+        ready = [context.Semaphore(0) for _ in range(slots)]
+        ready[0].release()
+        released = context.Value("q", 0)
+        errors = context.SimpleQueue()
+        try:
+            self._processes = [
+                context.Process(
+                    target=_decode_worker,
+                    args=(
+                        self._ring.spec,
+                        self.filenames,
+                        1 + i,
+                        self.workers,
+                        self.loader,
+                        ready,
+                        released,
+                        errors,
+                    ),
+                    daemon=True,
+                )
+                for i in range(self.workers)
+            ]
+            for process in self._processes:
+                process.start()
+
+            for seq in range(len(self.filenames)):
+                slot = seq % slots
+                if not ready[slot].acquire(block=False):
+                    # the tracking is waiting for the decoding
+                    self.starved += 1
+                    t_start = time.perf_counter()
+                    self._wait_ready(ready[slot], seq)
+                    self.wait_time += time.perf_counter() - t_start
+                frame = self._ring.read(seq)
+                if frame is None:
+                    raise ValueError(
+                        f"failed to decode frame {seq} ({self.filenames[seq]}): {_get_error(errors, seq)}"
+                    )
+                # the previous frame is not used anymore, its slot can be written
+                with released.get_lock():
+                    released.value = seq
+                self.max_queue = max(self.max_queue, min(seq + depth, len(self)) - seq)
+                self.frames += 1
+                yield frame[0] if len(frame) == 1 else tuple(frame)
+                del frame
+        finally:
+            self.close()
+
+    def _wait_ready(self, ready, seq):
+        """Wait for the frame seq, raise a RuntimeError if its worker has died"""
+        process = self._processes[(seq - 1) % self.workers]
+        while not ready.acquire(timeout=0.5):
+            if process.exitcode is not None and not ready.acquire(block=False):
+                raise RuntimeError(
+                    f"the decoding worker of frame {seq} has exited with code {process.exitcode}"
+                )
+            elif process.exitcode is not None:
+                return
+
+    def close(self):
+        """Stop the decoding processes and remove the shared memory"""
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._processes = []
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_stats(self):
+        """Get the statistics of the prefetching, as ImagePrefetcher.get_stats"""
+        return {
+            "frames": self.frames,
+            "starved": self.starved,
+            "wait_time": self.wait_time,
+            "max_queue": self.max_queue,
+        }
+
+
+class VideoPrefetcher:
+    """This class decodes the frames of a video on a background thread, ahead of the tracking loop.
+
+    The frames of a datasets.VideoDataset (or of a slice of it) are read in order
+    with cv2.VideoCapture and kept in a bounded queue, the skipped frames of a
+    strided slice are grabbed without decoding them. The iterator returns the
+    presentation timestamp in seconds and the image of each frame, converted by
+    VideoDataset.convert_frame.
+
+    Usage example:
+        dataset = datasets.VideoDataset("recording.mp4")
+        for frame, image in dataset.stream(VideoPrefetcher(dataset, depth=8)):
+            app.process_image_mono(image, frame.timestamp)
+    """
+
+    def __init__(self, dataset, depth=8):
+        """Build the prefetcher
+
+        Args:
+            dataset (VideoDataset): the frames to decode
+            depth (int): the max number of frames decoded in advance. Defaults to 8
+        """
+        self.dataset = dataset
+        self.depth = max(depth, 1)
+
+        self._queue = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.frames = 0
+        self.starved = 0
+        self.wait_time = 0.0
+        self.max_queue = 0
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _decode(self):
+        """Read the frames in the queue, the thread ends with None or with the exception raised"""
+        import cv2
+
+        capture = cv2.VideoCapture(self.dataset.path)
+        try:
+            frames = range(len(self.dataset))
+            position = self.dataset.frame_index(0) if len(frames) > 0 else 0
+            if position > 0:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+            for i in frames:
+                if self.dataset.frame_index(i) < position:
+                    raise ValueError("the frames of a video must be read in order")
+                while position < self.dataset.frame_index(i):
+                    capture.grab()
+                    position += 1
+                ok, image = capture.read()
+                position += 1
+                if not ok:
+                    break
+                item = (
+                    capture.get(cv2.CAP_PROP_POS_MSEC) / 1000,
+                    self.dataset.convert_frame(image),
+                )
+                if not self._put(item):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+        finally:
+            capture.release()
+
+    def _put(self, item):
+        """Put an item in the queue, waiting for a free place until the prefetcher is closed
+
+        Returns:
+            true if the item has been queued, false if the prefetcher has been closed
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                self.max_queue = max(self.max_queue, self._queue.qsize())
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    # the tracking is waiting for the decoding
+                    self.starved += 1
+                    t_start = time.perf_counter()
+                    item = self._queue.get()
+                    self.wait_time += time.perf_counter() - t_start
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                self.frames += 1
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the decoding thread and drop the frames not yet consumed"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._queue = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_stats(self):
+        """Get the statistics of the prefetching, as ImagePrefetcher.get_stats"""
+        return {
+            "frames": self.frames,
+            "starved": self.starved,
+            "wait_time": self.wait_time,
+            "max_queue": self.max_queue,
+        }
@@ -0,0 +1,225 @@
+import threading
+import time
+from collections import Counter, deque
+import numpy as np
+from tracing import LatencyHistogram
+
+# what is done with a released frame when the queue of the frames waiting for the tracking is full
+REPLAY_POLICIES = ["drop_oldest", "latest_only", "block"]
+
+# the state logged for the frames dropped by the replay
+DROPPED = "DROPPED"
+
+# a frame released more than this number of seconds after its timestamp is late
+LATE_TOLERANCE = 0.005
+
+
+class ReplayScheduler:
+    """This class replays a sequence in real time, as if its frames came from a live camera.
+
+    A background thread releases each frame of the stream when its recorded
+    timestamp is due (scaled by the speed factor) and puts it in a bounded queue,
+    where the tracking loop takes it. When the tracking falls behind and the
+    queue is full the policy decides what to do with the new frame:
+
+    - drop_oldest: the oldest waiting frame is dropped
+    - latest_only: the waiting frame is dropped, the tracking always gets the newest frame (the queue holds one frame)
+    - block: nothing is dropped, the release waits and the next frames are late
+
+    The end-to-end latency of a frame goes from its due time to the request of
+    the next frame, so it includes the decoding delays, the time in the queue,
+    the tracking and all the work done on the frame in the loop. A frame released
+    more than LATE_TOLERANCE after its due time (e.g. the decoding is too slow)
+    is counted as late.
+
+    Usage example:
+        replay = ReplayScheduler(dataset.stream(prefetcher), speed=1.0, policy="drop_oldest")
+        for idx, (frame, image) in replay:
+            app.process_image_mono(image, frame.timestamp)
+        print(replay.format_summary())
+    """
+
+    def __init__(
+        self, stream, speed=1.0, policy="drop_oldest", queue_size=2, copy=False
+    ):
+        """Build the scheduler
+
+        Args:
+            stream (iterable): the (Frame, image) of the sequence, in order (e.g. Dataset.stream)
+            speed (float): the replay speed, 2.0 releases the frames twice as fast as they have been recorded. Defaults to 1.0
+            policy (str): what to do with the new frame when the queue is full, one of REPLAY_POLICIES. Defaults to "drop_oldest"
+            queue_size (int): the max number of frames waiting for the tracking, 1 with latest_only. Defaults to 2
+            copy (bool): if true, copy the images before they are queued, for streams that reuse their buffers (e.g. prefetch.ProcessPrefetcher). Defaults to False
+
+        Raises:
+            ValueError: if speed or queue_size are not positive or the policy is unknown
+        """
+        if speed <= 0:
+            raise ValueError(f"the replay speed must be positive, not {speed}")
+        if policy not in REPLAY_POLICIES:
+            raise ValueError(
+                f"unknown replay policy {policy}, expected one of {REPLAY_POLICIES}"
+            )
+        if queue_size < 1:
+            raise ValueError(f"the queue size must be positive, not {queue_size}")
+        self.stream = stream
+        self.speed = speed
+        self.policy = policy
+        self.queue_size = 1 if policy == "latest_only" else queue_size
+        self.copy = copy
+
+        # (index, (Frame, image), due time) of the released frames
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._finished = False
+        self._error = None
+        self._thread = None
+
+        self.released = 0
+        self.processed = 0
+        self.dropped = 0
+        self.late = 0
+        self.max_lag = 0.0
+        self.latency = LatencyHistogram()
+
+    def _release(self):
+        """Release the frames at their due time, the thread ends with the stream or with close"""
+        try:
+            t_start = None
+            for index, (frame, image) in enumerate(self.stream):
+                if t_start is None:
+                    t_start, t_first = time.perf_counter(), frame.timestamp
+                due = t_start + (frame.timestamp - t_first) / self.speed
+                lag = time.perf_counter() - due
+                if lag < 0:
+                    self._stop.wait(-lag)
+                elif lag > LATE_TOLERANCE:
+                    self.late += 1
+                    self.max_lag = max(self.max_lag, lag)
+                if self._stop.is_set():
+                    return
+                if self.copy:
+                    image = (
+                        tuple(np.copy(part) for part in image)
+                        if isinstance(image, tuple)
+                        else np.copy(image)
+                    )
+
+                with self._condition:
+                    if self.policy == "block":
+                        while (
+                            len(self._queue) >= self.queue_size
+                            and not self._stop.is_set()
+                        ):
+                            self._condition.wait()
+                        if self._stop.is_set():
+                            return
+                    else:
+                        while len(self._queue) >= self.queue_size:
+                            self._queue.popleft()
+                            self.dropped += 1
+                    self._queue.append((index, (frame, image), due))
+                    self.released += 1
+                    self._condition.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                close()
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def __iter__(self):
+        self._thread = threading.Thread(
+            target=self._release, name="replay", daemon=True
+        )
+        self._thread.start()
+        try:
+            while True:
+                with self._condition:
+                    while len(self._queue) == 0 and not self._finished:
+                        self._condition.wait()
+                    if len(self._queue) == 0:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    index, item, due = self._queue.popleft()
+                    self._condition.notify_all()
+                yield index, item
+                # the loop has finished with the frame
+                self.latency.add(int((time.perf_counter() - due) * 1e9))
+                self.processed += 1
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the release of the frames"""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def get_stats(self):
+        """Get the statistics of the replay
+
+        Returns:
+            a dict with the number of frames released, processed, dropped and late, the max delay of a late release and the latency percentiles (p50, p90, p99 and max), in seconds
+        """
+        return {
+            "released": self.released,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "late": self.late,
+            "max_lag": self.max_lag,
+            "p50": self.latency.percentile(50) / 1e9,
+            "p90": self.latency.percentile(90) / 1e9,
+            "p99": self.latency.percentile(99) / 1e9,
+            "max": self.latency.max / 1e9,
+        }
+
+    def format_summary(self, states=None):
+        """Get the statistics as text
+
+        Args:
+            states (list): the tracking state of each frame, to count them. Defaults to None
+
+        Returns:
+            the text of the summary
+        """
+        stats = self.get_stats()
+        lines = [
+            "Replay at {}x, policy {}, queue of {} frames".format(
+                self.speed, self.policy, self.queue_size
+            ),
+            "frames: {} released, {} processed, {} dropped, {} late (max {:.1f}ms)".format(
+                stats["released"],
+                stats["processed"],
+                stats["dropped"],
+                stats["late"],
+                stats["max_lag"] * 1e3,
+            ),
+            "latency: p50 {:.1f}ms, p90 {:.1f}ms, p99 {:.1f}ms, max {:.1f}ms".format(
+                stats["p50"] * 1e3,
+                stats["p90"] * 1e3,
+                stats["p99"] * 1e3,
+                stats["max"] * 1e3,
+            ),
+        ]
+        if states is not None:
+            counts = Counter(str(state).replace("State.", "") for state in states)
+            lines.append(
+                "states: "
+                + ", ".join(
+                    f"{count} {state}" for state, count in sorted(counts.items())
+                )
+            )
+        return "\n".join(lines)
+
+    def save_summary(self, filename, states=None):
+        """Save the statistics, as format_summary, in a txt file"""
+        with open(filename, "w") as f:
+            f.write(self.format_summary(states) + "\n")
@@ -1,12 +1,18 @@
 import os
-import cv2
 import numpy as np
 import slampy
 import argparse
 import yaml
 from tqdm import tqdm
 from utils import *
-from kitti_odometry import KittiEvalOdom
+from datasets import DATASETS, open_dataset
+from prefetch import ImagePrefetcher, ProcessPrefetcher, VideoPrefetcher
+from artifact_writer import ArtifactWriter
+from depth_archive import DEPTH_ARCHIVE_EXT, DepthArchiveReader, DepthArchiveWriter
+from tracing import NULL_TRACER, Tracer
+from slam_daemon import SlamClient
+from online_eval import OnlineOdometryEval
+from replay import DROPPED, REPLAY_POLICIES, ReplayScheduler
 
 
 def run(args):
@@ -20,6 +26,19 @@ def run(args):
         raise ValueError(f"Cannot find setting file at {setting_file}")
     if args.pose_id < -1:
         raise ValueError(f"Pose index must be -1 or >0")
+    if args.replay and args.replay_policy != "block":
+        # the pose history holds only the processed frames, T-pose_id would not be a dataset frame
+        if args.pose_id > 0 or args.is_evaluate_pose:
+            raise ValueError(
+                f"The relative poses cannot be saved or evaluated with --replay_policy {args.replay_policy}, "
+                "that drops frames: use --pose_id -1 or --replay_policy block"
+            )
+    if args.reduction != 1:
+        if args.is_evaluate_depth:
+            raise ValueError(
+                f"The depths cannot be evaluated at 1/{args.reduction} of the resolution"
+            )
+        setting_file = write_reduced_settings(setting_file, args.reduction, args.dest)
 
     with open(args.settings) as fs:
         settings_yalm = yaml.safe_load(fs)
@@ -27,73 +46,225 @@ def run(args):
 
     print("Dataset selected: " + os.path.basename(args.dataset) + "\n")
 
-    app = slampy.System(setting_file, slampy.Sensor.MONOCULAR)
+    tracer = Tracer() if args.trace else NULL_TRACER
+    if args.daemon is not None:
+        app = SlamClient(
+            args.daemon, setting_file, slampy.Sensor.MONOCULAR, tracer=tracer
+        )
+        if app.reused:
+            print("The daemon has reused an initialized system")
+    else:
+        app = slampy.System(setting_file, slampy.Sensor.MONOCULAR, tracer=tracer)
 
     print("\n")
 
-    # TODO: generic loader an not KITTI one
-
-    if args.data_type == "TUM":
-        image_filenames, timestamps = load_images_TUM(args.dataset, "rgb.txt")
-    elif args.data_type == "KITTI_VO":
-        image_filenames, timestamps = load_images_KITTI_VO(args.dataset)
-    elif args.data_type == "OTHERS":
-        image_filenames, timestamps = load_images_OTHERS(args.dataset)
-
-    num_images = len(image_filenames)
+    dataset = open_dataset(
+        args.data_type, args.dataset, gray=args.gray, reduction=args.reduction
+    )
+    num_images = len(dataset)
 
     dest_depth = os.path.join(args.dest, "depth")
     dest_pose = os.path.join(args.dest, "pose")
 
-    create_dir(dest_depth)
+    if args.depth_format != "archive":
+        create_dir(dest_depth)
     create_dir(dest_pose)
 
+    depth_archive = None
+    if args.depth_format == "archive":
+        depth_archive = DepthArchiveWriter(
+            os.path.join(args.dest, "depth" + DEPTH_ARCHIVE_EXT)
+        )
+
+    gt_depth_archive = None
+    if args.is_evaluate_depth and args.gt_depth.endswith(DEPTH_ARCHIVE_EXT):
+        gt_depth_archive = DepthArchiveReader(args.gt_depth)
+
     states = []
     errors = []
 
-    with tqdm(total=num_images) as pbar:
-        for idx, image_name in enumerate(image_filenames):
-            # TODO: it is image loader duty to provide correct images
-            # image_name = image_name.replace(".png", ".jpg")
-            image = cv2.imread(image_name)
-            if image is None:
-                raise ValueError(f"failed to load image {image_name}")
+    if dataset.sequential:
+        # the frames of a video are decoded in order by a background thread
+        prefetcher = VideoPrefetcher(dataset, depth=args.prefetch_depth)
+    elif args.prefetch_processes:
+        # the decoding runs in other processes, it is not traced
+        prefetcher = ProcessPrefetcher(
+            dataset.references,
+            loader=dataset.loader,
+            depth=args.prefetch_depth,
+            workers=args.prefetch_workers,
+            max_bytes=args.prefetch_max_mb * 1024 * 1024,
+        )
+    else:
+        prefetcher = ImagePrefetcher(
+            dataset.references,
+            loader=tracer.wrap("decode", dataset.loader),
+            depth=args.prefetch_depth,
+            workers=args.prefetch_workers,
+            max_bytes=args.prefetch_max_mb * 1024 * 1024,
+        )
+
+    writer = ArtifactWriter(workers=args.writer_workers)
+
+    online_eval = None
+    if args.online_eval:
+        online_eval = OnlineOdometryEval(
+            args.gt_pose_txt,
+            args.align,
+            snapshot_every=args.online_eval_every,
+            snapshot_file=os.path.join(args.dest, "online_eval.txt"),
+            abort_ate=args.abort_ate,
+        )
+    pose_txt_path = os.path.join(args.dest, "pose.txt")
+
+    frames = enumerate(dataset.stream(prefetcher))
+    replay = None
+    if args.replay:
+        replay = ReplayScheduler(
+            dataset.stream(prefetcher),
+            speed=args.replay_speed,
+            policy=args.replay_policy,
+            queue_size=args.replay_queue_size,
+            copy=args.prefetch_processes and not dataset.sequential,
+        )
+        frames = replay
 
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-            state = app.process_image_mono(image, timestamps[idx])
+    with tqdm(total=num_images) as pbar:
+        for idx, (frame, image) in frames:
+            # the frames dropped by the replay have not been processed
+            states.extend([DROPPED] * (idx - len(states)))
+            tracer.begin_frame(idx)
+            state = app.process_image_mono(image, frame.timestamp)
 
             # NOTE: we buid a default invalid depth, in the case of system failure
             if state == slampy.State.OK:
-                depth = app.get_depth()
+                with tracer.span("get_depth"):
+                    if args.depth_format == "sparse":
+                        depth = app.get_sparse_depth()
+                    else:
+                        depth = app.get_depth()
                 pose_past_frame_to_current = app.get_pose_to_target(
                     precedent_frame=args.pose_id
                 )
-                name = os.path.splitext(os.path.basename(image_name))[0]
-
-                depth_path = os.path.join(dest_depth, name)
-                save_depth(depth_path, depth)
-
-                pose_path = os.path.join(dest_pose, name)
-                save_pose(pose_path, pose_past_frame_to_current)
+                name = os.path.splitext(os.path.basename(frame.reference))[0]
+
+                if depth_archive is not None:
+                    writer.submit(
+                        tracer.wrap("save_depth", depth_archive.append),
+                        depth,
+                        name,
+                        key=depth_archive.filename,
+                    )
+                elif args.depth_format == "sparse":
+                    depth_path = os.path.join(dest_depth, name)
+                    writer.submit(
+                        tracer.wrap("save_depth", save_sparse_depth), depth_path, depth
+                    )
+                else:
+                    depth_path = os.path.join(dest_depth, name)
+                    writer.submit(
+                        tracer.wrap("save_depth", save_depth), depth_path, depth
+                    )
+
+                # NOTE: the pose is None if the frame T-pose_id has not been tracked
+                if pose_past_frame_to_current is not None:
+                    pose_path = os.path.join(dest_pose, name)
+                    writer.submit(
+                        tracer.wrap("save_pose", save_pose),
+                        pose_path,
+                        pose_past_frame_to_current,
+                    )
 
                 curr_pose = app.get_pose_to_target(-1)
                 if curr_pose is not None:
-                    save_pose_txt(args, name, curr_pose)
+                    writer.submit(
+                        tracer.wrap("save_pose_txt", save_pose_txt),
+                        args,
+                        name,
+                        curr_pose,
+                        key=pose_txt_path,
+                    )
+                    if online_eval is not None:
+                        snapshot = online_eval.add(idx, curr_pose)
+                        if snapshot is not None:
+                            pbar.set_postfix(
+                                ate=snapshot["ate"], t_err=snapshot["t_err"] * 100
+                            )
 
                 if args.is_evaluate_depth:
-                    gt_file_path = os.path.join(args.gt_depth, "{}.png".format(name))
-                    err = get_error(args, name, depth, gt_file_path)
+                    if gt_depth_archive is not None:
+                        gt_file_path = gt_depth_archive[gt_depth_archive.index_of(name)]
+                    else:
+                        gt_file_path = os.path.join(
+                            args.gt_depth, "{}.png".format(name)
+                        )
+                    with tracer.span("get_error"):
+                        err = get_error(args, name, depth, gt_file_path)
                     errors.append(err)
 
+            tracer.end_frame()
             states.append(state)
-            pbar.update(1)
+            pbar.update(idx + 1 - pbar.n)
+
+            if online_eval is not None and online_eval.diverged:
+                print(
+                    "\nThe run has diverged at frame {}: ATE {:.2f}m is over {:.2f}m, stop it".format(
+                        idx, online_eval.snapshots[-1]["ate"], args.abort_ate
+                    )
+                )
+                break
 
         if args.is_evaluate_depth:
             mean_errors = np.array(errors).mean(0)
             save_results = os.path.join(args.dest, "results.txt")
             save_depth_err_results(save_results, "mean values", mean_errors)
 
+    if replay is not None:
+        replay.close()
+        states.extend([DROPPED] * (replay.released - len(states)))
+        replay.save_summary(os.path.join(args.dest, "replay.txt"), states)
+        print(replay.format_summary(states))
+
+    writer.close()
+    if depth_archive is not None:
+        depth_archive.close()
+    writer_stats = writer.get_stats()
+    print(
+        "Writer: {} jobs, mean write {:.2f}ms, mean latency {:.2f}ms, max queue depth {}".format(
+            writer_stats["jobs"],
+            writer_stats["mean_write_time"] * 1000,
+            writer_stats["mean_latency"] * 1000,
+            writer_stats["max_queue_depth"],
+        )
+    )
+
+    if online_eval is not None:
+        snapshot = online_eval.snapshot()
+        print(
+            "Online eval: {} poses, ATE {:.3f}m, t_err {:.2f}%, r_err {:.2f}deg/100m".format(
+                snapshot["frames"],
+                snapshot["ate"],
+                snapshot["t_err"] * 100,
+                snapshot["r_err"] / np.pi * 180 * 100,
+            )
+        )
+
+    prefetch_stats = prefetcher.get_stats()
+    print(
+        "Prefetch: {} frames, tracking waited on {} of them for {:.2f}s".format(
+            prefetch_stats["frames"],
+            prefetch_stats["starved"],
+            prefetch_stats["wait_time"],
+        )
+    )
+
+    if args.trace:
+        tracer.save_chrome_trace(os.path.join(args.dest, "trace.json"))
+        tracer.save_summary(os.path.join(args.dest, "trace_summary.txt"))
+        print(tracer.format_summary())
+
+    app.shutdown()
+
     # NOTE: final dump of log.txt file
     with open(os.path.join(args.dest, "log.txt"), "w") as f:
         for i, state in enumerate(states):
@@ -102,6 +273,8 @@ def run(args):
     if args.is_evaluate_pose:
         print("Begin to evaluate predicted pose")
         evaluate_pose(args)
+        from kitti_odometry import KittiEvalOdom
+
         eval_tool = KittiEvalOdom()
         eval_tool.eval(args)
 
@@ -114,7 +287,7 @@ parser.add_argument(
     "--dataset",
     type=str,
     default="/media/Datasets/KITTI_VO/dataset/sequences/10",
-    help="path to dataset",
+    help="path to dataset, or to the video file if the data type is VIDEO",
 )
 parser.add_argument(
     "--settings",
@@ -162,13 +335,13 @@ parser.add_argument(
     type=str,
     help="which dataset type",
     default="KITTI_VO",
-    choices=["TUM", "KITTI_VO", "KITTI", "OTHERS"],
+    choices=list(DATASETS),
 )
 
 parser.add_argument(
     "--gt_depth",
     type=str,
-    help="the gt depth files of the dataset",
+    help="the gt depth files of the dataset, as a directory of png files or a depth archive file",
     default="/media/Datasets/KITTI_VO_SGM/10/depth",
 )
 # /media/Datasets/TUM/freiburg3_convert/depth
@@ -199,6 +372,128 @@ parser.add_argument(
     "--named", type=str, help="the names for saving pose", default="kitty_vo_10"
 )
 
+parser.add_argument(
+    "--prefetch_depth",
+    type=int,
+    default=8,
+    help="how many images are decoded in advance? If 0, decode each image in the tracking loop",
+)
+
+parser.add_argument(
+    "--prefetch_workers",
+    type=int,
+    default=2,
+    help="number of threads used to decode the images",
+)
+
+parser.add_argument(
+    "--prefetch_max_mb",
+    type=int,
+    default=512,
+    help="max memory (in MB) used by the decoded images waiting to be processed",
+)
+
+parser.add_argument(
+    "--gray",
+    default=False,
+    action="store_true",
+    help="If set, decode the images in grayscale. The point clouds are colored in gray",
+)
+
+parser.add_argument(
+    "--reduction",
+    type=int,
+    default=1,
+    choices=[1, 2, 4, 8],
+    help="decode the images at 1/reduction of the resolution, the camera settings are rescaled in dest",
+)
+
+parser.add_argument(
+    "--prefetch_processes",
+    default=False,
+    action="store_true",
+    help="If set, decode the images in --prefetch_workers processes and pass them to the tracking through shared memory",
+)
+
+parser.add_argument(
+    "--replay",
+    default=False,
+    action="store_true",
+    help="If set, release the frames at their timestamps as a live camera, drop them when the tracking falls behind and save the latencies in replay.txt",
+)
+
+parser.add_argument(
+    "--replay_speed",
+    type=float,
+    default=1.0,
+    help="speed of the replay, 2 releases the frames twice as fast as they have been recorded",
+)
+
+parser.add_argument(
+    "--replay_policy",
+    type=str,
+    default="drop_oldest",
+    choices=REPLAY_POLICIES,
+    help="what is done with a new frame when the tracking falls behind: drop the oldest waiting frame, keep only the latest one or wait (no drops)",
+)
+
+parser.add_argument(
+    "--replay_queue_size",
+    type=int,
+    default=2,
+    help="max number of frames waiting for the tracking in the replay",
+)
+
+parser.add_argument(
+    "--writer_workers",
+    type=int,
+    default=2,
+    help="number of threads used to save depths and poses. If 0, save them in the tracking loop",
+)
+
+parser.add_argument(
+    "--online_eval",
+    default=False,
+    action="store_true",
+    help="If set, evaluate the poses against gt_pose_txt while they are produced, and save a snapshot of the metrics in online_eval.txt",
+)
+
+parser.add_argument(
+    "--online_eval_every",
+    type=int,
+    default=100,
+    help="number of poses between two snapshots of the online evaluation",
+)
+
+parser.add_argument(
+    "--abort_ate",
+    type=float,
+    default=None,
+    help="if set, stop the run when the ATE of an online evaluation snapshot is over this value (in meters)",
+)
+
+parser.add_argument(
+    "--trace",
+    default=False,
+    action="store_true",
+    help="If set, save the time spent in each stage of the loop in trace.json (Chrome trace format) and trace_summary.txt",
+)
+
+parser.add_argument(
+    "--depth_format",
+    type=str,
+    default="png",
+    choices=["png", "archive", "sparse"],
+    help="save the depths as one png file per frame, in a single depth archive file or as one npz file per frame with only the valid pixels",
+)
+
+parser.add_argument(
+    "--daemon",
+    type=str,
+    default=None,
+    help="the Unix socket of a running slam_daemon.py, if set the SLAM runs in the daemon and its initialized system is reused",
+)
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,262 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from collections import Counter
+from multiprocessing.connection import wait
+import yaml
+from run import parser as run_parser
+from run import run
+
+
+def load_sequences(config_file):
+    """Load the run.py arguments of each sequence from a yaml file
+
+    The file has an optional "defaults" dict, with the arguments shared by all
+    the sequences, and a "sequences" list, with the arguments of each sequence
+    (at least dataset and dest). The keys are the run.py options w/o the "--".
+
+    Usage example:
+        defaults:
+            settings: ./settings_kitty.yaml
+            data_type: KITTI_VO
+        sequences:
+            - dataset: /media/Datasets/KITTI_VO/dataset/sequences/00
+              dest: ./results_kitty_vo_00
+              named: kitty_vo_00
+
+    Args:
+        config_file (str): path to the yaml file
+
+    Returns:
+        the list of argparse.Namespace, one for each sequence
+
+    Raises:
+        ValueError: if an argument is not a run.py option
+    """
+    with open(config_file) as fs:
+        config = yaml.safe_load(fs)
+
+    defaults = config.get("defaults") or {}
+    sequences = []
+    for sequence in config["sequences"]:
+        args = run_parser.parse_args([])
+        for key, value in {**defaults, **sequence}.items():
+            if not hasattr(args, key):
+                raise ValueError(f"{key} is not an option of run.py")
+            setattr(args, key, value)
+        # the progress bars of many processes are not readable
+        args.is_bash = True
+        sequences.append(args)
+    return sequences
+
+
+def get_cpu_groups(workers, cpus_per_worker=None):
+    """Split the CPUs available to this process in a group for each worker
+
+    Args:
+        workers (int): the number of workers
+        cpus_per_worker (int): the number of CPUs of each group, None to split all of them. Defaults to None
+
+    Returns:
+        a list with the set of CPUs of each worker, None for each worker if the CPU affinity is not supported
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * workers
+    cpus = sorted(os.sched_getaffinity(0))
+    if cpus_per_worker is None:
+        cpus_per_worker = max(len(cpus) // workers, 1)
+    return [
+        set(cpus[(i * cpus_per_worker + j) % len(cpus)] for j in range(cpus_per_worker))
+        for i in range(workers)
+    ]
+
+
+def _run_sequence(args, cpus):
+    """Run a sequence in the worker process, with the output saved in dest/run_output.txt"""
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    os.makedirs(args.dest, exist_ok=True)
+    with open(os.path.join(args.dest, "run_output.txt"), "w") as output:
+        # redirect the file descriptors to get also the output of the SLAM backend
+        os.dup2(output.fileno(), 1)
+        os.dup2(output.fileno(), 2)
+        try:
+            run(args)
+        except Exception:
+            traceback.print_exc()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(1)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def read_states(log_path):
+    """Count the tracking states saved in the log.txt file of a run
+
+    Returns:
+        a Counter with the number of frames of each state (e.g. "OK"), empty if the file does not exist
+    """
+    states = Counter()
+    if os.path.exists(log_path):
+        with open(log_path) as f:
+            for line in f:
+                state = line.strip().split(": ", 1)[-1]
+                if state:
+                    states[state.replace("State.", "")] += 1
+    return states
+
+
+def run_sequences(sequences, workers, cpu_groups):
+    """Run each sequence in its own process, at most workers at the same time
+
+    Args:
+        sequences (list): the run.py arguments of each sequence
+        workers (int): the max number of processes running at the same time
+        cpu_groups (list): the set of CPUs of each worker (None for no pinning)
+
+    Returns:
+        a list with a dict for each sequence with name, dest, exitcode, time (s),
+        states (Counter from log.txt) and pose_result (the content of pose_result.txt, if any)
+
+    Raises:
+        ValueError: if workers is less than 1 and there are sequences to run
+    """
+    if workers < 1 and len(sequences) > 0:
+        raise ValueError(f"the number of workers must be at least 1, not {workers}")
+    # a new interpreter for each sequence, so the SLAM backends do not share any state
+    context = multiprocessing.get_context("spawn")
+    pending = list(range(len(sequences)))
+    running = {}  # sentinel: (process, sequence index, worker slot, start time)
+    free_slots = list(range(workers))
+    results = [None] * len(sequences)
+
+    while pending or running:
+        while pending and free_slots:
+            index, slot = pending.pop(0), free_slots.pop(0)
+            process = context.Process(
+                target=_run_sequence, args=(sequences[index], cpu_groups[slot])
+            )
+            process.start()
+            running[process.sentinel] = (process, index, slot, time.perf_counter())
+            print(f"started {sequences[index].dest} on worker {slot}")
+
+        for sentinel in wait(list(running)):
+            process, index, slot, t_start = running.pop(sentinel)
+            process.join()
+            free_slots.append(slot)
+            results[index] = _collect_result(
+                sequences[index], process.exitcode, time.perf_counter() - t_start
+            )
+            status = "done" if process.exitcode == 0 else "FAILED"
+            print(f"{status} {sequences[index].dest} in {results[index]['time']:.1f}s")
+    return results
+
+
+def _collect_result(args, exitcode, elapsed):
+    pose_result_path = os.path.join(args.dest, "pose_result.txt")
+    pose_result = None
+    if os.path.exists(pose_result_path):
+        with open(pose_result_path) as f:
+            pose_result = f.read()
+    return {
+        "name": args.named,
+        "dest": args.dest,
+        "exitcode": exitcode,
+        "time": elapsed,
+        "states": read_states(os.path.join(args.dest, "log.txt")),
+        "pose_result": pose_result,
+    }
+
+
+def write_report(results, report_path):
+    """Write the report of all the sequences in a txt file"""
+    with open(report_path, "w") as f:
+        for result in results:
+            frames = sum(result["states"].values())
+            tracked = result["states"]["OK"] / frames * 100 if frames > 0 else 0
+            f.write("Sequence: \t {} \n".format(result["name"]))
+            f.write("Output: \t {} \n".format(result["dest"]))
+            f.write(
+                "Status: \t {} \n".format(
+                    "ok"
+                    if result["exitcode"] == 0
+                    else f"failed ({result['exitcode']})"
+                )
+            )
+            f.write("Time (s): \t {:.1f} \n".format(result["time"]))
+            f.write("Frames: \t {} \n".format(frames))
+            f.write("Tracked (%): \t {:.1f} \n".format(tracked))
+            for state, count in sorted(result["states"].items()):
+                f.write("{}: \t {} \n".format(state, count))
+            if result["pose_result"] is not None:
+                f.write(result["pose_result"])
+            f.write("\n")
+
+
+def main(args):
+    sequences = load_sequences(args.config)
+    workers = min(args.workers, len(sequences))
+    if args.no_pin:
+        cpu_groups = [None] * workers
+    else:
+        cpu_groups = get_cpu_groups(workers, args.cpus_per_worker)
+
+    results = run_sequences(sequences, workers, cpu_groups)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    write_report(results, args.report)
+    print(f"report saved in {args.report}")
+    if any(result["exitcode"] != 0 for result in results):
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser(
+    description="Run the SLAM system on many sequences, each one in its own process"
+)
+
+parser.add_argument(
+    "--config",
+    type=str,
+    default="./sequences_kitti.yaml",
+    help="yaml file with the run.py arguments of each sequence",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="max number of sequences run at the same time",
+)
+parser.add_argument(
+    "--cpus_per_worker",
+    type=int,
+    default=None,
+    help="number of CPUs pinned to each worker, if not set the CPUs are split among the workers",
+)
+parser.add_argument(
+    "--no_pin",
+    default=False,
+    action="store_true",
+    help="If set, the workers are not pinned to the CPUs",
+)
+parser.add_argument(
+    "--report",
+    type=str,
+    default="./report.txt",
+    help="where do we save the report?",
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error(f"--workers must be at least 1, not {args.workers}")
+    if args.cpus_per_worker is not None and args.cpus_per_worker < 1:
+        parser.error(
+            f"--cpus_per_worker must be at least 1, not {args.cpus_per_worker}"
+        )
+    main(args)
@@ -0,0 +1,162 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# the offset of each image in a slot is aligned to this number of bytes
+_ALIGNMENT = 64
+
+
+def _aligned(size):
+    return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SharedFrameRing:
+    """This class is a ring of preallocated frame slots in a shared memory segment.
+
+    Each slot holds one frame, made of one or more images with fixed shape and
+    dtype (e.g. an image, a stereo pair or a color image and its depth) and the
+    sequence number of the frame that has been written in it. Frame `seq` goes in
+    slot `seq % slots`, the images are written in place by the producer and read
+    as ndarray views by the consumer, so a frame is never pickled or copied
+    between the processes.
+
+    The ring does not synchronize the processes, the producers must not write a
+    slot until the consumer has released it (see prefetch.ProcessPrefetcher).
+    The process that creates the ring owns the segment and unlinks it in close;
+    if it is killed, the segment is removed by the resource tracker of multiprocessing.
+
+    Usage example:
+        ring = SharedFrameRing([((370, 1226, 3), np.uint8)], slots=8)
+        ring.write(seq, [image])  # in a producer, attached with SharedFrameRing.attach(ring.spec)
+        image, = ring.read(seq)   # in the consumer
+        ring.close()
+    """
+
+    def __init__(self, part_specs, slots, name=None):
+        """Create the ring, or attach to an existing one if name is set
+
+        Args:
+            part_specs (list): (shape, dtype) of each image of a frame
+            slots (int): the number of frame slots
+            name (str): the name of an existing segment to attach, None to create a new one. Defaults to None
+        """
+        self.part_specs = [
+            (tuple(shape), np.dtype(dtype)) for shape, dtype in part_specs
+        ]
+        self.slots = slots
+        self.owner = name is None
+
+        offsets = []
+        slot_bytes = 0
+        for shape, dtype in self.part_specs:
+            offsets.append(slot_bytes)
+            slot_bytes += _aligned(int(np.prod(shape)) * dtype.itemsize)
+        header_bytes = _aligned(slots * 8)
+        size = header_bytes + slots * slot_bytes
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        # the sequence number written in each slot, -1 if the slot has not a valid frame
+        self.sequence = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self.sequence[:] = -1
+        self._views = [
+            [
+                np.ndarray(
+                    shape,
+                    dtype=dtype,
+                    buffer=self.shm.buf,
+                    offset=header_bytes + slot * slot_bytes + offset,
+                )
+                for (shape, dtype), offset in zip(self.part_specs, offsets)
+            ]
+            for slot in range(slots)
+        ]
+
+    @property
+    def spec(self):
+        """The arguments to attach to the ring from another process, see attach"""
+        return (
+            [(shape, dtype.str) for shape, dtype in self.part_specs],
+            self.slots,
+            self.shm.name,
+        )
+
+    @classmethod
+    def attach(cls, spec):
+        """Attach to the ring created by another process, from its spec"""
+        part_specs, slots, name = spec
+        return cls(part_specs, slots, name=name)
+
+    @property
+    def nbytes(self):
+        """The size of the shared segment"""
+        return self.shm.size
+
+    def write(self, seq, parts):
+        """Copy the images of frame seq in its slot
+
+        Args:
+            seq (int): the sequence number of the frame
+            parts (list): the images of the frame, with the shapes and the dtypes of part_specs
+
+        Raises:
+            ValueError: if an image does not match its spec
+        """
+        slot = seq % self.slots
+        if len(parts) != len(self.part_specs):
+            raise ValueError(
+                f"frame {seq} has {len(parts)} images, expected {len(self.part_specs)}"
+            )
+        for view, part in zip(self._views[slot], parts):
+            if part.shape != view.shape:
+                raise ValueError(
+                    f"frame {seq} has shape {part.shape}, expected {view.shape}"
+                )
+            np.copyto(view, part, casting="safe")
+        self.sequence[slot] = seq
+
+    def invalidate(self, seq):
+        """Mark the slot of frame seq as not valid (e.g. the frame has not been decoded)"""
+        self.sequence[seq % self.slots] = -1
+
+    def read(self, seq):
+        """Get the images of frame seq, as views of its slot
+
+        The views are valid until the slot is reused by frame seq + slots.
+
+        Returns:
+            the list of images, None if the slot does not hold frame seq
+        """
+        slot = seq % self.slots
+        if self.sequence[slot] != seq:
+            return None
+        return self._views[slot]
+
+    def close(self):
+        """Detach from the segment, and remove it if this process has created it
+
+        The views returned by read must not be used after close.
+        """
+        if self.shm is None:
+            return
+        self._views = None
+        self.sequence = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # a caller still holds a view, the memory is released with the last view
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,63 @@
+import os
+from glob import glob
+import numpy as np
+
+
+def sidecar_path(file_name):
+    """Get the path of the binary sidecar of a file, keyed on its size and mtime
+
+    The sidecar is next to the file, as .<file name>.<size>.<mtime>.npy, so it
+    changes whenever the file is rewritten.
+    """
+    stat = os.stat(file_name)
+    directory, base_name = os.path.split(os.path.abspath(file_name))
+    return os.path.join(
+        directory, ".{}.{}.{}.npy".format(base_name, stat.st_size, stat.st_mtime_ns)
+    )
+
+
+def save_sidecar(file_name, cache_path, data):
+    """Save the sidecar of a file and remove its stale ones, skip it if the directory is read-only
+
+    The array is written in a temporary file and moved in place, so a concurrent
+    reader never sees a partial sidecar.
+
+    Args:
+        file_name (str): the parsed file
+        cache_path (str): the path of the sidecar, from sidecar_path
+        data (ndarray): the array to save
+    """
+    directory, base_name = os.path.split(os.path.abspath(file_name))
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp_path, cache_path)
+        for old_cache in glob(os.path.join(directory, ".{}.*.npy".format(base_name))):
+            if old_cache != cache_path:
+                os.remove(old_cache)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_cached(file_name, parse, use_cache=True, mmap_mode=None):
+    """Get the array parsed from a text file, through its binary sidecar
+
+    Args:
+        file_name (str): the file to parse
+        parse (callable): the function that parses the file, it gets file_name and returns an ndarray
+        use_cache (bool): if true, read the sidecar if it exists, otherwise write it. Defaults to True
+        mmap_mode (str): the mode of np.load for the sidecar, None to read it in memory. Defaults to None
+
+    Returns:
+        the parsed array
+    """
+    if not use_cache:
+        return parse(file_name)
+    cache_path = sidecar_path(file_name)
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode=mmap_mode)
+    data = parse(file_name)
+    save_sidecar(file_name, cache_path, data)
+    return data
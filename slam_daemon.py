@@ -0,0 +1,484 @@
+import argparse
+import json
+import os
+import socket
+import struct
+import threading
+from collections import Counter, defaultdict
+from enum import Enum
+import numpy as np
+import slampy
+from tracing import NULL_TRACER
+
+# the length of the json header of a message, the ndarray payloads follow the header
+_HEADER_SIZE = struct.Struct("!I")
+
+# the System methods and properties that a client can use
+REMOTE_METHODS = {
+    "process_image_mono",
+    "process_image_stereo",
+    "process_image_imu_mono",
+    "process_image_imu_stereo",
+    "process_image_rgbd",
+    "get_pose_to_target",
+    "get_pose_from_target",
+    "get_abs_cloud",
+    "get_global_map",
+    "get_point_cloud",
+    "get_point_cloud_colored",
+    "get_depth",
+    "get_sparse_depth",
+    "get_camera_matrix",
+    "get_state",
+    "get_cache_stats",
+    "pose_array",
+    "reset",
+}
+
+_ENUMS = {"State": slampy.State, "Sensor": slampy.Sensor}
+
+
+def _encode(value, arrays):
+    """Convert a value in a json object, the ndarrays are appended to `arrays` and replaced by their index"""
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject or value.dtype.fields is not None:
+            raise ValueError(f"the dtype {value.dtype} can not be sent")
+        arrays.append(np.ascontiguousarray(value))
+        return {"__ndarray__": len(arrays) - 1}
+    if isinstance(value, Enum):
+        return {"__enum__": type(value).__name__, "name": value.name}
+    if isinstance(value, slampy.SparseDepth):
+        return {"__sparse_depth__": [_encode(field, arrays) for field in value]}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(item, arrays) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item, arrays) for item in value]
+    if isinstance(value, dict):
+        return {"__dict__": {str(k): _encode(v, arrays) for k, v in value.items()}}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode(value, arrays):
+    """Inverse of _encode"""
+    if isinstance(value, list):
+        return [_decode(item, arrays) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "__ndarray__" in value:
+        return arrays[value["__ndarray__"]]
+    if "__enum__" in value:
+        return _ENUMS[value["__enum__"]][value["name"]]
+    if "__sparse_depth__" in value:
+        u, v, z, shape = _decode(value["__sparse_depth__"], arrays)
+        return slampy.SparseDepth(u, v, z, tuple(shape))
+    if "__tuple__" in value:
+        return tuple(_decode(value["__tuple__"], arrays))
+    return {k: _decode(v, arrays) for k, v in value["__dict__"].items()}
+
+
+def send_message(sock, header, arrays=()):
+    """Send a message: the length of the json header, the header and the raw bytes of the arrays
+
+    The header gets the dtype and the shape of each array, so the receiver can
+    rebuild them without any pickle.
+
+    Args:
+        sock (socket.socket): the connected socket
+        header (dict): a json serializable dict
+        arrays (list): the contiguous ndarrays sent after the header. Defaults to ()
+    """
+    header = dict(header)
+    header["arrays"] = [[array.dtype.str, array.shape] for array in arrays]
+    data = json.dumps(header).encode()
+    sock.sendall(_HEADER_SIZE.pack(len(data)) + data)
+    for array in arrays:
+        if array.nbytes > 0:
+            sock.sendall(array.reshape(-1).view(np.uint8))
+
+
+def _recv_exact(sock, size):
+    """Read exactly size bytes, None if the connection is closed before the first byte"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise ConnectionError("the connection has been closed in a message")
+        received += count
+    return buffer
+
+
+def recv_message(sock):
+    """Receive a message sent by send_message
+
+    Returns:
+        the header and the list of arrays, (None, None) if the connection has been closed
+    """
+    size = _recv_exact(sock, _HEADER_SIZE.size)
+    if size is None:
+        return None, None
+    header = json.loads(_recv_exact(sock, _HEADER_SIZE.unpack(size)[0]))
+    arrays = []
+    for dtype, shape in header.pop("arrays"):
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        data = _recv_exact(sock, nbytes) if nbytes > 0 else bytearray()
+        arrays.append(np.frombuffer(data, dtype=dtype).reshape(shape))
+    return header, arrays
+
+
+class SlamDaemon:
+    """This class keeps initialized SLAM systems alive and serves them to the clients over a Unix socket.
+
+    Each client connection opens a session on a settings file and a sensor type.
+    The session gets an idle System built for the same settings (the file path and
+    its modification time) and sensor, or a new one if there is none, and it is the
+    only user of the System until it is closed. On close, or when the client
+    disconnects, the System is reset and kept for the next session, so the
+    vocabulary loading and the initialization of the method are paid only once.
+
+    The messages are a json header followed by the raw bytes of the ndarrays
+    (see send_message), the clients can call only the methods in REMOTE_METHODS.
+
+    Usage example:
+        daemon = SlamDaemon("/tmp/slampy.sock")
+        daemon.preload("settings_kitty.yaml", slampy.Sensor.MONOCULAR)
+        daemon.serve_forever()
+    """
+
+    def __init__(self, socket_path, max_idle=1):
+        """Build the daemon
+
+        Args:
+            socket_path (str): path of the Unix socket
+            max_idle (int): the max number of idle systems kept for each settings and sensor, the others are shut down. Defaults to 1
+        """
+        self.socket_path = socket_path
+        self.max_idle = max_idle
+        self.stats = Counter()
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(params_file, sensor_type):
+        params_file = os.path.realpath(params_file)
+        return (params_file, os.stat(params_file).st_mtime_ns, sensor_type.name)
+
+    def preload(self, params_file, sensor_type):
+        """Build a System and keep it idle, so the first session does not wait for it"""
+        key = self._key(params_file, sensor_type)
+        self.release(key, self._build(params_file, sensor_type))
+
+    def _build(self, params_file, sensor_type):
+        system = slampy.System(params_file, sensor_type)
+        with self._lock:
+            self.stats["built"] += 1
+        return system
+
+    def acquire(self, params_file, sensor_type):
+        """Get an idle System for the settings and the sensor, or build a new one
+
+        Returns:
+            the key of the System, to release it, the System and true if it has been reused
+        """
+        key = self._key(params_file, sensor_type)
+        with self._lock:
+            if self._idle[key]:
+                self.stats["reused"] += 1
+                return key, self._idle[key].pop(), True
+        return key, self._build(params_file, sensor_type), False
+
+    def release(self, key, system):
+        """Reset a System and keep it for the next session, or shut it down if there are already max_idle of them"""
+        system.reset()
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(system)
+                return
+        system.shutdown()
+
+    def get_stats(self):
+        """Get the number of systems built, reused and idle and the number of sessions opened"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["idle"] = sum(len(systems) for systems in self._idle.values())
+        for name in ("built", "reused", "sessions"):
+            stats.setdefault(name, 0)
+        return stats
+
+    def serve_forever(self):
+        """Accept the clients, each one on its own thread, until stop is called"""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"a daemon is already running on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)
+            finally:
+                probe.close()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        server.settimeout(0.2)
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                threading.Thread(
+                    target=self._serve_client, args=(conn,), daemon=True
+                ).start()
+        finally:
+            server.close()
+            os.remove(self.socket_path)
+            with self._lock:
+                idle = [system for systems in self._idle.values() for system in systems]
+                self._idle.clear()
+            for system in idle:
+                system.shutdown()
+
+    def stop(self):
+        """Stop serve_forever, the open sessions are not interrupted"""
+        self._stop.set()
+
+    def _serve_client(self, conn):
+        session = None  # (key, System)
+        try:
+            while True:
+                header, arrays = recv_message(conn)
+                if header is None:
+                    break
+                try:
+                    reply, reply_arrays = self._handle(header, arrays, session)
+                    if header["cmd"] == "open":
+                        session = reply.pop("session")
+                    elif header["cmd"] == "close":
+                        session = None
+                except Exception as e:
+                    reply, reply_arrays = (
+                        {"ok": False, "error": f"{type(e).__name__}: {e}"},
+                        [],
+                    )
+                send_message(conn, reply, reply_arrays)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+            if session is not None:
+                self.release(*session)
+
+    def _handle(self, header, arrays, session):
+        """Run a command of a client
+
+        Returns:
+            the reply header and its arrays
+        """
+        cmd = header["cmd"]
+        if cmd == "open":
+            if session is not None:
+                raise RuntimeError("a session is already open on this connection")
+            key, system, reused = self.acquire(
+                header["settings"], slampy.Sensor[header["sensor"]]
+            )
+            with self._lock:
+                self.stats["sessions"] += 1
+            return {"ok": True, "reused": reused, "session": (key, system)}, []
+        if cmd == "call":
+            if session is None:
+                raise RuntimeError("no session is open on this connection")
+            method = header["method"]
+            if method not in REMOTE_METHODS:
+                raise ValueError(f"{method} can not be called by a client")
+            value = getattr(session[1], method)
+            if callable(value):
+                value = value(
+                    *_decode(header["args"], arrays),
+                    **_decode(header["kwargs"], arrays),
+                )
+            reply_arrays = []
+            return {"ok": True, "result": _encode(value, reply_arrays)}, reply_arrays
+        if cmd == "close":
+            if session is not None:
+                self.release(*session)
+            return {"ok": True}, []
+        if cmd == "stats":
+            return {"ok": True, "stats": self.get_stats()}, []
+        if cmd == "stop":
+            self.stop()
+            return {"ok": True}, []
+        raise ValueError(f"unknown command {cmd}")
+
+
+def _request(sock, header, arrays=()):
+    """Send a command and wait for its reply, raise an Exception if the daemon has failed"""
+    send_message(sock, header, arrays)
+    reply, reply_arrays = recv_message(sock)
+    if reply is None:
+        raise ConnectionError("the daemon has closed the connection")
+    if not reply["ok"]:
+        raise Exception(reply["error"])
+    return reply, reply_arrays
+
+
+def _remote_method(name, span=None):
+    """Get a SlamClient method that runs the System method `name` in the daemon"""
+
+    def method(self, *args, **kwargs):
+        arrays = []
+        header = {
+            "cmd": "call",
+            "method": name,
+            "args": _encode(list(args), arrays),
+            "kwargs": _encode(kwargs, arrays),
+        }
+        with self.tracer.span(span or name):
+            reply, reply_arrays = _request(self.sock, header, arrays)
+        return _decode(reply["result"], reply_arrays)
+
+    method.__name__ = name
+    method.__doc__ = f"Run System.{name} in the daemon, see slampy.System"
+    return method
+
+
+class SlamClient:
+    """This class opens a session on a SlamDaemon and exposes the same methods of slampy.System.
+
+    The arrays are sent as raw bytes, so an image costs a copy through the socket
+    and no serialization.
+
+    Usage example:
+        app = SlamClient("/tmp/slampy.sock", "settings_kitty.yaml", slampy.Sensor.MONOCULAR)
+        state = app.process_image_mono(image, tframe)
+        pose = app.get_pose_to_target()
+        app.shutdown()
+    """
+
+    def __init__(self, socket_path, params_file, sensor_type, tracer=None):
+        """Connect to the daemon and open a session
+
+        Args:
+            socket_path (str): path of the Unix socket of the daemon
+            params_file (str): the Path to the .yaml file, it is read by the daemon
+            sensor_type (Enum): the sensort type of the SLAM
+            tracer (Tracer): the tracer that measures the remote calls, None to disable the tracing. Defaults to None
+        """
+        self.tracer = NULL_TRACER if tracer is None else tracer
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        reply, _ = _request(
+            self.sock,
+            {
+                "cmd": "open",
+                "settings": os.path.abspath(params_file),
+                "sensor": sensor_type.name,
+            },
+        )
+        # true if the daemon has given an already initialized system
+        self.reused = reply["reused"]
+
+    process_image_mono = _remote_method("process_image_mono", "track")
+    process_image_stereo = _remote_method("process_image_stereo", "track")
+    process_image_imu_mono = _remote_method("process_image_imu_mono", "track")
+    process_image_imu_stereo = _remote_method("process_image_imu_stereo", "track")
+    process_image_rgbd = _remote_method("process_image_rgbd", "track")
+    get_pose_to_target = _remote_method("get_pose_to_target")
+    get_pose_from_target = _remote_method("get_pose_from_target")
+    get_abs_cloud = _remote_method("get_abs_cloud")
+    get_global_map = _remote_method("get_global_map")
+    get_point_cloud = _remote_method("get_point_cloud")
+    get_point_cloud_colored = _remote_method("get_point_cloud_colored")
+    get_depth = _remote_method("get_depth")
+    get_sparse_depth = _remote_method("get_sparse_depth")
+    get_camera_matrix = _remote_method("get_camera_matrix")
+    get_state = _remote_method("get_state")
+    get_cache_stats = _remote_method("get_cache_stats")
+    pose_array = property(_remote_method("pose_array"))
+    reset = _remote_method("reset")
+
+    def get_daemon_stats(self):
+        """Get the stats of the daemon, see SlamDaemon.get_stats"""
+        return _request(self.sock, {"cmd": "stats"})[0]["stats"]
+
+    def shutdown(self):
+        """Close the session, the daemon resets the system and keeps it for the next session"""
+        if self.sock is None:
+            return
+        try:
+            _request(self.sock, {"cmd": "close"})
+        finally:
+            self.sock.close()
+            self.sock = None
+
+
+def stop_daemon(socket_path):
+    """Ask the daemon listening on socket_path to stop"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        _request(sock, {"cmd": "stop"})
+
+
+def main(args):
+    daemon = SlamDaemon(args.socket, args.max_idle)
+    for params_file, sensor in args.preload or []:
+        print(f"Preload {params_file} ({sensor})")
+        daemon.preload(params_file, slampy.Sensor[sensor])
+    print(f"Serving on {args.socket}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("Daemon stopped: {}".format(daemon.get_stats()))
+
+
+parser = argparse.ArgumentParser(
+    description="Keep the SLAM systems initialized and serve them to the runners over a Unix socket"
+)
+
+parser.add_argument(
+    "--socket",
+    type=str,
+    default="/tmp/slampy.sock",
+    help="path of the Unix socket",
+)
+
+parser.add_argument(
+    "--max_idle",
+    type=int,
+    default=1,
+    help="max number of idle systems kept for each settings file and sensor",
+)
+
+parser.add_argument(
+    "--preload",
+    type=str,
+    nargs=2,
+    action="append",
+    metavar=("SETTINGS", "SENSOR"),
+    help="build a system for this settings file and sensor (e.g. MONOCULAR) at startup, can be repeated",
+)
+
+parser.add_argument(
+    "--stop",
+    default=False,
+    action="store_true",
+    help="If set, stop the daemon running on --socket and exit",
+)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    if args.stop:
+        stop_daemon(args.socket)
+    else:
+        main(args)
@@ -0,0 +1,105 @@
+import sys
+import time
+
+sys.path.append("..")
+from slampy import Sensor
+from slampy import State
+import numpy as np
+
+
+class Slam:
+    """A deterministic SLAM method, without any compiled dependency, to test and benchmark the wrapper.
+
+    The camera moves forward along a smooth curve, by Mock.step meters at each frame,
+    and it sees the same Mock.map_size points, placed in front of it, in every frame.
+    The first Mock.init_frames frames are NOT_INITIALIZED and, if Mock.lost_every is
+    greater than 0, a frame every Mock.lost_every is LOST. The images are not used,
+    so the poses, the states and the points depend only on the number of processed frames.
+    Mock.init_time seconds are spent in the construction, to stand in for the loading
+    of the vocabulary of a real method.
+    """
+
+    def __init__(self, params, sensor_type):
+        self.sensor_type = sensor_type
+        self.map_size = params.get("Mock.map_size", 5000)
+        self.init_frames = params.get("Mock.init_frames", 2)
+        self.lost_every = params.get("Mock.lost_every", 0)
+        self.step = params.get("Mock.step", 1.0)
+        self.track_time = params.get("Mock.track_time", 0.0)
+        self.camera_matrix = np.array(
+            [
+                [params.get("Mock.fx", 718.856), 0.0, params.get("Mock.cx", 607.19)],
+                [0.0, params.get("Mock.fy", 718.856), params.get("Mock.cy", 185.22)],
+                [0.0, 0.0, 1.0],
+            ]
+        )
+
+        # the points in the camera reference frame, the same in every frame
+        rng = np.random.default_rng(params.get("Mock.seed", 0))
+        z = rng.uniform(2.0, 60.0, self.map_size)
+        x = rng.uniform(-0.8, 0.8, self.map_size) * z
+        y = rng.uniform(-0.25, 0.25, self.map_size) * z
+        self.local_points = np.stack((x, y, z), axis=1)
+        time.sleep(params.get("Mock.init_time", 0.0))
+        self.reset()
+
+    def _process(self, sensor_types):
+        if self.sensor_type not in sensor_types:
+            raise Exception(f"The sensor type is not {sensor_types[0].name}")
+        self.frame += 1
+        time.sleep(self.track_time)
+
+        if self.frame <= self.init_frames:
+            self.state = State.NOT_INITIALIZED
+        elif self.lost_every > 0 and self.frame % self.lost_every == 0:
+            self.state = State.LOST
+        else:
+            self.state = State.OK
+
+        heading = 0.3 * np.sin(self.frame * 0.01)
+        self.position = self.position + self.step * np.array(
+            [np.sin(heading), 0.0, np.cos(heading)]
+        )
+        self.pose = np.eye(4)
+        self.pose[0, 0] = self.pose[2, 2] = np.cos(heading)
+        self.pose[0, 2] = np.sin(heading)
+        self.pose[2, 0] = -np.sin(heading)
+        self.pose[:3, 3] = self.position
+
+    def process_image_mono(self, image, tframe):
+        self._process([Sensor.MONOCULAR, Sensor.MONOCULAR_IMU])
+
+    def process_image_stereo(self, image_left, image_right, tframe):
+        self._process([Sensor.STEREO, Sensor.STEREO_IMU])
+
+    def process_image_imu_mono(self, image, tframe, imu):
+        self._process([Sensor.MONOCULAR_IMU])
+
+    def process_image_imu_stereo(self, image_left, image_right, tframe, imu):
+        self._process([Sensor.STEREO_IMU])
+
+    def process_image_rgbd(self, image, tframe):
+        self._process([Sensor.RGBD])
+
+    def get_pose_to_target(self):
+        if self.state == State.OK:
+            return self.pose.copy()
+
+    def get_abs_cloud(self):
+        if self.state == State.OK:
+            return self.local_points @ self.pose[:3, :3].T + self.pose[:3, 3]
+
+    def get_camera_matrix(self):
+        return self.camera_matrix
+
+    def get_state(self):
+        return self.state
+
+    def reset(self):
+        self.frame = 0
+        self.state = State.SYSTEM_NOT_READY
+        self.position = np.zeros(3)
+        self.pose = np.eye(4)
+
+    def shutdown(self):
+        pass
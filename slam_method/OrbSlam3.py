@@ -98,13 +98,14 @@ class Slam:
         return self.slam.get_camera_matrix()
 
     def get_state(self):
-        if self.slam.get_tracking_state() == orbslam3.TrackingState.OK:
+        tracking_state = self.slam.get_tracking_state()
+        if tracking_state == orbslam3.TrackingState.OK:
             return State.OK
-        elif self.slam.get_tracking_state() == orbslam3.TrackingState.LOST:
+        elif tracking_state == orbslam3.TrackingState.LOST:
             return State.LOST
-        elif self.slam.get_tracking_state() == orbslam3.TrackingState.NOT_INITIALIZED:
+        elif tracking_state == orbslam3.TrackingState.NOT_INITIALIZED:
             return State.NOT_INITIALIZED
-        elif self.slam.get_tracking_state() == orbslam3.TrackingState.SYSTEM_NOT_READY:
+        elif tracking_state == orbslam3.TrackingState.SYSTEM_NOT_READY:
             return State.SYSTEM_NOT_READY
         else:
             return State.LOST
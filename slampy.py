@@ -1,7 +1,11 @@
+from collections import Counter, namedtuple
 from enum import Enum
 import numpy as np
 import importlib
 import yaml
+from pose_history import PoseHistory, inverse_pose
+from tracing import NULL_TRACER
+from voxel_map import VoxelMap
 
 
 class Sensor(Enum):
@@ -36,15 +40,46 @@ class State(Enum):
     SYSTEM_NOT_READY = 4
 
 
+# the layout of the array returned by System._project_cloud
+PROJECTION_DTYPE = np.dtype(
+    [
+        ("xyz", np.float64, (3,)),
+        ("uv", np.int64, (2,)),
+        ("depth", np.float64),
+        ("index", np.int64),
+    ]
+)
+
+
+class SparseDepth(namedtuple("SparseDepth", ["u", "v", "z", "shape"])):
+    """The depth of the valid pixels of an image
+
+    Attributes:
+        u: ndarray with the column of each valid pixel
+        v: ndarray with the row of each valid pixel
+        z: ndarray with the depth of each valid pixel
+        shape: the (height, width) of the image
+    """
+
+    __slots__ = ()
+
+    def to_dense(self):
+        """Get the depth as an array of the image shape, with -1 where the depth is not aviable"""
+        depth = np.full(self.shape, -1.0)
+        depth[self.v, self.u] = self.z
+        return depth
+
+
 class System:
     """This class is a wrapper for the SLAM method in the slam_method folder,"""
 
-    def __init__(self, params_file, sensor_type):
+    def __init__(self, params_file, sensor_type, tracer=None):
         """Build the wrapper
 
         Args:
             params_file (str): the Path to the .yaml file.
             sensor_type (Enum): the sensort type of the SLAM
+            tracer (Tracer): the tracer that measures the tracking and the getters, None to disable the tracing. Defaults to None
         """
         # read and process the config file
         with open(params_file) as fs:
@@ -52,9 +87,28 @@ class System:
 
         module = importlib.import_module("slam_method." + self.params["SLAM.alg"])
         self.slam = module.Slam(self.params, sensor_type)
-        self.pose_array = []  # is an array that contains the pose stored by the SLAM
-
-    def process_image_mono(self, image, tframe):
+        self.tracer = NULL_TRACER if tracer is None else tracer
+        # the pose, timestamp and state of every processed frame
+        self.pose_history = PoseHistory(
+            max_frames=self.params.get("System.pose_history_size")
+        )
+        # the voxel map of the points seen in the tracked frames, if it is enabled
+        self.global_map = None
+        if self.params.get("System.map_voxel_size") is not None:
+            self.global_map = VoxelMap(
+                self.params["System.map_voxel_size"],
+                self.params.get("System.map_max_points"),
+            )
+
+        # per-frame memoization of the values read from the SLAM method, it is
+        # cleared every time that a new frame is processed or the system is reset
+        self.frame_id = 0
+        self._frame_cache = {}
+        self._color_image = None
+        self.cache_hits = Counter()
+        self.cache_misses = Counter()
+
+    def process_image_mono(self, image, tframe, color_image=None):
         """Process an image mono.
 
         Note: it works only if the sensor type is MONOCULAR
@@ -62,6 +116,7 @@ class System:
         Args:
             image : ndarray of the image
             tframe (float): the timestamp when the image was capture
+            color_image: the RGB image of the frame, or a function without arguments that loads it, used only by get_point_cloud_colored. None to use the processed image. Defaults to None
 
         Returns:
             the state of the traking in this frame
@@ -69,14 +124,15 @@ class System:
         Raises:
             Exception: if the sensor type is different from MONOCULAR
         """
+        self._new_frame(color_image)
         self.image_shape = image.shape
-        self.slam.process_image_mono(image, tframe)
+        with self.tracer.span("track"):
+            self.slam.process_image_mono(image, tframe)
         self.image = image
-        if self.get_state() == State.OK:
-            self.pose_array.append(self.get_pose_to_target())
+        self._record_frame(tframe)
         return self.get_state()
 
-    def process_image_stereo(self, image_left, image_right, tframe):
+    def process_image_stereo(self, image_left, image_right, tframe, color_image=None):
         """Process a stereo pair.
 
         Note: it works only if the sensor type is STEREO
@@ -85,6 +141,7 @@ class System:
             image_left (ndarray) : left image as HxWx3
             image_right (ndarray) : right image as HxWx3
             tframe (float): the timestamp when the image was capture
+            color_image: the RGB image of the frame, or a function without arguments that loads it, used only by get_point_cloud_colored. None to use the processed image. Defaults to None
 
         Returns:
             the state of the traking in this frame
@@ -92,14 +149,15 @@ class System:
         Raises:
             Exception: if the sensor type is different from STEREO
         """
+        self._new_frame(color_image)
         self.image_shape = image_left.shape
-        self.slam.process_image_stereo(image_left, image_right, tframe)
+        with self.tracer.span("track"):
+            self.slam.process_image_stereo(image_left, image_right, tframe)
         self.image = image_left
-        if self.get_state() == State.OK:
-            self.pose_array.append(self.get_pose_to_target())
+        self._record_frame(tframe)
         return self.get_state()
 
-    def process_image_imu_mono(self, image, tframe, imu):
+    def process_image_imu_mono(self, image, tframe, imu, color_image=None):
         """Process an image mono with the imu data.
 
         Note: it works only if the sensor type is MONOCULAR_IMU
@@ -108,6 +166,7 @@ class System:
             image (ndarray): image as HxWx3
             tframe (float): the timestamp when the image was capture
             imu : the imu data stored in an float array in the form of [ AccX ,AccY ,AccZ, GyroX, vGyroY, vGyroZ, Timestamp]
+            color_image: the RGB image of the frame, or a function without arguments that loads it, used only by get_point_cloud_colored. None to use the processed image. Defaults to None
 
         Returns:
             the state of the traking in this frame
@@ -115,14 +174,17 @@ class System:
         Raises:
             Exception: if the sensor type is different from MONOCULAR_IMU
         """
+        self._new_frame(color_image)
         self.image_shape = image.shape
-        self.slam.process_image_imu_mono(image, tframe, imu)
+        with self.tracer.span("track"):
+            self.slam.process_image_imu_mono(image, tframe, imu)
         self.image = image
-        if self.get_state() == State.OK:
-            self.pose_array.append(self.get_pose_to_target())
+        self._record_frame(tframe)
         return self.get_state()
 
-    def process_image_imu_stereo(self, image_left, image_right, tframe, imu):
+    def process_image_imu_stereo(
+        self, image_left, image_right, tframe, imu, color_image=None
+    ):
         """Process an image stereo with the imu data.
 
         Note: it work only if the sensor type is STEREO_IMU
@@ -132,6 +194,7 @@ class System:
             image_right (ndarray) : right image as HxWx3
             tframe (float): the timestamp when the image was capture
             imu : the imu data stored in an float array in the form of [ AccX ,AccY ,AccZ, GyroX, vGyroY, vGyroZ, Timestamp]
+            color_image: the RGB image of the frame, or a function without arguments that loads it, used only by get_point_cloud_colored. None to use the processed image. Defaults to None
 
         Returns:
             the state of the traking in this frame
@@ -139,14 +202,15 @@ class System:
         Raises:
             Exception: if the sensor type is different from STEREO_IMU
         """
+        self._new_frame(color_image)
         self.image_shape = image_left.shape
-        self.slam.process_image_imu_stereo(image_left, image_right, tframe, imu)
+        with self.tracer.span("track"):
+            self.slam.process_image_imu_stereo(image_left, image_right, tframe, imu)
         self.image = image_left
-        if self.get_state() == State.OK:
-            self.pose_array.append(self.get_pose_to_target())
+        self._record_frame(tframe)
         return self.get_state()
 
-    def process_image_rgbd(self, image, tframe):
+    def process_image_rgbd(self, image, tframe, color_image=None):
         """Process an  rgbd image.
 
         Note: it works only if the sensor type is RGBD
@@ -154,6 +218,7 @@ class System:
         Args:
             image (ndarray): RGBD image as HxWx4
             tframe (float): the timestamp when the image was capture
+            color_image: the RGB image of the frame, or a function without arguments that loads it, used only by get_point_cloud_colored. None to use the processed image. Defaults to None
 
         Returns:
             the new state of the SLAM system
@@ -162,11 +227,12 @@ class System:
             Exception: if the sensor type is different from RGBD
 
         """
+        self._new_frame(color_image)
         self.image_shape = image.shape
-        self.slam.process_image_rgbd(image, tframe)
+        with self.tracer.span("track"):
+            self.slam.process_image_rgbd(image, tframe)
         self.image = image
-        if self.get_state() == State.OK:
-            self.pose_array.append(self.get_pose_to_target())
+        self._record_frame(tframe)
         return self.get_state()
 
     def get_pose_to_target(self, precedent_frame=-1):
@@ -192,22 +258,23 @@ class System:
 
         """
         if self.get_state() == State.OK:
+            pose = self._cached("pose", self.slam.get_pose_to_target)
             if precedent_frame <= 0:
-                return self.slam.get_pose_to_target()
+                return pose
             else:
-                # get_pose_to_target = pose 0->T
-                # inv(0->T-precedent_frame) = pose T-precedent_frame to 0
-                # pose T-precedent_frame->T = 0->T * (T-1 -> 0)
-                return np.dot(
-                    self.slam.get_pose_to_target(),
-                    np.linalg.inv(self.pose_array[-precedent_frame]),
+                # pose T-precedent_frame->T = 0->T * (T-precedent_frame -> 0)
+                current_frame = len(self.pose_history) - 1
+                return self.pose_history.get_relative_pose(
+                    current_frame - precedent_frame, current_frame
                 )
         return None
 
     def get_pose_from_target(self):
         """Get the pose from the current frame T to the reference one 0."""
         if self.get_state() == State.OK:
-            return np.linalg.inv(self.slam.get_pose_to_target())
+            return self._cached(
+                "inverse_pose", lambda: inverse_pose(self.get_pose_to_target())
+            )
         return None
 
     def get_abs_cloud(self):
@@ -218,18 +285,30 @@ class System:
 
         """
         if self.get_state() == State.OK:
-            return self.slam.get_abs_cloud()
+            return self._cached("cloud", self.slam.get_abs_cloud)
         return None
 
+    def get_global_map(self):
+        """Get the map of the points seen in all the tracked frames, merged in voxels (see VoxelMap.export)
+
+        Return:
+            the points in absolute coordinates, their RGB colors and the number of points merged in each voxel, None if the map is not enabled
+
+        """
+        if self.global_map is None:
+            return None
+        return self.global_map.export()
+
     def get_point_cloud(self):
         """Get the point cloud at the current frame form the wiev of the current position .
 
         Return:
-            an array with the 3D coordinate of the point, None if the traking is failed
+            an Nx4 array with the homogeneous 3D coordinate of the point, None if the traking is failed
 
         """
         if self.get_state() == State.OK:
-            return [cp for (cp, _) in self._get_2d_point()]
+            xyz = self._project_cloud()["xyz"]
+            return np.hstack((xyz, np.ones((xyz.shape[0], 1))))
         return None
 
     def get_point_cloud_colored(self):
@@ -240,10 +319,13 @@ class System:
 
         """
         if self.get_state() == State.OK:
-            return [
-                [cp, self.image[point[1], point[0]]]
-                for (cp, point) in self._get_2d_point()
+            projection = self._project_cloud()
+            xyz = projection["xyz"]
+            points = np.hstack((xyz, np.ones((xyz.shape[0], 1))))
+            colors = self._get_color_image()[
+                projection["uv"][:, 1], projection["uv"][:, 0]
             ]
+            return list(zip(points, colors))
         return None
 
     def get_depth(self):
@@ -255,38 +337,80 @@ class System:
         """
         depth = None
         if self.get_state() == State.OK:
-            depth = np.ones(self.image_shape[0:2]) * -1
-            for (cp, point) in self._get_2d_point():
-                depth[point[1], point[0]] = cp[2]
+            depth = self.get_sparse_depth().to_dense()
         return depth
 
-    def _get_2d_point(self):
-        """This private method is used to compute the transormation between the absolute point to the image point
+    def get_sparse_depth(self):
+        """Get the depth computed in the current image only for the pixels where it is aviable.
 
         Return:
-            a np.ndarray of pairs (camera view, image point) , an empty list if the tracking is failed
+            a SparseDepth with the pixel coordinates and the depth of the valid pixels, None if the traking is failed
 
         """
-        points2D = []
+        if self.get_state() == State.OK:
+            projection = self._project_cloud()
+            return SparseDepth(
+                projection["uv"][:, 0],
+                projection["uv"][:, 1],
+                projection["depth"],
+                tuple(self.image_shape[0:2]),
+            )
+        return None
+
+    def _project_cloud(self):
+        """Project the whole absolute point cloud in the current image.
+
+        The points are moved in the camera reference frame with a single matrix
+        product, the points behind the camera or outside the image are masked out and,
+        when more points fall in the same pixel, only the nearest one is kept (z-buffer).
+
+        Return:
+            a structured np.ndarray with dtype PROJECTION_DTYPE, one entry for each visible point:
+                xyz: the 3D coordinate in the camera reference frame
+                uv: the integer image coordinate (column, row)
+                depth: the depth of the point
+                index: the index of the point in get_abs_cloud()
+            an empty array if the tracking is failed
+        """
+        return self._cached("projection", self._compute_projection)
+
+    def _compute_projection(self):
+        """Compute the projection returned by _project_cloud"""
         points = self.get_abs_cloud()
-        camera_matrix = self.slam.get_camera_matrix()
+        if points is None or len(points) == 0:
+            return np.empty(0, dtype=PROJECTION_DTYPE)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        camera_matrix = self.get_camera_matrix()
         pose = self.get_pose_from_target()
-        for point in points:
-            point = np.append(point, [1]).reshape(4, 1)
-            camera_points = np.dot(pose, point)
-            if camera_points[2] >= 0:
-                u = (
-                    camera_matrix[0, 0] * (camera_points[0] / camera_points[2])
-                    + camera_matrix[0, 2]
-                )
-                v = (
-                    camera_matrix[1, 1] * (camera_points[1] / camera_points[2])
-                    + camera_matrix[1, 2]
-                )
-            if int(v) in range(0, self.image_shape[0]):
-                if int(u) in range(0, self.image_shape[1]):
-                    points2D.append([camera_points, (int(u), int(v))])
-        return points2D
+
+        camera_points = points @ pose[0:3, 0:3].T + pose[0:3, 3]
+        z = camera_points[:, 2]
+        index = np.flatnonzero(z > 0)
+        camera_points = camera_points[index]
+        z = z[index]
+
+        # the truncation toward zero matches the int() cast used on the image points
+        u = (
+            camera_matrix[0, 0] * (camera_points[:, 0] / z) + camera_matrix[0, 2]
+        ).astype(np.int64)
+        v = (
+            camera_matrix[1, 1] * (camera_points[:, 1] / z) + camera_matrix[1, 2]
+        ).astype(np.int64)
+        height, width = self.image_shape[0:2]
+        inside = (u >= 0) & (u < width) & (v >= 0) & (v < height)
+        index, u, v, z = index[inside], u[inside], v[inside], z[inside]
+
+        # z-buffer: sort by depth and keep the first point that falls in each pixel
+        order = np.argsort(z, kind="stable")
+        _, nearest = np.unique((v * width + u)[order], return_index=True)
+        keep = np.sort(order[nearest])
+
+        projection = np.empty(keep.shape[0], dtype=PROJECTION_DTYPE)
+        projection["xyz"] = camera_points[inside][keep]
+        projection["uv"] = np.stack((u[keep], v[keep]), axis=1)
+        projection["depth"] = z[keep]
+        projection["index"] = index[keep]
+        return projection
 
     def get_camera_matrix(self):
         """Get the camera instrinsics
@@ -294,7 +418,7 @@ class System:
         Returns:
             np.ndarray with shape 3x4 containing the camera parameters.
         """
-        return self.slam.get_camera_matrix()
+        return self._cached("camera_matrix", self.slam.get_camera_matrix)
 
     def get_state(self):
         """Get the current state of the SLAM system
@@ -302,13 +426,104 @@ class System:
         Returns:
             a State corresponding to the state
         """
-        return self.slam.get_state()
+        return self._cached("state", self.slam.get_state)
+
+    @property
+    def pose_array(self):
+        """The poses 0->T of the tracked frames still stored in the history, as ndarray Nx4x4"""
+        return self.pose_history.get_tracked_poses()
+
+    def _record_frame(self, tframe):
+        """Add the current frame to the pose history"""
+        state = self.get_state()
+        pose = self.get_pose_to_target() if state == State.OK else None
+        self.pose_history.append(pose, tframe, state)
+        if state == State.OK and self.global_map is not None:
+            with self.tracer.span("update_map"):
+                self._update_map()
+
+    def _update_map(self):
+        """Add the points visible in the current image, with their color, to the global map"""
+        projection = self._project_cloud()
+        points = np.asarray(self.get_abs_cloud(), dtype=np.float64).reshape(-1, 3)
+        colors = self._get_color_image()[projection["uv"][:, 1], projection["uv"][:, 0]]
+        self.global_map.insert(points[projection["index"]], colors[:, 0:3])
+
+    def get_cache_stats(self):
+        """Get the hits and the misses of the per-frame cache
+
+        Returns:
+            a dict that maps each cached quantity to a dict with the number of "hits" and "misses"
+        """
+        return {
+            key: {"hits": self.cache_hits[key], "misses": self.cache_misses[key]}
+            for key in self.cache_hits.keys() | self.cache_misses.keys()
+        }
+
+    def _cached(self, key, compute):
+        """Return the value of `key` for the current frame, computing it only once per frame.
+
+        The ndarray values are returned as read-only views, so a caller cannot change
+        the value seen by the other getters of the same frame, while the array of the
+        SLAM method stays writable.
+
+        Args:
+            key (str): the name of the cached quantity
+            compute (callable): function without arguments that computes the value
+
+        Returns:
+            the value computed by `compute` in the current frame
+        """
+        if key in self._frame_cache:
+            self.cache_hits[key] += 1
+            return self._frame_cache[key]
+        self.cache_misses[key] += 1
+        with self.tracer.span(key):
+            value = compute()
+        if isinstance(value, np.ndarray):
+            value = value.view()
+            value.flags.writeable = False
+        self._frame_cache[key] = value
+        return value
+
+    def _new_frame(self, color_image=None):
+        """Start a new frame: advance the frame counter and drop the cached values"""
+        self.frame_id += 1
+        self._frame_cache.clear()
+        self._color_image = color_image
+
+    def _get_color_image(self):
+        """Get the RGB image of the current frame, it is loaded only at the first call
+
+        Returns:
+            the color image given to the process method, or the processed image if it was not given.
+            A grayscale image is returned with its value repeated in the 3 channels
+        """
+
+        def load():
+            color_image = self._color_image
+            if callable(color_image):
+                color_image = color_image()
+            if color_image is None:
+                color_image = self.image
+            if color_image.ndim == 2:
+                return np.repeat(color_image[:, :, np.newaxis], 3, axis=2)
+            return color_image
+
+        return self._cached("color_image", load)
 
     def shutdown(self):
         """Shutdown the SLAM system"""
         self.slam.shutdown()
-        self.pose_array = []
+        self.pose_history.clear()
+        if self.global_map is not None:
+            self.global_map.clear()
+        self._frame_cache.clear()
 
     def reset(self):
-        """Reset SLAM system"""
+        """Reset SLAM system, the poses and the global map of the previous map are dropped"""
         self.slam.reset()
+        self.pose_history.clear()
+        if self.global_map is not None:
+            self.global_map.clear()
+        self._frame_cache.clear()
@@ -0,0 +1,96 @@
+import os
+import sys
+import types
+from collections import Counter
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+MOCK_SETTINGS = os.path.join(ROOT, "settings_mock.yaml")
+
+import slampy
+
+
+def write_image(path, value, shape=(24, 32, 3)):
+    """Write a png filled with value, so the frame can be recognized once decoded"""
+    import cv2
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, np.full(shape, value, dtype=np.uint8))
+
+
+@pytest.fixture
+def kitti_vo_sequence(tmp_path):
+    """A KITTI_VO sequence of 12 frames, the image of frame i is filled with 10 * i"""
+    timestamps = np.arange(12) * 0.1
+    for i in range(len(timestamps)):
+        write_image(str(tmp_path / "data" / f"{i:06d}.png"), 10 * i)
+    np.savetxt(tmp_path / "times.txt", timestamps, fmt="%.6e")
+    return str(tmp_path)
+
+
+class FakeSlam:
+    """A SLAM method that returns the values set by the test, and counts the calls of its getters"""
+
+    def __init__(self, params, sensor_type):
+        self.sensor_type = sensor_type
+        self.state = slampy.State.OK
+        self.pose = np.eye(4)
+        self.cloud = np.empty((0, 3))
+        self.camera_matrix = np.array(
+            [[40.0, 0.0, 32.0], [0.0, 40.0, 24.0], [0.0, 0.0, 1.0]]
+        )
+        self.frames = 0
+        self.calls = Counter()
+
+    def _process(self, *args):
+        self.frames += 1
+
+    process_image_mono = _process
+    process_image_stereo = _process
+    process_image_imu_mono = _process
+    process_image_imu_stereo = _process
+    process_image_rgbd = _process
+
+    def get_pose_to_target(self):
+        self.calls["pose"] += 1
+        return self.pose
+
+    def get_abs_cloud(self):
+        self.calls["cloud"] += 1
+        return self.cloud
+
+    def get_camera_matrix(self):
+        self.calls["camera_matrix"] += 1
+        return self.camera_matrix
+
+    def get_state(self):
+        self.calls["state"] += 1
+        return self.state
+
+    def reset(self):
+        self.frames = 0
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def fake_system(tmp_path, monkeypatch):
+    """Build a System on FakeSlam, with the settings given as keyword arguments"""
+    module = types.ModuleType("slam_method.FakeSlam")
+    module.Slam = FakeSlam
+    monkeypatch.setitem(sys.modules, "slam_method.FakeSlam", module)
+
+    def build(sensor_type=slampy.Sensor.MONOCULAR, **params):
+        settings = tmp_path / "settings_fake.yaml"
+        with open(settings, "w") as f:
+            f.write('SLAM.alg: "FakeSlam"\n')
+            for name, value in params.items():
+                f.write(f"{name.replace('_', '.', 1)}: {value}\n")
+        return slampy.System(str(settings), sensor_type)
+
+    return build
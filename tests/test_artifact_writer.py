@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+from artifact_writer import ArtifactWriter
+
+
+def _append(lines, frame, delay=0.0):
+    time.sleep(delay)
+    lines.append(frame)
+
+
+def _fail(message):
+    raise IOError(message)
+
+
+@pytest.mark.parametrize("workers", [0, 1, 3])
+def test_jobs_with_the_same_key_keep_the_order(workers):
+    files = {name: [] for name in ["pose.txt", "times.txt", "log.txt"]}
+    with ArtifactWriter(workers=workers, max_queue=4) as writer:
+        for frame in range(50):
+            for name, lines in files.items():
+                # the slow jobs of the first frames must not be passed by the next ones
+                delay = 0.002 if frame % 7 == 0 else 0.0
+                writer.submit(_append, lines, frame, delay, key=name)
+    for lines in files.values():
+        assert lines == list(range(50))
+    assert writer.get_stats()["jobs"] == 150
+    assert writer.get_stats()["queue_depth"] == 0
+
+
+def test_jobs_without_key_are_all_run():
+    lines = []
+    lock = threading.Lock()
+
+    def append(frame):
+        with lock:
+            lines.append(frame)
+
+    writer = ArtifactWriter(workers=3)
+    for frame in range(100):
+        writer.submit(append, frame)
+    writer.flush()
+    assert sorted(lines) == list(range(100))
+    writer.close()
+
+
+def test_error_is_raised_in_the_caller():
+    writer = ArtifactWriter(workers=2)
+    writer.submit(_fail, "disk full", key="depth")
+    with pytest.raises(RuntimeError, match="disk full") as error:
+        writer.flush()
+    assert isinstance(error.value.__cause__, IOError)
+    # the next calls keep failing, so the run does not go on without its artefacts
+    with pytest.raises(RuntimeError):
+        writer.submit(_append, [], 0)
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_inline_error_is_raised_by_the_next_call():
+    writer = ArtifactWriter(workers=0)
+    writer.submit(_fail, "disk full")
+    with pytest.raises(RuntimeError, match="disk full"):
+        writer.check()
+
+
+def test_submit_after_close():
+    writer = ArtifactWriter(workers=1)
+    writer.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        writer.submit(_append, [], 0)
@@ -0,0 +1,40 @@
+import subprocess
+import sys
+import pytest
+from bench_startup import check_budget, measure
+from conftest import ROOT
+
+LOADED_SCRIPT = """
+import sys
+import {module}
+print(" ".join(m for m in ["cv2", "matplotlib", "PIL", "plotly"] if m in sys.modules))
+"""
+
+
+@pytest.mark.parametrize(
+    "module", ["slampy", "utils", "kitti_odometry", "run", "run_MONO_IMU"]
+)
+def test_heavy_modules_are_not_imported(module):
+    output = subprocess.run(
+        [sys.executable, "-c", LOADED_SCRIPT.format(module=module)],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    assert output.split() == []
+
+
+def test_measure():
+    assert measure("print(0.25)") == 0.25
+
+
+def test_check_budget():
+    results = {
+        "import_run": {"median": 0.2},
+        "first_frame": {"median": 0.9},
+        "import_new": {"median": 5.0},
+    }
+    budget = {"import_run": 0.5, "first_frame": 0.8}
+    # the measures without budget are only reported
+    assert check_budget(results, budget) == ["first_frame"]
@@ -0,0 +1,36 @@
+from bench_suite import compare, run_benchmarks
+
+
+def _result(median, mad):
+    return {"median": median, "mad": mad}
+
+
+def test_compare():
+    baseline = {
+        "slower": _result(1.0, 0.01),
+        "noisy": _result(1.0, 0.2),
+        "faster": _result(1.0, 0.01),
+        "small_change": _result(1.0, 0.0),
+        "only_in_baseline": _result(1.0, 0.0),
+    }
+    current = {
+        "slower": _result(1.5, 0.01),
+        "noisy": _result(1.5, 0.2),
+        "faster": _result(0.5, 0.01),
+        "small_change": _result(1.05, 0.0),
+    }
+    report = compare(baseline, current, threshold=0.1, noise=3.0)
+    assert sorted(report) == ["faster", "noisy", "slower", "small_change"]
+    assert report["slower"] == (1.5, "regression")
+    assert report["faster"] == (0.5, "improvement")
+    # a change within the noise or below the threshold is not reported
+    assert report["noisy"][1] == "same"
+    assert report["small_change"][1] == "same"
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(["get_pose_to_target", "save_pose"], 3, scale=0.01)
+    for result in results.values():
+        assert result["frames"] == 5
+        assert len(result["samples"]) == 3
+        assert result["median"] > 0 and result["mad"] >= 0
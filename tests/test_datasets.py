@@ -0,0 +1,149 @@
+import os
+import pickle
+import numpy as np
+import pytest
+from datasets import DATASETS, TextIndex, open_dataset
+from utils import (
+    load_images_EuRoC,
+    load_images_KITTI,
+    load_images_KITTI_VO,
+    load_images_OTHERS,
+    load_images_TUM,
+    load_images_TUM_VI,
+)
+from conftest import write_image
+
+
+def _write(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def _kitti(path):
+    _write(
+        os.path.join(path, "timestamps.txt"),
+        [f"2011-09-26 13:02:{25 + i * 0.1037:012.9f}" for i in range(20)],
+    )
+    return load_images_KITTI(path)
+
+
+def _kitti_vo(path):
+    _write(os.path.join(path, "times.txt"), [f"{i * 0.1036:e}" for i in range(20)])
+    return load_images_KITTI_VO(path)
+
+
+def _tum(path):
+    _write(
+        os.path.join(path, "rgb.txt"),
+        ["# color images", "# timestamp filename"]
+        + [f"{1305031102.175304 + i * 0.033:.6f} rgb/{i}.png" for i in range(20)],
+    )
+    return load_images_TUM(path, "rgb.txt")
+
+
+def _others(path):
+    _write(
+        os.path.join(path, "times.txt"),
+        ["# seconds"] + [f"{i * 0.05:.2f}" for i in range(20)],
+    )
+    for i in range(20):
+        write_image(os.path.join(path, "data", f"frame_{i:03d}.png"), i, (2, 2, 3))
+    # the other files of data are not frames
+    _write(os.path.join(path, "data", "notes.txt"), ["not a frame"])
+    return load_images_OTHERS(path)
+
+
+def _tum_vi(path):
+    _write(
+        os.path.join(path, "mav0/cam0/times.txt"),
+        ["#filename [ns] timestamp [s]"]
+        + [
+            f"{1520530308199447626 + i * 50000000} {1520530308.199447 + i * 0.05:.6f}"
+            for i in range(20)
+        ],
+    )
+    return load_images_TUM_VI(path)
+
+
+def _euroc(path):
+    _write(
+        os.path.join(path, "mav0/cam0/data.csv"),
+        ["#timestamp [ns],filename"]
+        + [
+            f"{1403636579763555584 + i * 50000000},{1403636579763555584 + i * 50000000}.png"
+            for i in range(20)
+        ],
+    )
+    return load_images_EuRoC(path)
+
+
+SEQUENCES = {
+    "KITTI": _kitti,
+    "KITTI_VO": _kitti_vo,
+    "TUM": _tum,
+    "OTHERS": _others,
+    "TUM_VI": _tum_vi,
+    "EUROC": _euroc,
+}
+
+
+@pytest.mark.parametrize("data_type", sorted(SEQUENCES))
+def test_dataset_matches_load_images(tmp_path, data_type):
+    filenames, timestamps = SEQUENCES[data_type](str(tmp_path))
+    dataset = open_dataset(data_type, str(tmp_path))
+
+    assert len(dataset) == len(filenames) == 20
+    assert list(dataset.references) == filenames
+    assert [frame.reference for frame in dataset] == filenames
+    np.testing.assert_array_equal(dataset.timestamps, timestamps)
+    assert dataset[7] == (timestamps[7], filenames[7])
+    assert dataset[-1] == (timestamps[-1], filenames[-1])
+
+
+@pytest.mark.parametrize("data_type", sorted(SEQUENCES))
+def test_dataset_slice(tmp_path, data_type):
+    filenames, timestamps = SEQUENCES[data_type](str(tmp_path))
+    view = open_dataset(data_type, str(tmp_path))[3:17:4]
+
+    assert len(view) == len(filenames[3:17:4])
+    assert list(view.references) == filenames[3:17:4]
+    assert list(view.references[1:]) == filenames[7:17:4]
+    np.testing.assert_array_equal(view.timestamps, timestamps[3:17:4])
+    assert [view.frame_index(i) for i in range(len(view))] == [3, 7, 11, 15]
+    # a view of a view
+    assert list(view[::-1].references) == filenames[15:2:-4]
+
+
+def test_dataset_load(kitti_vo_sequence):
+    dataset = open_dataset("KITTI_VO", kitti_vo_sequence)
+    assert dataset.load(3).shape == (24, 32, 3)
+    assert np.all(dataset.load(3) == 30)
+    assert np.all(dataset[2:][1:].load(0) == 30)
+
+    gray = open_dataset("KITTI_VO", kitti_vo_sequence, gray=True, reduction=2)
+    assert gray.load(3).shape == (12, 16)
+
+
+def test_open_dataset_unknown_type(tmp_path):
+    with pytest.raises(ValueError):
+        open_dataset("NOT_A_FORMAT", str(tmp_path))
+    assert {"KITTI", "KITTI_VO", "TUM", "OTHERS", "TUM_VI", "EUROC", "VIDEO"} <= set(
+        DATASETS
+    )
+
+
+def test_text_index(tmp_path):
+    path = str(tmp_path / "lines.txt")
+    with open(path, "w") as f:
+        f.write("# header\nfirst\n\nsecond  \r\n#comment\nlast")
+    index = TextIndex(path)
+    assert [index[i] for i in range(len(index))] == ["first", "second", "last"]
+    assert index[-1] == "last"
+    # the index is sent to the decoding processes
+    index = pickle.loads(pickle.dumps(index))
+    assert [index[i] for i in range(len(index))] == ["first", "second", "last"]
+
+    assert len(TextIndex(path, comment=None)) == 5
+    open(path, "w").close()
+    assert len(TextIndex(path)) == 0
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import pytest
+from depth_archive import DepthArchiveReader, DepthArchiveWriter, pack_png_dir
+
+
+def _depths(count, shape=(6, 9)):
+    rng = np.random.default_rng(0)
+    depths = rng.uniform(0.5, 80.0, (count,) + shape)
+    depths[:, 0, 0] = -1  # invalid
+    return depths
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_round_trip(tmp_path, compress):
+    filename = str(tmp_path / "depth.dar")
+    depths = _depths(23)
+    with DepthArchiveWriter(filename, chunk_size=5, compress=compress) as archive:
+        for i, depth in enumerate(depths):
+            archive.append(depth, f"{i:06d}")
+
+    archive = DepthArchiveReader(filename)
+    assert len(archive) == 23
+    expected_raw = np.clip(depths * 256, 0, 65535).astype(np.uint16)
+    for i in range(23):
+        np.testing.assert_array_equal(archive[i], expected_raw[i])
+    np.testing.assert_array_equal(archive[-1], expected_raw[-1])
+    np.testing.assert_allclose(
+        archive.get_depth(7)[1:, 1:], depths[7][1:, 1:], atol=1 / 256
+    )
+    assert archive.get_depth(7)[0, 0] == 0
+    assert archive.index_of("000012") == 12
+    assert "000022" in archive and "000023" not in archive
+    with pytest.raises(IndexError):
+        archive[23]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_slice_reads(tmp_path, compress):
+    filename = str(tmp_path / "depth.dar")
+    depths = _depths(23)
+    with DepthArchiveWriter(filename, chunk_size=5, compress=compress) as archive:
+        for depth in depths:
+            archive.append(depth)
+    archive = DepthArchiveReader(filename)
+    expected_raw = np.clip(depths * 256, 0, 65535).astype(np.uint16)
+    # inside a chunk, across the chunks, with a step, reversed, empty
+    for item in [
+        slice(1, 4),
+        slice(3, 17),
+        slice(0, 23, 4),
+        slice(20, None),
+        slice(None, None, -3),
+        slice(8, 8),
+    ]:
+        np.testing.assert_array_equal(archive[item], expected_raw[item])
+    assert archive.index_of("5") == 5
+
+
+def test_shape_mismatch(tmp_path):
+    with DepthArchiveWriter(str(tmp_path / "depth.dar")) as archive:
+        archive.append(np.ones((4, 4)))
+        with pytest.raises(ValueError):
+            archive.append(np.ones((4, 5)))
+
+
+def test_not_an_archive(tmp_path):
+    filename = tmp_path / "depth.dar"
+    filename.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        DepthArchiveReader(str(filename))
+
+
+def test_pack_png_dir(tmp_path):
+    import cv2
+
+    depths = _depths(4)
+    png_dir = tmp_path / "depth"
+    os.makedirs(png_dir)
+    for i, depth in enumerate(depths):
+        raw = np.clip(depth * 256, 0, 65535).astype(np.uint16)
+        cv2.imwrite(str(png_dir / f"{i:06d}.png"), raw)
+    filename = str(tmp_path / "depth.dar")
+    pack_png_dir(str(png_dir), filename, chunk_size=3, compress=True)
+
+    archive = DepthArchiveReader(filename)
+    assert archive.names == [f"{i:06d}" for i in range(4)]
+    for i in range(4):
+        np.testing.assert_array_equal(
+            archive[archive.index_of(f"{i:06d}")],
+            cv2.imread(str(png_dir / f"{i:06d}.png"), -1),
+        )
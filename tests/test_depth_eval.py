@@ -0,0 +1,115 @@
+import glob
+import os
+import numpy as np
+import pytest
+from depth_archive import DepthArchiveReader, DepthArchiveWriter
+from depth_eval import build_gt_cache, eval_depth, list_predictions
+from slampy import SparseDepth
+from utils import compute_depth_errors, save_depth, save_sparse_depth
+
+SHAPE = (20, 30)
+NAMES = [f"{i:06d}" for i in range(6)]
+
+
+@pytest.fixture
+def gt_dir(tmp_path):
+    """The 16 bit png gt depths of the frames in NAMES, w/o gt in the first rows"""
+    import cv2
+
+    rng = np.random.default_rng(0)
+    gt_dir = tmp_path / "gt"
+    os.makedirs(gt_dir)
+    for name in NAMES:
+        gt_raw = (rng.uniform(1, 60, SHAPE) * 256).astype(np.uint16)
+        gt_raw[:3] = 0
+        cv2.imwrite(str(gt_dir / f"{name}.png"), gt_raw)
+    return str(gt_dir)
+
+
+def _predictions():
+    """A sparse prediction of each frame, with the dense depth (-1 where invalid)"""
+    rng = np.random.default_rng(1)
+    predictions = []
+    for _ in NAMES:
+        pixels = rng.choice(SHAPE[0] * SHAPE[1], 150, replace=False)
+        sparse = SparseDepth(
+            pixels % SHAPE[1], pixels // SHAPE[1], rng.uniform(1, 40, 150), SHAPE
+        )
+        predictions.append(sparse)
+    return predictions
+
+
+def _save_predictions(pred_dir, depth_format):
+    os.makedirs(os.path.join(pred_dir, "depth"), exist_ok=True)
+    predictions = _predictions()
+    if depth_format == "archive":
+        with DepthArchiveWriter(os.path.join(pred_dir, "depth.dar")) as archive:
+            for name, sparse in zip(NAMES, predictions):
+                archive.append(sparse.to_dense(), name)
+    for name, sparse in zip(NAMES, predictions):
+        dest = os.path.join(pred_dir, "depth", name)
+        if depth_format == "png":
+            save_depth(dest, sparse.to_dense())
+        elif depth_format == "sparse":
+            save_sparse_depth(dest, sparse)
+    return predictions
+
+
+def _expected_errors(predictions, gt_dir, depth_format):
+    """The errors computed frame by frame on the depths as they are stored"""
+    import cv2
+
+    errors = []
+    for name, sparse in zip(NAMES, predictions):
+        depth = sparse.to_dense()
+        if depth_format == "sparse":
+            depth[sparse.v, sparse.u] = sparse.z.astype(np.float32)
+        else:
+            # stored as 16 bit integers, depth * 256
+            depth = np.where(depth > 0, np.floor(depth * 256) / 256, -1)
+        gt_raw = cv2.imread(os.path.join(gt_dir, name + ".png"), -1)
+        errors.append(compute_depth_errors(depth, gt_raw, "KITTI_VO"))
+    return errors
+
+
+@pytest.mark.parametrize("depth_format", ["png", "sparse", "archive"])
+def test_eval_depth(tmp_path, gt_dir, depth_format):
+    pred_dir = str(tmp_path / "results")
+    predictions = _save_predictions(pred_dir, depth_format)
+    assert list_predictions(pred_dir) == (depth_format, NAMES)
+
+    errors = eval_depth(pred_dir, gt_dir, "KITTI_VO", workers=2)
+    assert [name for name, _ in errors] == NAMES
+    expected = _expected_errors(predictions, gt_dir, depth_format)
+    for (_, err), expected_err in zip(errors, expected):
+        np.testing.assert_allclose(err, expected_err, rtol=1e-9)
+
+
+def test_gt_cache(gt_dir):
+    import cv2
+
+    cache_path = build_gt_cache(gt_dir)
+    archive = DepthArchiveReader(cache_path)
+    assert archive.names == NAMES
+    np.testing.assert_array_equal(
+        archive[archive.index_of(NAMES[2])],
+        cv2.imread(os.path.join(gt_dir, NAMES[2] + ".png"), -1),
+    )
+    assert build_gt_cache(gt_dir) == cache_path
+
+    # a new gt file invalidates the cache, and the old archive is removed
+    cv2.imwrite(os.path.join(gt_dir, "000006.png"), np.ones(SHAPE, dtype=np.uint16))
+    new_cache_path = build_gt_cache(gt_dir)
+    assert new_cache_path != cache_path
+    assert glob.glob(os.path.join(gt_dir, ".depth.*.dar")) == [new_cache_path]
+    assert len(DepthArchiveReader(new_cache_path)) == 7
+
+
+def test_eval_depth_with_the_gt_archive(tmp_path, gt_dir):
+    pred_dir = str(tmp_path / "results")
+    _save_predictions(pred_dir, "sparse")
+    from_png = eval_depth(pred_dir, gt_dir, "KITTI_VO", workers=1, use_cache=False)
+    from_archive = eval_depth(pred_dir, build_gt_cache(gt_dir), "KITTI_VO", workers=1)
+    for (name, err), (archive_name, archive_err) in zip(from_png, from_archive):
+        assert name == archive_name
+        np.testing.assert_array_equal(err, archive_err)
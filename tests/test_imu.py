@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pytest
+from utils import get_IMU_windows, load_IMU_array, load_IMU_datas_TUM_VI
+
+
+def _loop_windows(acc_data, gyro_data, imu_timestamps, timestamps):
+    """The imu measurements of each frame, as selected by the original loop of run_MONO_IMU"""
+    first_imu = 0
+    while imu_timestamps[first_imu] <= timestamps[0]:
+        first_imu += 1
+    first_imu -= 1
+
+    windows = []
+    for idx in range(len(timestamps)):
+        imu = []
+        if idx > 0:
+            while imu_timestamps[first_imu] <= timestamps[idx]:
+                imu_valid_meas = acc_data[first_imu] + gyro_data[first_imu]
+                imu_valid_meas.append(imu_timestamps[first_imu])
+                imu.append(imu_valid_meas)
+                first_imu += 1
+        windows.append(np.array(imu).reshape(-1, 7))
+    return windows
+
+
+@pytest.fixture
+def imu_sequence(tmp_path):
+    """A TUM_VI imu file at 200Hz, from before the first frame to after the last one"""
+    rng = np.random.default_rng(0)
+    imu_ns = 1520530308000000000 + np.cumsum(rng.integers(4000000, 6000000, 400))
+    values = rng.normal(0, 1, (400, 6))
+    os.makedirs(tmp_path / "mav0" / "imu0")
+    with open(tmp_path / "mav0" / "imu0" / "data.csv", "w") as f:
+        f.write(
+            "#timestamp [ns],w_RS_S_x,w_RS_S_y,w_RS_S_z,a_RS_S_x,a_RS_S_y,a_RS_S_z\n"
+        )
+        for ns, row in zip(imu_ns.tolist(), values.tolist()):
+            f.write(",".join(map(repr, [ns] + row)) + "\n")
+    imu_timestamps = [float(ns) * 1e-9 for ns in imu_ns.tolist()]
+    # frames at 20Hz, with some of them at the time of an imu measure
+    timestamps = list(np.linspace(imu_timestamps[10] + 0.001, imu_timestamps[390], 40))
+    timestamps[0] = imu_timestamps[12]
+    timestamps[5] = imu_timestamps[60]
+    return str(tmp_path), timestamps
+
+
+def test_imu_windows_match_the_loop(imu_sequence):
+    path, timestamps = imu_sequence
+    imu = load_IMU_array(path, use_cache=False)
+    start, end = get_IMU_windows(imu[:, 6], timestamps)
+    expected = _loop_windows(*load_IMU_datas_TUM_VI(path), timestamps)
+
+    assert len(start) == len(end) == len(timestamps)
+    for idx, window in enumerate(expected):
+        np.testing.assert_array_equal(imu[start[idx] : end[idx]], window)
+    assert end[0] == start[0]
+    assert len(expected[1]) > 0
+
+
+def test_imu_cache(imu_sequence):
+    path, _ = imu_sequence
+    imu = load_IMU_array(path, use_cache=False)
+    acc_data, gyro_data, imu_timestamps = load_IMU_datas_TUM_VI(path)
+    np.testing.assert_array_equal(imu[:, 0:3], acc_data)
+    np.testing.assert_array_equal(imu[:, 3:6], gyro_data)
+    np.testing.assert_array_equal(imu[:, 6], imu_timestamps)
+
+    # the first load writes the sidecar, the second one reads it
+    for _ in range(2):
+        np.testing.assert_array_equal(load_IMU_array(path), imu)
+    sidecars = [
+        name
+        for name in os.listdir(os.path.join(path, "mav0/imu0"))
+        if name.endswith(".npy")
+    ]
+    assert len(sidecars) == 1
+
+    # a new csv file replaces the sidecar
+    csv_path = os.path.join(path, "mav0/imu0/data.csv")
+    with open(csv_path) as f:
+        lines = f.readlines()
+    with open(csv_path, "w") as f:
+        f.writelines(lines[:-10])
+    np.testing.assert_array_equal(load_IMU_array(path), imu[:-10])
+    assert len([name for name in os.listdir(os.path.dirname(csv_path))]) == 2
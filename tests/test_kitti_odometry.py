@@ -0,0 +1,205 @@
+import glob
+import os
+import numpy as np
+import pytest
+from bench_kitti_eval import LoopKittiEvalOdom, random_trajectory
+from kitti_odometry import (
+    KittiEvalOdom,
+    UmeyamaAccumulator,
+    eval_sequences,
+    load_pose_array,
+    umeyama_alignment,
+    umeyama_windows,
+)
+
+
+def _loop_umeyama_alignment(x, y, with_scale=False):
+    """The umeyama_alignment with the loop over the points, as it was"""
+    m, n = x.shape
+    mean_x = x.mean(axis=1)
+    mean_y = y.mean(axis=1)
+    sigma_x = 1.0 / n * (np.linalg.norm(x - mean_x[:, np.newaxis]) ** 2)
+    outer_sum = np.zeros((m, m))
+    for i in range(n):
+        outer_sum += np.outer((y[:, i] - mean_y), (x[:, i] - mean_x))
+    cov_xy = np.multiply(1.0 / n, outer_sum)
+    u, d, v = np.linalg.svd(cov_xy)
+    s = np.eye(m)
+    if np.linalg.det(u) * np.linalg.det(v) < 0.0:
+        s[m - 1, m - 1] = -1
+    r = u.dot(s).dot(v)
+    c = 1 / sigma_x * np.trace(np.diag(d).dot(s)) if with_scale else 1.0
+    t = mean_y - np.multiply(c, r.dot(mean_x))
+    return r, t, c
+
+
+def _points(n, offset=(0.0, 0.0, 0.0), seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 50, (3, n)) + np.array(offset)[:, np.newaxis]
+    x = 0.7 * y + rng.normal(0, 0.5, y.shape)
+    return x, y
+
+
+def _save_poses(path, poses):
+    """Save the poses in a KITTI file with the frame index in the first column"""
+    rows = [[idx] + list(poses[idx][:3, :].reshape(12)) for idx in sorted(poses)]
+    np.savetxt(path, rows, fmt="%.17g")
+
+
+def test_sequence_errors_match_the_loop():
+    poses_gt = random_trajectory(1500, seed=0)
+    poses_result = random_trajectory(1500, seed=0, noise=0.05)
+    # a run that is lost for a while
+    for idx in range(400, 470):
+        del poses_result[idx]
+    errors = KittiEvalOdom().calc_sequence_errors(poses_gt, poses_result)
+    assert len(errors) > 0
+    assert errors == LoopKittiEvalOdom().calc_sequence_errors(poses_gt, poses_result)
+
+
+def test_trajectory_distances():
+    poses = random_trajectory(200, seed=2)
+    dist = KittiEvalOdom().trajectory_distances(poses)
+    steps = [
+        np.linalg.norm(poses[i][:3, 3] - poses[i - 1][:3, 3]) for i in range(1, 200)
+    ]
+    np.testing.assert_allclose(dist, np.concatenate([[0], np.cumsum(steps)]))
+
+
+@pytest.mark.parametrize("with_scale", [False, True])
+def test_umeyama_alignment_matches_the_loop(with_scale):
+    x, y = _points(300)
+    for value, expected in zip(
+        umeyama_alignment(x, y, with_scale), _loop_umeyama_alignment(x, y, with_scale)
+    ):
+        np.testing.assert_allclose(value, expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("mode", ["sim3", "se3", "scale"])
+def test_umeyama_accumulator(mode):
+    x, y = _points(500)
+    accumulator = UmeyamaAccumulator()
+    for batch in np.array_split(np.arange(500), 7):
+        accumulator.add(x[:, batch], y[:, batch])
+    # the removed points do not count
+    accumulator.add(x[:, :20] + 100, y[:, :20])
+    accumulator.add(x[:, :20] + 100, y[:, :20], weight=-1)
+    r, t, c = accumulator.solve(mode)
+
+    if mode == "scale":
+        expected_c = np.sum(x * y) / np.sum(x * x)
+        np.testing.assert_allclose(c, expected_c, rtol=1e-9)
+        assert np.array_equal(r, np.eye(3)) and np.array_equal(t, np.zeros(3))
+    else:
+        expected_r, expected_t, expected_c = umeyama_alignment(x, y, mode == "sim3")
+        np.testing.assert_allclose(r, expected_r, atol=1e-9)
+        np.testing.assert_allclose(t, expected_t, atol=1e-6)
+        np.testing.assert_allclose(c, expected_c, rtol=1e-9)
+
+    aligned = c * r.dot(x) + t[:, np.newaxis]
+    rmse = np.sqrt(np.mean(np.sum((aligned - y) ** 2, axis=0)))
+    np.testing.assert_allclose(accumulator.rmse(r, t, c), rmse, rtol=1e-6)
+
+
+@pytest.mark.parametrize("mode", ["sim3", "se3"])
+def test_umeyama_accumulator_far_from_the_origin(mode):
+    # the RMSE is small compared with the distance of the points from the origin
+    rng = np.random.default_rng(1)
+    y = rng.normal(0, 50, (3, 2000)) + np.array([[3e4], [2e3], [-5e4]])
+    x = y - np.array([[3e4], [2e3], [-5e4]]) + rng.normal(0, 0.05, y.shape)
+    accumulator = UmeyamaAccumulator()
+    for batch in np.array_split(np.arange(2000), 9):
+        accumulator.add(x[:, batch], y[:, batch])
+    r, t, c = accumulator.solve(mode)
+
+    aligned = c * r.dot(x) + t[:, np.newaxis]
+    rmse = np.sqrt(np.mean(np.sum((aligned - y) ** 2, axis=0)))
+    np.testing.assert_allclose(accumulator.rmse(r, t, c), rmse, rtol=1e-6)
+
+
+@pytest.mark.parametrize("with_scale", [False, True])
+def test_umeyama_windows(with_scale):
+    x, y = _points(120, offset=(300, 20, -500))
+    starts, r, t, c = umeyama_windows(x, y, window=25, step=10, with_scale=with_scale)
+    assert list(starts) == list(range(0, 96, 10))
+    for i, start in enumerate(starts):
+        window = slice(start, start + 25)
+        expected_r, expected_t, expected_c = umeyama_alignment(
+            x[:, window], y[:, window], with_scale
+        )
+        np.testing.assert_allclose(r[i], expected_r, atol=1e-8)
+        np.testing.assert_allclose(t[i], expected_t, atol=1e-6)
+        np.testing.assert_allclose(c[i], expected_c, rtol=1e-8)
+
+
+def test_load_pose_array(tmp_path):
+    poses = random_trajectory(50, seed=1)
+    del poses[10]
+    path = str(tmp_path / "poses.txt")
+    _save_poses(path, poses)
+
+    frame_idx, array, dist = load_pose_array(path, use_cache=False)
+    assert list(frame_idx) == sorted(poses)
+    for idx, pose in zip(frame_idx, array):
+        np.testing.assert_array_equal(pose, poses[idx])
+    np.testing.assert_allclose(
+        dist, KittiEvalOdom().trajectory_distances({i: p for i, p in enumerate(array)})
+    )
+    loaded = KittiEvalOdom().load_poses_from_txt(path, use_cache=False)
+    assert sorted(loaded) == sorted(poses)
+    assert glob.glob(str(tmp_path / ".poses.txt.*.npy")) == []
+
+    # the first load writes the sidecar, the second one reads it
+    for _ in range(2):
+        cached_idx, cached, cached_dist = load_pose_array(path)
+        np.testing.assert_array_equal(cached_idx, frame_idx)
+        np.testing.assert_array_equal(cached, array)
+        np.testing.assert_array_equal(cached_dist, dist)
+    assert len(glob.glob(str(tmp_path / ".poses.txt.*.npy"))) == 1
+
+
+def test_load_pose_array_after_a_change(tmp_path):
+    path = str(tmp_path / "poses.txt")
+    _save_poses(path, random_trajectory(20, seed=1))
+    load_pose_array(path)
+    old_cache = glob.glob(str(tmp_path / ".poses.txt.*.npy"))
+
+    poses = random_trajectory(30, seed=2)
+    _save_poses(path, poses)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    frame_idx, array, _ = load_pose_array(path)
+    assert len(frame_idx) == 30
+    np.testing.assert_array_equal(array[29], poses[29])
+    # the sidecar of the old file is removed
+    new_cache = glob.glob(str(tmp_path / ".poses.txt.*.npy"))
+    assert len(new_cache) == 1 and new_cache != old_cache
+
+
+def test_eval_sequences(tmp_path):
+    sequences = []
+    for i in range(2):
+        gt_path = str(tmp_path / f"gt_{i}.txt")
+        result_path = str(tmp_path / f"result_{i}.txt")
+        _save_poses(gt_path, random_trajectory(800 + 200 * i, seed=i))
+        _save_poses(result_path, random_trajectory(800 + 200 * i, seed=i, noise=0.05))
+        sequences.append((f"seq_{i}", gt_path, result_path))
+    dest = str(tmp_path / "eval")
+    results, summary = eval_sequences(sequences, dest, workers=2)
+
+    assert [result["name"] for result in results] == ["seq_0", "seq_1"]
+    for (name, gt_path, result_path), result in zip(sequences, results):
+        expected = KittiEvalOdom().eval_sequence(
+            gt_path, result_path, str(tmp_path / "single" / name), plot=False
+        )
+        for key in ["t_err", "r_err", "ate", "rpe_trans", "rpe_rot", "num_segments"]:
+            assert result[key] == expected[key]
+    assert summary["ate"] == np.mean([result["ate"] for result in results])
+    # the KITTI errors are the mean over the segments of all the sequences
+    num_segments = sum(result["num_segments"] for result in results)
+    assert num_segments > 0
+    assert summary["kitti_t_err"] == pytest.approx(
+        sum(result["sum_t_err"] for result in results) / num_segments
+    )
+    assert os.path.exists(os.path.join(dest, "summary.txt"))
+    assert os.path.exists(os.path.join(dest, "seq_1", "pose_result.txt"))
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+import pytest
+import slampy
+from conftest import MOCK_SETTINGS
+from depth_archive import DEPTH_ARCHIVE_EXT, DepthArchiveReader
+from run import parser as run_parser
+from run import run
+
+
+def _process(app, frames):
+    states = []
+    for i in range(frames):
+        states.append(app.process_image_mono(np.zeros((24, 32, 3)), 0.1 * i))
+    return states
+
+
+def test_mock_slam_is_deterministic():
+    first = slampy.System(MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    second = slampy.System(MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    states = _process(first, 10)
+    assert states == _process(second, 10)
+    assert states[:2] == [slampy.State.NOT_INITIALIZED] * 2
+    assert states[2:] == [slampy.State.OK] * 8
+    np.testing.assert_array_equal(
+        first.get_pose_to_target(), second.get_pose_to_target()
+    )
+    np.testing.assert_array_equal(first.get_abs_cloud(), second.get_abs_cloud())
+
+    # after a reset the same frames give the same poses
+    first.reset()
+    _process(first, 10)
+    np.testing.assert_array_equal(
+        first.get_pose_to_target(), second.get_pose_to_target()
+    )
+
+
+def test_mock_slam_sensor_type():
+    app = slampy.System(MOCK_SETTINGS, slampy.Sensor.STEREO)
+    with pytest.raises(Exception):
+        _process(app, 1)
+
+
+def _run(dataset, settings, dest, options=()):
+    args = run_parser.parse_args(
+        [
+            "--dataset",
+            dataset,
+            "--settings",
+            settings,
+            "--dest",
+            dest,
+            "--data_type",
+            "KITTI_VO",
+            "--is_bash",
+        ]
+        + list(options)
+    )
+    run(args)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        ["--prefetch_depth", "0", "--writer_workers", "0"],
+        ["--prefetch_depth", "4", "--writer_workers", "2"],
+    ],
+)
+def test_run_on_mock_slam(kitti_vo_sequence, tmp_path, options):
+    dest = str(tmp_path / "results")
+    _run(kitti_vo_sequence, MOCK_SETTINGS, dest, options)
+
+    with open(os.path.join(dest, "log.txt")) as f:
+        states = [line.strip().split(": ")[1] for line in f]
+    assert states == ["State.NOT_INITIALIZED"] * 2 + ["State.OK"] * 10
+    app = slampy.System(MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    _process(app, 12)
+    poses = np.loadtxt(os.path.join(dest, "pose.txt"))
+    # the frame index, then the 3x4 pose of each tracked frame
+    assert list(poses[:, 0]) == list(range(2, 12))
+    np.testing.assert_allclose(
+        poses[-1, 1:].reshape(3, 4), app.get_pose_to_target()[:3, :], rtol=1e-6
+    )
+
+
+def test_run_with_a_depth_archive(kitti_vo_sequence, tmp_path):
+    dest = tmp_path / "results"
+    _run(kitti_vo_sequence, MOCK_SETTINGS, str(dest), ["--depth_format", "archive"])
+    assert not (dest / "depth").exists()
+    archive = DepthArchiveReader(str(dest / ("depth" + DEPTH_ARCHIVE_EXT)))
+    # a depth for each tracked frame
+    assert len(archive) == 10
+
+
+def test_run_relative_poses_with_lost_frames(kitti_vo_sequence, tmp_path):
+    settings = tmp_path / "settings_lost.yaml"
+    with open(MOCK_SETTINGS) as f:
+        settings.write_text(
+            f.read().replace("Mock.lost_every: 0", "Mock.lost_every: 4")
+        )
+    dest = str(tmp_path / "results")
+    _run(kitti_vo_sequence, str(settings), dest, ["--pose_id", "1"])
+
+    # the frames 3, 7 and 11 are lost, there is no pose from them to the next frame
+    saved = sorted(os.listdir(os.path.join(dest, "pose")))
+    assert saved == [f"{i:06d}.npy" for i in [5, 6, 9, 10]]
+    pose = np.load(os.path.join(dest, "pose", "000009.npy"))
+    assert pose.shape == (4, 4)
+
+
+@pytest.mark.parametrize(
+    "options", [["--pose_id", "1"], ["--is_evaluate_pose", "--gt_pose_txt", "gt.txt"]]
+)
+def test_run_rejects_relative_poses_with_a_dropping_replay(
+    kitti_vo_sequence, tmp_path, options
+):
+    replay = ["--replay", "--replay_policy", "drop_oldest"]
+    with pytest.raises(ValueError, match="replay_policy"):
+        _run(
+            kitti_vo_sequence,
+            MOCK_SETTINGS,
+            str(tmp_path / "results"),
+            replay + options,
+        )
+    # with the block policy no frame is dropped
+    _run(
+        kitti_vo_sequence,
+        MOCK_SETTINGS,
+        str(tmp_path / "results"),
+        [
+            "--replay",
+            "--replay_policy",
+            "block",
+            "--replay_speed",
+            "10",
+            "--pose_id",
+            "1",
+        ],
+    )
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from bench_kitti_eval import random_trajectory
+from kitti_odometry import KittiEvalOdom
+from online_eval import OnlineOdometryEval
+
+
+def _sequence(tmp_path, lost=()):
+    """A ground truth of 800 frames and a noisy result at a different scale, w/o the lost frames"""
+    poses_gt = random_trajectory(800, seed=0)
+    poses_result = random_trajectory(800, seed=0, noise=0.02)
+    for pose in poses_result.values():
+        pose[:3, 3] *= 0.7
+    gt_txt = str(tmp_path / "gt.txt")
+    result_txt = str(tmp_path / "result.txt")
+    np.savetxt(gt_txt, [poses_gt[idx][:3, :].reshape(12) for idx in range(800)])
+    np.savetxt(
+        result_txt,
+        [
+            [idx] + list(poses_result[idx][:3, :].reshape(12))
+            for idx in range(800)
+            if idx not in lost
+        ],
+        fmt="%.17g",
+    )
+    poses = [None if idx in lost else poses_result[idx] for idx in range(800)]
+    return gt_txt, result_txt, poses
+
+
+# the offline segments are measured on the gt of all the frames, also of the lost ones
+@pytest.mark.parametrize("lost", [(), range(300, 320)])
+@pytest.mark.parametrize("alignment", ["7dof", "6dof", "scale", "scale_7dof"])
+def test_online_matches_offline(tmp_path, alignment, lost):
+    gt_txt, result_txt, poses = _sequence(tmp_path, lost=set(lost))
+    online_eval = OnlineOdometryEval(gt_txt, alignment, snapshot_every=0)
+    for idx, pose in enumerate(poses):
+        online_eval.add(idx, pose)
+    snapshot = online_eval.snapshot()
+
+    result = KittiEvalOdom().eval_sequence(
+        gt_txt, result_txt, str(tmp_path / "eval"), alignment=alignment, plot=False
+    )
+    assert snapshot["frames"] == 800 - len(lost)
+    assert snapshot["segments"] == result["num_segments"] > 0
+    for key in ["t_err", "r_err", "rpe_trans", "rpe_rot"]:
+        np.testing.assert_allclose(snapshot[key], result[key], rtol=1e-9)
+    # the ate comes from the running sums of UmeyamaAccumulator
+    np.testing.assert_allclose(snapshot["ate"], result["ate"], rtol=1e-6)
+
+
+def test_online_snapshots(tmp_path):
+    gt_txt, _, poses = _sequence(tmp_path, lost=set(range(300, 320)))
+    snapshot_file = str(tmp_path / "snapshots.jsonl")
+    online_eval = OnlineOdometryEval(
+        gt_txt, "6dof", snapshot_every=100, snapshot_file=snapshot_file, abort_ate=5.0
+    )
+    snapshots = [online_eval.add(idx, pose) for idx, pose in enumerate(poses)]
+    taken = [snapshot for snapshot in snapshots if snapshot is not None]
+    assert [snapshot["frames"] for snapshot in taken] == list(range(100, 800, 100))
+    with open(snapshot_file) as f:
+        assert len(f.readlines()) == len(taken)
+    # the trajectory is at a different scale, w/o the scale the ate grows with the path
+    assert online_eval.diverged
+
+    online_eval.reset()
+    assert online_eval.num_poses == 0 and not online_eval.diverged
+    # the frames that are not in the gt are skipped
+    assert online_eval.add(10000, poses[0]) is None
+    assert online_eval.num_poses == 0
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from pose_history import PoseHistory, inverse_pose
+from slampy import State
+
+
+def _random_pose(rng):
+    q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    pose = np.eye(4)
+    pose[:3, :3] = q * np.sign(np.linalg.det(q))
+    pose[:3, 3] = rng.normal(size=3)
+    return pose
+
+
+def _fill(history, count, lost=()):
+    rng = np.random.default_rng(0)
+    poses = []
+    for i in range(count):
+        pose = None if i in lost else _random_pose(rng)
+        state = State.LOST if i in lost else State.OK
+        history.append(pose, 0.1 * i, state)
+        poses.append(pose)
+    return poses
+
+
+def test_inverse_pose():
+    rng = np.random.default_rng(1)
+    poses = np.stack([_random_pose(rng) for _ in range(5)])
+    np.testing.assert_allclose(inverse_pose(poses), np.linalg.inv(poses), atol=1e-12)
+
+
+def test_relative_pose_across_chunks():
+    history = PoseHistory(chunk_size=4)
+    poses = _fill(history, 11, lost=(6,))
+    assert len(history) == 11
+    for from_frame, to_frame in [(0, 10), (3, 4), (7, 8), (2, 9), (-1, -4)]:
+        # as computed by the original System
+        expected = np.dot(poses[to_frame], np.linalg.inv(poses[from_frame]))
+        np.testing.assert_allclose(
+            history.get_relative_pose(from_frame, to_frame), expected, atol=1e-12
+        )
+    assert history.get_pose(6) is None
+    assert history.get_relative_pose(6, 10) is None
+    assert history.get_state_value(6) == State.LOST.value
+    assert history.get_pose(11) is None
+
+
+def test_get_pose_returns_a_copy():
+    history = PoseHistory(chunk_size=4)
+    poses = _fill(history, 3)
+    pose = history.get_pose(1)
+    pose[0, 3] += 10.0
+    np.testing.assert_array_equal(history.get_pose(1), poses[1])
+    np.testing.assert_allclose(
+        history.get_relative_pose(0, 1),
+        np.dot(poses[1], np.linalg.inv(poses[0])),
+        atol=1e-12,
+    )
+
+
+def test_tracked_poses_and_timestamps():
+    history = PoseHistory(chunk_size=4)
+    poses = _fill(history, 10, lost=(1, 5))
+    tracked = history.get_tracked_poses()
+    np.testing.assert_array_equal(
+        tracked, np.stack([pose for pose in poses if pose is not None])
+    )
+    assert history.frame_at(0.45) == 4
+    assert history.frame_at(-1.0) is None
+    assert history.get_timestamp(9) == pytest.approx(0.9)
+
+
+def test_max_frames_drops_the_oldest_chunks():
+    history = PoseHistory(chunk_size=4, max_frames=6)
+    poses = _fill(history, 23)
+    assert len(history) == 23
+    # at least the last 6 frames are kept, the first ones are dropped by chunk
+    assert history.first_frame == 16
+    assert history.get_pose(15) is None
+    np.testing.assert_array_equal(history.get_pose(16), poses[16])
+    np.testing.assert_array_equal(history.get_pose(-1), poses[22])
+    assert len(history.to_array()) == 7
+
+
+def test_save_and_load(tmp_path):
+    history = PoseHistory(chunk_size=4)
+    _fill(history, 10, lost=(3,))
+    filename = str(tmp_path / "poses.npy")
+    history.save(filename)
+    loaded = PoseHistory.load(filename)
+    assert len(loaded) == 10
+    for field in ["pose", "timestamp", "state"]:
+        np.testing.assert_array_equal(
+            loaded.to_array()[field], history.to_array()[field]
+        )
+    np.testing.assert_array_equal(
+        loaded.get_relative_pose(2, 8), history.get_relative_pose(2, 8)
+    )
+    assert loaded.get_pose(3) is None
@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+from datasets import VideoDataset
+from prefetch import ImagePrefetcher, ProcessPrefetcher, VideoPrefetcher
+from utils import load_image, load_images_KITTI_VO
+
+
+def _run_with_timeout(target, timeout=20):
+    """Run target on a thread and fail, instead of hanging the suite, if it does not return"""
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the prefetcher has not returned"
+    if errors:
+        raise errors[0]
+
+
+def _frame_value(image):
+    return int(image[0, 0, 0])
+
+
+@pytest.mark.parametrize("depth", [0, 1, 4])
+def test_image_prefetcher_order(kitti_vo_sequence, depth):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    with ImagePrefetcher(filenames, depth=depth, workers=3) as prefetcher:
+        values = [_frame_value(image) for image in prefetcher]
+    assert values == [10 * i for i in range(len(filenames))]
+    assert prefetcher.get_stats()["frames"] == len(filenames)
+    assert prefetcher.get_stats()["max_queue"] <= depth
+
+
+def test_image_prefetcher_max_bytes(kitti_vo_sequence):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    frame_bytes = 24 * 32 * 3
+    prefetcher = ImagePrefetcher(filenames, depth=8, max_bytes=3 * frame_bytes)
+    values = []
+    queued = []
+    for image in prefetcher:
+        values.append(_frame_value(image))
+        queued.append(len(prefetcher._queue))
+    assert values == [10 * i for i in range(len(filenames))]
+    # before the first frame the size is not known, then no more than 3 frames are
+    # queued, once the first 8 have been consumed
+    assert prefetcher.max_queue == 8
+    assert max(queued[5:]) <= 3
+
+
+def test_image_prefetcher_max_bytes_of_tuple_frames(kitti_vo_sequence):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    references = list(zip(filenames, filenames[1:]))
+    # each frame is a pair of images, 3 pairs fit in max_bytes
+    prefetcher = ImagePrefetcher(
+        references, loader=_load_pair, depth=8, max_bytes=6 * 24 * 32 * 3
+    )
+    pairs = []
+    queued = []
+    for left, right in prefetcher:
+        pairs.append((_frame_value(left), _frame_value(right)))
+        queued.append(len(prefetcher._queue))
+    assert pairs == [(10 * i, 10 * (i + 1)) for i in range(len(references))]
+    assert max(queued[5:]) <= 3
+
+
+def test_image_prefetcher_early_break(kitti_vo_sequence):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    prefetcher = ImagePrefetcher(filenames, depth=4)
+
+    def run():
+        iterator = iter(prefetcher)
+        assert _frame_value(next(iterator)) == 0
+        iterator.close()
+
+    _run_with_timeout(run)
+    assert prefetcher._executor is None
+    assert len(prefetcher._queue) == 0
+
+
+def test_image_prefetcher_error(tmp_path):
+    prefetcher = ImagePrefetcher([str(tmp_path / "missing.png")], depth=2)
+    with pytest.raises(ValueError):
+        list(prefetcher)
+    assert prefetcher._executor is None
+
+
+def test_process_prefetcher_order_and_backpressure(kitti_vo_sequence):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    values = []
+    with ProcessPrefetcher(filenames, depth=2, workers=3) as prefetcher:
+        for image in prefetcher:
+            value = _frame_value(image)
+            # the workers are ahead of the consumer, but they must not write the
+            # slot of the frame that it holds
+            time.sleep(0.02)
+            assert np.all(image == value)
+            values.append(value)
+    assert values == [10 * i for i in range(len(filenames))]
+    assert prefetcher.get_stats()["frames"] == len(filenames)
+    assert prefetcher.get_stats()["max_queue"] <= 2
+
+
+def _load_pair(filenames):
+    # a module function, the loader is pickled for the workers
+    return load_image(filenames[0]), load_image(filenames[1])
+
+
+def test_process_prefetcher_tuple_frames(kitti_vo_sequence):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    references = list(zip(filenames, filenames[1:]))
+    with ProcessPrefetcher(references, loader=_load_pair, depth=3) as prefetcher:
+        pairs = [
+            (_frame_value(left), _frame_value(right)) for left, right in prefetcher
+        ]
+    assert pairs == [(10 * i, 10 * (i + 1)) for i in range(len(references))]
+
+
+def test_process_prefetcher_early_break(kitti_vo_sequence):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    prefetcher = ProcessPrefetcher(filenames, depth=2, workers=2)
+    for idx, image in enumerate(prefetcher):
+        if idx == 0:
+            name = prefetcher._ring.shm.name
+            processes = list(prefetcher._processes)
+        if idx == 2:
+            break
+    del image
+    prefetcher.close()
+    assert prefetcher._ring is None
+    assert all(not process.is_alive() for process in processes)
+    # the shared memory segment has been removed
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_process_prefetcher_error(kitti_vo_sequence, capfd):
+    filenames, _ = load_images_KITTI_VO(kitti_vo_sequence)
+    filenames[5] = os.path.join(kitti_vo_sequence, "missing.png")
+    prefetcher = ProcessPrefetcher(filenames, depth=2)
+    values = []
+    # the error of the worker is raised by the consumer, with the frame index
+    with pytest.raises(
+        ValueError, match=r"frame 5 .*ValueError: failed to load image .*missing\.png"
+    ):
+        for image in prefetcher:
+            values.append(_frame_value(image))
+    assert values == [0, 10, 20, 30, 40]
+    assert prefetcher._ring is None and prefetcher._processes == []
+    assert capfd.readouterr().out == ""
+
+
+@pytest.fixture
+def video(tmp_path):
+    """A video of 12 frames, frame i is filled with 20 * i"""
+    import cv2
+
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (32, 24))
+    if not writer.isOpened():
+        pytest.skip("cv2 cannot write videos")
+    for i in range(12):
+        writer.write(np.full((24, 32, 3), 20 * i, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def _video_values(dataset, prefetcher):
+    return [
+        (frame.reference, round(image.mean() / 20))
+        for frame, image in dataset.stream(prefetcher)
+    ]
+
+
+def test_video_prefetcher_order(video):
+    dataset = VideoDataset(video)
+    values = _video_values(dataset, VideoPrefetcher(dataset, depth=3))
+    assert values == [(f"{i:06d}", i) for i in range(12)]
+
+    view = dataset[2:11:3]
+    values = _video_values(view, VideoPrefetcher(view, depth=3))
+    assert values == [(f"{i:06d}", i) for i in range(2, 11, 3)]
+
+
+def test_video_prefetcher_close_with_a_full_queue(video):
+    dataset = VideoDataset(video)[:3]
+    prefetcher = VideoPrefetcher(dataset, depth=2)
+
+    def run():
+        stream = dataset.stream(prefetcher)
+        next(stream)
+        # the last frames fill the queue, the end of the video waits for a free place
+        time.sleep(0.2)
+        prefetcher.close()
+
+    _run_with_timeout(run)
+    assert prefetcher._thread is None
+
+
+def test_video_prefetcher_early_break(video):
+    dataset = VideoDataset(video)
+    prefetcher = VideoPrefetcher(dataset, depth=2)
+
+    def run():
+        iterator = iter(prefetcher)
+        next(iterator)
+        time.sleep(0.1)
+        iterator.close()
+
+    _run_with_timeout(run)
+    assert prefetcher._thread is None
+
+
+def test_video_dataset_reversed_slice(video):
+    with pytest.raises(ValueError):
+        VideoDataset(video)[::-1]
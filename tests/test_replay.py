@@ -0,0 +1,111 @@
+import time
+import numpy as np
+import pytest
+from datasets import Frame
+from replay import ReplayScheduler
+
+
+class _Stream:
+    """A stream of frames 10ms apart, the image of frame i is filled with i"""
+
+    def __init__(self, num_frames, fail_at=None):
+        self.num_frames = num_frames
+        self.fail_at = fail_at
+        self.closed = False
+        self.image = np.zeros((2, 2), dtype=np.int64)
+
+    def __iter__(self):
+        for i in range(self.num_frames):
+            if i == self.fail_at:
+                raise ValueError(f"failed to decode frame {i}")
+            # the same buffer for all the frames, as prefetch.ProcessPrefetcher
+            self.image[:] = i
+            yield Frame(i * 0.01, str(i)), self.image
+
+    def close(self):
+        self.closed = True
+
+
+def _replay(replay, delay=0.0):
+    indices = []
+    for index, (frame, image) in replay:
+        assert frame.reference == str(index)
+        indices.append(index)
+        time.sleep(delay)
+    return indices
+
+
+def test_replay_block():
+    stream = _Stream(20)
+    replay = ReplayScheduler(stream, speed=4.0, policy="block", queue_size=2)
+    # the tracking is slower than the frames, nothing is dropped
+    assert _replay(replay, delay=0.005) == list(range(20))
+    stats = replay.get_stats()
+    assert stats["released"] == stats["processed"] == 20
+    assert stats["dropped"] == 0
+    assert stats["late"] > 0
+    assert stream.closed
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "latest_only"])
+def test_replay_dropping(policy):
+    replay = ReplayScheduler(_Stream(40), speed=1.0, policy=policy, queue_size=3)
+    indices = _replay(replay, delay=0.03)
+    stats = replay.get_stats()
+    assert indices == sorted(indices)
+    assert indices[-1] == 39
+    assert stats["dropped"] > 0
+    assert stats["released"] == 40
+    assert stats["processed"] == len(indices) == 40 - stats["dropped"]
+    assert replay.queue_size == (1 if policy == "latest_only" else 3)
+
+
+def test_replay_copy():
+    replay = ReplayScheduler(_Stream(10), speed=2.0, policy="block", copy=True)
+    for index, (frame, image) in replay:
+        time.sleep(0.01)
+        # the queued image has not been overwritten by the next frames
+        assert np.all(image == index)
+
+
+def test_replay_early_break():
+    stream = _Stream(1000)
+    replay = ReplayScheduler(stream, speed=10.0, policy="block", queue_size=1)
+    frames = iter(replay)
+    next(frames)
+    next(frames)
+    # the release thread is waiting for a free place in the queue
+    time.sleep(0.05)
+    frames.close()
+    assert not replay._thread.is_alive()
+    assert stream.closed
+    assert replay.processed == 1
+
+
+def test_replay_error():
+    stream = _Stream(10, fail_at=4)
+    replay = ReplayScheduler(stream, speed=10.0, policy="block")
+    with pytest.raises(ValueError):
+        _replay(replay)
+    assert replay.processed == 4
+    assert stream.closed
+
+
+def test_replay_arguments():
+    with pytest.raises(ValueError):
+        ReplayScheduler(_Stream(1), speed=0)
+    with pytest.raises(ValueError):
+        ReplayScheduler(_Stream(1), policy="drop_newest")
+    with pytest.raises(ValueError):
+        ReplayScheduler(_Stream(1), queue_size=0)
+
+
+def test_replay_summary(tmp_path):
+    replay = ReplayScheduler(_Stream(5), speed=10.0, policy="block")
+    _replay(replay)
+    summary = replay.format_summary(["State.OK"] * 3 + ["State.LOST"] * 2)
+    assert "5 released, 5 processed, 0 dropped" in summary
+    assert summary.endswith("states: 2 LOST, 3 OK")
+    replay.save_summary(str(tmp_path / "replay.txt"))
+    with open(tmp_path / "replay.txt") as f:
+        assert f.read() == replay.format_summary() + "\n"
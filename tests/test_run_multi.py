@@ -0,0 +1,123 @@
+import os
+from collections import Counter
+import pytest
+from conftest import MOCK_SETTINGS
+from run_multi import (
+    get_cpu_groups,
+    load_sequences,
+    read_states,
+    run_sequences,
+    write_report,
+)
+
+
+def _write_config(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_load_sequences(tmp_path):
+    config = _write_config(
+        tmp_path / "sequences.yaml",
+        "defaults:\n"
+        "  settings: ./settings_a.yaml\n"
+        "  data_type: TUM\n"
+        "sequences:\n"
+        "  - dataset: /data/00\n"
+        "    dest: /results/00\n"
+        "  - dataset: /data/01\n"
+        "    dest: /results/01\n"
+        "    settings: ./settings_b.yaml\n",
+    )
+    first, second = load_sequences(config)
+    assert (first.dataset, first.dest, first.settings) == (
+        "/data/00",
+        "/results/00",
+        "./settings_a.yaml",
+    )
+    # the options of a sequence override the defaults, the others keep the run.py defaults
+    assert second.settings == "./settings_b.yaml"
+    assert second.data_type == "TUM"
+    assert first.is_bash and second.is_bash
+
+
+def test_load_sequences_unknown_option(tmp_path):
+    config = _write_config(
+        tmp_path / "sequences.yaml",
+        "sequences:\n  - dataset: /data/00\n    dest: /results/00\n    speed: 2\n",
+    )
+    with pytest.raises(ValueError, match="speed"):
+        load_sequences(config)
+
+
+def test_get_cpu_groups():
+    groups = get_cpu_groups(3, cpus_per_worker=2)
+    assert len(groups) == 3
+    if groups[0] is not None:
+        cpus = os.sched_getaffinity(0)
+        assert all(len(group) <= 2 and group <= cpus for group in groups)
+
+
+def test_read_states(tmp_path):
+    log = tmp_path / "log.txt"
+    log.write_text(
+        "0: State.OK\n1: State.LOST\n2: State.OK\n3: State.NOT_INITIALIZED\n"
+    )
+    assert read_states(str(log)) == Counter(OK=2, LOST=1, NOT_INITIALIZED=1)
+    assert read_states(str(tmp_path / "missing.txt")) == Counter()
+
+
+def test_failed_sequence_is_reported(tmp_path):
+    config = _write_config(
+        tmp_path / "sequences.yaml",
+        "sequences:\n"
+        f"  - dataset: {tmp_path / 'missing'}\n"
+        f"    dest: {tmp_path / 'results_00'}\n"
+        f"    settings: {tmp_path / 'missing.yaml'}\n"
+        "    named: seq_00\n",
+    )
+    sequences = load_sequences(config)
+    results = run_sequences(sequences, 1, [None])
+    assert len(results) == 1
+    assert results[0]["name"] == "seq_00"
+    assert results[0]["exitcode"] == 1
+    assert results[0]["pose_result"] is None
+    # the traceback of the worker is saved with its output
+    with open(tmp_path / "results_00" / "run_output.txt") as f:
+        assert "Traceback" in f.read()
+
+    report = tmp_path / "report.txt"
+    write_report(results, str(report))
+    assert "failed (1)" in report.read_text()
+
+
+def test_run_sequences_without_workers():
+    sequence = {"name": "seq_00", "dest": "results_00"}
+    with pytest.raises(ValueError, match="at least 1"):
+        run_sequences([sequence], 0, [])
+    assert run_sequences([], 0, []) == []
+
+
+def test_run_sequences_on_mock_slam(kitti_vo_sequence, tmp_path):
+    config = _write_config(
+        tmp_path / "sequences.yaml",
+        "defaults:\n"
+        f"  settings: {MOCK_SETTINGS}\n"
+        f"  dataset: {kitti_vo_sequence}\n"
+        "sequences:\n"
+        + "".join(
+            f"  - dest: {tmp_path / name}\n    named: {name}\n"
+            for name in ["seq_00", "seq_01", "seq_02"]
+        ),
+    )
+    results = run_sequences(load_sequences(config), 2, [None, None])
+    assert [result["name"] for result in results] == ["seq_00", "seq_01", "seq_02"]
+    for result in results:
+        assert result["exitcode"] == 0
+        assert result["states"] == Counter(OK=10, NOT_INITIALIZED=2)
+    with open(tmp_path / "seq_00" / "pose.txt") as f:
+        expected = f.read()
+    for name in ["seq_01", "seq_02"]:
+        with open(tmp_path / name / "pose.txt") as f:
+            assert f.read() == expected
@@ -0,0 +1,62 @@
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+from shm_ring import SharedFrameRing
+
+
+def _stereo_frame(seq):
+    return [
+        np.full((5, 7, 3), seq, dtype=np.uint8),
+        np.full((5, 7), seq * 0.5, dtype=np.float32),
+    ]
+
+
+def test_ring_write_read():
+    with SharedFrameRing([((5, 7, 3), np.uint8), ((5, 7), np.float32)], 3) as ring:
+        assert ring.read(0) is None
+        for seq in range(7):
+            ring.write(seq, _stereo_frame(seq))
+            image, depth = ring.read(seq)
+            assert image.dtype == np.uint8 and np.all(image == seq)
+            assert depth.dtype == np.float32 and np.all(depth == seq * 0.5)
+            # the slot of the frame seq - slots has been reused
+            assert ring.read(seq - 3) is None
+        # the images are 64 bytes aligned
+        assert all(part.ctypes.data % 64 == 0 for part in ring.read(6))
+
+
+def test_ring_attach():
+    ring = SharedFrameRing([((4, 4), np.uint16)], 2)
+    other = SharedFrameRing.attach(ring.spec)
+    try:
+        assert not other.owner
+        other.write(5, [np.arange(16, dtype=np.uint16).reshape(4, 4)])
+        (image,) = ring.read(5)
+        np.testing.assert_array_equal(image, np.arange(16).reshape(4, 4))
+        other.invalidate(5)
+        assert ring.read(5) is None
+    finally:
+        other.close()
+        ring.close()
+
+
+def test_ring_write_mismatch():
+    with SharedFrameRing([((4, 4), np.uint8)], 2) as ring:
+        with pytest.raises(ValueError):
+            ring.write(0, [np.zeros((4, 5), dtype=np.uint8)])
+        with pytest.raises(ValueError):
+            ring.write(0, [np.zeros((4, 4), dtype=np.uint8)] * 2)
+        with pytest.raises(TypeError):
+            ring.write(0, [np.zeros((4, 4), dtype=np.float64)])
+
+
+def test_ring_close():
+    ring = SharedFrameRing([((4, 4), np.uint8)], 2)
+    name = ring.spec[2]
+    ring.write(0, [np.ones((4, 4), dtype=np.uint8)])
+    # a view still held by the caller does not prevent the close
+    (image,) = ring.read(0)
+    ring.close()
+    ring.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
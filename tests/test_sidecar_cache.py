@@ -0,0 +1,74 @@
+import os
+import numpy as np
+from sidecar_cache import load_cached, sidecar_path
+
+
+def _hidden_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("."))
+
+
+class _Parser:
+    """Parse a text file with np.loadtxt, counting the calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, file_name):
+        self.calls += 1
+        return np.loadtxt(file_name, ndmin=2)
+
+
+def _write(path, rows):
+    np.savetxt(path, rows)
+    return str(path)
+
+
+def test_load_cached(tmp_path):
+    rows = np.arange(12.0).reshape(4, 3)
+    file_name = _write(tmp_path / "values.txt", rows)
+    parse = _Parser()
+    for _ in range(3):
+        np.testing.assert_array_equal(load_cached(file_name, parse), rows)
+    assert parse.calls == 1
+    assert _hidden_files(tmp_path) == [os.path.basename(sidecar_path(file_name))]
+
+    data = load_cached(file_name, parse, mmap_mode="r")
+    assert isinstance(data, np.memmap)
+    np.testing.assert_array_equal(data, rows)
+
+
+def test_changed_file_replaces_the_sidecar(tmp_path):
+    file_name = _write(tmp_path / "values.txt", np.zeros((2, 3)))
+    parse = _Parser()
+    load_cached(file_name, parse)
+    old_cache = sidecar_path(file_name)
+
+    rows = np.ones((5, 3))
+    _write(tmp_path / "values.txt", rows)
+    stat = os.stat(file_name)
+    os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    np.testing.assert_array_equal(load_cached(file_name, parse), rows)
+    assert parse.calls == 2
+    assert sidecar_path(file_name) != old_cache
+    assert _hidden_files(tmp_path) == [os.path.basename(sidecar_path(file_name))]
+
+
+def test_without_cache(tmp_path):
+    file_name = _write(tmp_path / "values.txt", np.zeros((2, 3)))
+    parse = _Parser()
+    load_cached(file_name, parse, use_cache=False)
+    load_cached(file_name, parse, use_cache=False)
+    assert parse.calls == 2
+    assert _hidden_files(tmp_path) == []
+
+
+def test_sidecar_that_cannot_be_saved(tmp_path, monkeypatch):
+    def replace(src, dst):
+        raise PermissionError(dst)
+
+    monkeypatch.setattr(os, "replace", replace)
+    rows = np.arange(6.0).reshape(2, 3)
+    file_name = _write(tmp_path / "values.txt", rows)
+    # the file is parsed and the temporary file is removed
+    np.testing.assert_array_equal(load_cached(file_name, _Parser()), rows)
+    assert _hidden_files(tmp_path) == []
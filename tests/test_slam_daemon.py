@@ -0,0 +1,94 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import numpy as np
+import pytest
+import slampy
+from conftest import MOCK_SETTINGS
+from slam_daemon import SlamClient, SlamDaemon, _request, stop_daemon
+
+
+@pytest.fixture
+def daemon():
+    """A SlamDaemon serving on a thread, stopped at the end of the test"""
+    # the path of a Unix socket is limited to about 100 characters
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, "slampy.sock")
+    daemon = SlamDaemon(socket_path, max_idle=1)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    while not os.path.exists(socket_path):
+        thread.join(0.01)
+    yield daemon
+    if os.path.exists(socket_path):
+        stop_daemon(socket_path)
+    thread.join(10)
+    assert not thread.is_alive()
+    os.rmdir(directory)
+
+
+def _run(app, num_frames):
+    image = np.zeros((24, 32, 3), dtype=np.uint8)
+    states = []
+    poses = []
+    for i in range(num_frames):
+        states.append(app.process_image_mono(image, i * 0.1))
+        poses.append(app.get_pose_to_target())
+    return states, poses, app.get_depth()
+
+
+def test_daemon_round_trip(daemon):
+    local = slampy.System(MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    expected_states, expected_poses, expected_depth = _run(local, 6)
+
+    for reused in [False, True]:
+        app = SlamClient(daemon.socket_path, MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+        assert app.reused == reused
+        # the system has been reset by the previous session
+        states, poses, depth = _run(app, 6)
+        assert states == expected_states
+        assert states[-1] == slampy.State.OK
+        for pose, expected in zip(poses, expected_poses):
+            if expected is None:
+                assert pose is None
+            else:
+                np.testing.assert_array_equal(pose, expected)
+        np.testing.assert_array_equal(depth, expected_depth)
+        np.testing.assert_array_equal(app.pose_array, local.pose_array)
+        app.shutdown()
+
+    assert daemon.get_stats() == {"built": 1, "reused": 1, "sessions": 2, "idle": 1}
+
+
+def test_daemon_sessions(daemon):
+    first = SlamClient(daemon.socket_path, MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    # the idle system is in use, a second session gets a new one
+    second = SlamClient(daemon.socket_path, MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    assert not first.reused and not second.reused
+    with pytest.raises(Exception, match="can not be called"):
+        _request(first.sock, {"cmd": "call", "method": "shutdown"})
+    with pytest.raises(Exception, match="sensor type"):
+        first.process_image_stereo(np.zeros(3), np.zeros(3), 0.0)
+
+    # a client that disconnects w/o closing the session releases its system too
+    first.sock.close()
+    deadline = time.monotonic() + 10
+    while daemon.get_stats()["idle"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    other = SlamClient(daemon.socket_path, MOCK_SETTINGS, slampy.Sensor.MONOCULAR)
+    assert other.reused
+    stats = other.get_daemon_stats()
+    assert stats["built"] == 2 and stats["sessions"] == 3
+    other.shutdown()
+    second.shutdown()
+
+
+def test_daemon_already_running(daemon):
+    with pytest.raises(RuntimeError):
+        SlamDaemon(daemon.socket_path).serve_forever()
+    # the running daemon still serves
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon.socket_path)
+        assert _request(sock, {"cmd": "stats"})[0]["ok"]
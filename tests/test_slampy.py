@@ -0,0 +1,217 @@
+import numpy as np
+import pytest
+import slampy
+
+IMAGE_SHAPE = (48, 64, 3)
+
+
+def _pose(angle, translation):
+    pose = np.eye(4)
+    pose[0, 0] = pose[2, 2] = np.cos(angle)
+    pose[0, 2] = np.sin(angle)
+    pose[2, 0] = -np.sin(angle)
+    pose[:3, 3] = translation
+    return pose
+
+
+def _loop_projection(points, pose_from_target, camera_matrix, shape):
+    """The points of the image, as computed by the original loop of System._get_2d_point
+
+    The points behind the camera are skipped, the original loop used the image
+    point of the previous one.
+    """
+    points2D = []
+    for point in points:
+        point = np.append(point, [1]).reshape(4, 1)
+        camera_points = np.dot(pose_from_target, point)[:, 0]
+        if camera_points[2] <= 0:
+            continue
+        u = (
+            camera_matrix[0, 0] * (camera_points[0] / camera_points[2])
+            + camera_matrix[0, 2]
+        )
+        v = (
+            camera_matrix[1, 1] * (camera_points[1] / camera_points[2])
+            + camera_matrix[1, 2]
+        )
+        if int(v) in range(0, shape[0]):
+            if int(u) in range(0, shape[1]):
+                points2D.append([camera_points, (int(u), int(v))])
+    return points2D
+
+
+def _nearest(points2D):
+    """Keep only the nearest point of each pixel, in the order of the points"""
+    nearest = {}
+    for i, (camera_points, pixel) in enumerate(points2D):
+        if pixel not in nearest or camera_points[2] < points2D[nearest[pixel]][0][2]:
+            nearest[pixel] = i
+    return [points2D[i] for i in sorted(nearest.values())]
+
+
+def _tracked_system(fake_system, cloud, pose):
+    app = fake_system()
+    app.slam.cloud = cloud
+    app.slam.pose = pose
+    image = np.random.default_rng(1).integers(0, 256, IMAGE_SHAPE, dtype=np.uint8)
+    assert app.process_image_mono(image, 0.0) == slampy.State.OK
+    return app, image
+
+
+def test_projection_matches_the_loop(fake_system):
+    rng = np.random.default_rng(0)
+    # more points than pixels, so many of them fall in the same pixel, some are
+    # behind the camera or out of the image
+    cloud = np.stack(
+        [
+            rng.uniform(-3, 3, 5000),
+            rng.uniform(-2, 2, 5000),
+            rng.uniform(-1, 6, 5000),
+        ],
+        axis=1,
+    )
+    pose = _pose(0.2, [0.3, -0.1, -1.0])
+    app, image = _tracked_system(fake_system, cloud, pose)
+
+    expected = _nearest(
+        _loop_projection(
+            cloud, np.linalg.inv(pose), app.slam.camera_matrix, IMAGE_SHAPE
+        )
+    )
+    expected_points = np.array([cp for cp, _ in expected])
+    expected_pixels = np.array([pixel for _, pixel in expected])
+    assert 100 < len(expected) < 5000
+
+    point_cloud = app.get_point_cloud()
+    assert point_cloud.shape == (len(expected), 4)
+    np.testing.assert_allclose(point_cloud, expected_points, rtol=1e-12, atol=1e-12)
+
+    depth = app.get_depth()
+    expected_depth = np.full(IMAGE_SHAPE[0:2], -1.0)
+    expected_depth[expected_pixels[:, 1], expected_pixels[:, 0]] = expected_points[:, 2]
+    np.testing.assert_allclose(depth, expected_depth, rtol=1e-12)
+
+    colored = app.get_point_cloud_colored()
+    assert len(colored) == len(expected)
+    for (point, color), (u, v) in zip(colored, expected_pixels):
+        np.testing.assert_array_equal(color, image[v, u])
+
+
+def test_projection_without_points(fake_system):
+    app, _ = _tracked_system(fake_system, np.empty((0, 3)), np.eye(4))
+    assert app.get_point_cloud().shape == (0, 4)
+    assert np.all(app.get_depth() == -1)
+
+    # all the points are behind the camera
+    app, _ = _tracked_system(fake_system, np.array([[0.0, 0.0, -2.0]]), np.eye(4))
+    assert app.get_point_cloud().shape == (0, 4)
+
+
+def test_getters_when_lost(fake_system):
+    app = fake_system()
+    app.slam.state = slampy.State.LOST
+    assert app.process_image_mono(np.zeros(IMAGE_SHAPE), 0.0) == slampy.State.LOST
+    assert app.get_pose_to_target() is None
+    assert app.get_point_cloud() is None
+    assert app.get_point_cloud_colored() is None
+    assert app.get_depth() is None
+
+
+def test_values_are_read_once_per_frame(fake_system):
+    app, _ = _tracked_system(fake_system, np.array([[0.0, 0.0, 2.0]]), np.eye(4))
+    app.slam.calls.clear()
+    for _ in range(3):
+        app.get_pose_to_target()
+        app.get_pose_from_target()
+        app.get_point_cloud()
+        app.get_depth()
+    # the state and the pose can be already read while processing the frame
+    assert app.slam.calls["cloud"] == app.slam.calls["camera_matrix"] == 1
+    assert app.slam.calls["state"] <= 1 and app.slam.calls["pose"] <= 1
+    stats = app.get_cache_stats()
+    assert stats["projection"]["misses"] == stats["inverse_pose"]["misses"] == 1
+    assert stats["projection"]["hits"] >= 5 and stats["inverse_pose"]["hits"] >= 2
+
+
+def test_cache_is_dropped_on_new_frame_and_reset(fake_system):
+    app, image = _tracked_system(fake_system, np.array([[0.0, 0.0, 2.0]]), np.eye(4))
+    assert app.get_depth()[24, 32] == 2.0
+
+    app.slam.cloud = np.array([[0.0, 0.0, 3.0]])
+    assert app.get_depth()[24, 32] == 2.0
+    app.process_image_mono(image, 1.0)
+    assert app.get_depth()[24, 32] == 3.0
+
+    app.slam.state = slampy.State.LOST
+    assert app.get_depth() is not None
+    app.reset()
+    assert app.get_state() == slampy.State.LOST
+    assert app.get_depth() is None
+
+
+def test_cached_values_are_read_only(fake_system):
+    app, _ = _tracked_system(fake_system, np.array([[0.0, 0.0, 2.0]]), np.eye(4))
+    pose = app.get_pose_to_target()
+    with pytest.raises(ValueError):
+        pose[0, 3] = 5.0
+    np.testing.assert_array_equal(app.get_pose_from_target(), np.eye(4))
+    camera_matrix = app.get_camera_matrix()
+    with pytest.raises(ValueError):
+        camera_matrix[0, 0] = 1.0
+    # the arrays of the SLAM method are left writable
+    assert app.slam.camera_matrix.flags.writeable
+    assert app.slam.pose.flags.writeable
+
+
+def test_relative_pose_counts_the_lost_frames(fake_system):
+    app = fake_system()
+    for i in range(20):
+        pose = np.eye(4)
+        pose[:3, 3] = [i, 2 * i, 0]
+        app.slam.pose = pose
+        app.slam.state = slampy.State.LOST if i == 17 else slampy.State.OK
+        app.process_image_mono(np.zeros(IMAGE_SHAPE), 0.1 * i)
+    np.testing.assert_allclose(
+        app.get_pose_to_target(precedent_frame=4)[:3, 3], [4, 8, 0]
+    )
+    # the frame 17 was not tracked, so it is not counted by pose_array
+    assert app.get_pose_to_target(precedent_frame=2) is None
+    assert len(app.pose_array) == 19
+
+
+def test_sparse_depth_matches_the_dense_one(fake_system):
+    rng = np.random.default_rng(2)
+    cloud = rng.uniform([-2, -2, 0.5], [2, 2, 5], (500, 3))
+    app, _ = _tracked_system(fake_system, cloud, np.eye(4))
+    sparse = app.get_sparse_depth()
+    assert sparse.shape == IMAGE_SHAPE[0:2]
+    assert len(sparse.u) == len(sparse.v) == len(sparse.z) > 0
+    np.testing.assert_array_equal(sparse.to_dense(), app.get_depth())
+    np.testing.assert_array_equal(sparse.z, app.get_point_cloud()[:, 2])
+
+
+def test_color_image_is_loaded_only_when_needed(fake_system):
+    app = fake_system()
+    app.slam.cloud = np.array([[0.0, 0.0, 2.0]])
+    gray = np.full(IMAGE_SHAPE[0:2], 7, dtype=np.uint8)
+    color = np.full(IMAGE_SHAPE, 9, dtype=np.uint8)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return color
+
+    app.process_image_mono(gray, 0.0, color_image=load)
+    app.get_depth()
+    assert loads == []
+    for _ in range(2):
+        ((_, point_color),) = app.get_point_cloud_colored()
+        np.testing.assert_array_equal(point_color, [9, 9, 9])
+    assert loads == [1]
+    # the image of the caller is not made read-only by the cache
+    assert color.flags.writeable
+
+    # w/o a color image, the gray one is repeated on the 3 channels
+    app.process_image_mono(gray, 0.1)
+    ((_, point_color),) = app.get_point_cloud_colored()
+    np.testing.assert_array_equal(point_color, [7, 7, 7])
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+import numpy as np
+import pytest
+from tracing import NULL_SPAN, LatencyHistogram, Tracer
+
+
+def test_histogram_percentiles():
+    rng = np.random.default_rng(0)
+    durations = rng.lognormal(13, 1.0, 20000).astype(np.int64)
+    histogram = LatencyHistogram()
+    for duration in durations:
+        histogram.add(int(duration))
+    assert histogram.count == len(durations)
+    assert histogram.total == durations.sum()
+    for q in [50, 95, 99]:
+        assert histogram.percentile(q) == pytest.approx(
+            np.percentile(durations, q), rel=0.03
+        )
+    assert histogram.percentile(100) <= histogram.max == durations.max()
+    assert LatencyHistogram().percentile(50) == 0.0
+
+
+def test_summary_of_recorded_spans():
+    tracer = Tracer()
+    for duration_ms in [1, 2, 3, 4]:
+        tracer.record("save", 0, duration_ms * 1000000)
+    summary = tracer.get_summary()["save"]
+    assert summary["count"] == 4
+    assert summary["total"] == pytest.approx(10.0)
+    assert summary["mean"] == pytest.approx(2.5)
+    assert summary["max"] == pytest.approx(4.0)
+    assert summary["p50"] == pytest.approx(2.0, rel=0.03)
+    assert "save" in tracer.format_summary()
+
+
+def test_frame_records():
+    tracer = Tracer()
+    for frame in range(3):
+        tracer.begin_frame(frame)
+        tracer.record("track", 0, 2000000)
+        tracer.record("track", 0, 1000000)
+        tracer.record("depth", 0, 500000)
+        tracer.end_frame()
+    # a span out of the frames is not in the records
+    tracer.record("track", 0, 7000000)
+    assert [record["frame"] for record in tracer.frames] == [0, 1, 2]
+    for record in tracer.frames:
+        assert record["track"] == pytest.approx(3.0)
+        assert record["depth"] == pytest.approx(0.5)
+    assert tracer.get_summary()["frame"]["count"] == 3
+    assert tracer.get_summary()["track"]["count"] == 7
+
+
+def test_nested_spans_count_their_self_time():
+    tracer = Tracer()
+    tracer.begin_frame(0)
+    with tracer.span("depth"):
+        with tracer.span("projection"):
+            with tracer.span("cloud"):
+                time.sleep(0.002)
+            time.sleep(0.001)
+        time.sleep(0.001)
+    tracer.end_frame()
+    record = tracer.frames[0]
+    summary = tracer.get_summary()
+    # the histograms keep the whole duration of the spans
+    assert summary["depth"]["total"] > summary["projection"]["total"] > 3.0
+    assert record["cloud"] == pytest.approx(summary["cloud"]["total"])
+    assert record["projection"] == pytest.approx(
+        summary["projection"]["total"] - summary["cloud"]["total"]
+    )
+    assert record["depth"] == pytest.approx(
+        summary["depth"]["total"] - summary["projection"]["total"]
+    )
+    stages = record["depth"] + record["projection"] + record["cloud"]
+    assert stages == pytest.approx(summary["depth"]["total"])
+    assert stages <= summary["frame"]["total"]
+
+
+def test_spans_of_other_threads_are_not_in_the_frame():
+    tracer = Tracer()
+    tracer.begin_frame(0)
+    thread = threading.Thread(target=tracer.wrap("write", lambda: None))
+    thread.start()
+    thread.join()
+    with tracer.span("track"):
+        pass
+    tracer.end_frame()
+    assert "write" not in tracer.frames[0] and "track" in tracer.frames[0]
+    assert tracer.get_summary()["write"]["count"] == 1
+
+
+def test_disabled_tracer():
+    tracer = Tracer(enabled=False)
+    function = lambda: 1
+    assert tracer.span("track") is NULL_SPAN
+    assert tracer.wrap("write", function) is function
+    tracer.begin_frame(0)
+    with tracer.span("track"):
+        pass
+    tracer.end_frame()
+    assert tracer.get_summary() == {} and len(tracer.frames) == 0
+
+
+def test_chrome_trace(tmp_path):
+    tracer = Tracer(max_events=3)
+    for i in range(5):
+        with tracer.span("track", frame=i):
+            pass
+    filename = str(tmp_path / "trace.json")
+    tracer.save_chrome_trace(filename)
+    with open(filename) as f:
+        events = json.load(f)["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    # only the last max_events are kept
+    assert [event["args"]["frame"] for event in spans] == [2, 3, 4]
+    assert all(event["dur"] >= 0 for event in spans)
+    assert any(event["ph"] == "M" for event in events)
@@ -0,0 +1,108 @@
+import os
+import types
+import numpy as np
+import pytest
+import yaml
+from conftest import write_image
+from slampy import SparseDepth
+from utils import (
+    get_error,
+    load_image,
+    load_sparse_depth,
+    save_depth,
+    save_sparse_depth,
+    write_reduced_settings,
+)
+
+
+def _sparse_depth(shape=(30, 40), count=200):
+    rng = np.random.default_rng(0)
+    pixels = rng.choice(shape[0] * shape[1], count, replace=False)
+    return SparseDepth(
+        pixels % shape[1], pixels // shape[1], rng.uniform(1, 50, count), shape
+    )
+
+
+def test_save_depth(tmp_path):
+    import cv2
+
+    depth = np.array([[1.5, -1.0, 0.0], [np.nan, 300.0, 100.0]])
+    save_depth(str(tmp_path / "000000"), depth)
+    depth_raw = cv2.imread(str(tmp_path / "000000.png"), -1)
+    assert depth_raw.dtype == np.uint16
+    # the invalid depths are saved as 0, the ones out of the 16 bit range are clipped
+    np.testing.assert_array_equal(depth_raw, [[384, 0, 0], [0, 65535, 25600]])
+
+
+def test_sparse_depth_round_trip(tmp_path):
+    depth = _sparse_depth()
+    save_sparse_depth(str(tmp_path / "000000"), depth)
+    loaded = load_sparse_depth(str(tmp_path / "000000.npz"))
+    assert loaded.shape == depth.shape
+    np.testing.assert_array_equal(loaded.u, depth.u)
+    np.testing.assert_array_equal(loaded.v, depth.v)
+    # the depth is stored as float32
+    np.testing.assert_allclose(loaded.z, depth.z, rtol=1e-6)
+
+
+def test_get_error_of_sparse_and_dense_depth(tmp_path):
+    depth = _sparse_depth()
+    rng = np.random.default_rng(1)
+    gt_raw = (rng.uniform(1, 60, depth.shape) * 256).astype(np.uint16)
+    gt_raw[:5] = 0  # no gt
+    args = types.SimpleNamespace(data_type="KITTI_VO", dest=str(tmp_path))
+    dense_err = get_error(args, "dense", depth.to_dense(), gt_raw)
+    sparse_err = get_error(args, "sparse", depth, gt_raw)
+    np.testing.assert_allclose(sparse_err, dense_err, rtol=1e-12)
+
+
+@pytest.mark.parametrize("reduction", [1, 2, 4, 8])
+def test_load_image(tmp_path, reduction):
+    path = str(tmp_path / "000000.png")
+    write_image(path, 80, (48, 64, 3))
+    image = load_image(path, reduction=reduction)
+    assert image.shape == (48 // reduction, 64 // reduction, 3)
+    gray = load_image(path, gray=True, reduction=reduction)
+    assert gray.shape == (48 // reduction, 64 // reduction)
+    assert np.all(gray == 80)
+
+
+def test_load_image_errors(tmp_path):
+    with pytest.raises(ValueError, match="failed to load"):
+        load_image(str(tmp_path / "missing.png"))
+    with pytest.raises(ValueError, match="reduction"):
+        load_image(str(tmp_path / "missing.png"), reduction=3)
+
+
+def test_write_reduced_settings(tmp_path):
+    method_settings = tmp_path / "orb.yaml"
+    method_settings.write_text(
+        "%YAML:1.0\n"
+        "Camera.fx: 718.856\n"
+        "Camera.cx: 607.1928\n"
+        "Camera.bf: 386.1448\n"
+        "Camera.width: 1241\n"
+        "ORBextractor.nFeatures: 2000\n"
+    )
+    settings = tmp_path / "settings.yaml"
+    settings.write_text(
+        'SLAM.alg: "OrbSlam2"\n'
+        f'SLAM.settings_path: "{method_settings}"\n'
+        "Mock.fy: 100.0\n"
+    )
+    dest = str(tmp_path / "dest")
+    new_settings = write_reduced_settings(str(settings), 2, dest)
+
+    with open(new_settings) as f:
+        params = yaml.safe_load(f)
+    assert params["Mock.fy"] == 50.0
+    assert os.path.dirname(params["SLAM.settings_path"]) == os.path.abspath(dest)
+    with open(params["SLAM.settings_path"]) as f:
+        lines = f.read().split("\n")
+    assert lines[0] == "%YAML:1.0"
+    assert lines[1] == "Camera.fx: 359.428"
+    # the center of the first pixel stays at the center of the first pixel
+    assert float(lines[2].split(": ")[1]) == pytest.approx((607.1928 + 0.5) / 2 - 0.5)
+    assert float(lines[3].split(": ")[1]) == pytest.approx(386.1448 / 2)
+    assert lines[4] == "Camera.width: 620"
+    assert lines[5] == "ORBextractor.nFeatures: 2000"
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from voxel_map import VoxelMap, voxel_keys
+
+
+def _grouped(frames, voxel_size):
+    """The voxels of the frames, grouped with a dict of the voxel coordinates"""
+    voxels = {}
+    for points, colors in frames:
+        for point, color in zip(points, colors):
+            if not np.all(np.isfinite(point)):
+                continue
+            voxel = voxels.setdefault(
+                tuple(np.floor(point / voxel_size).astype(int)),
+                [np.zeros(3), np.zeros(3), 0],
+            )
+            voxel[0] += point
+            voxel[1] += color
+            voxel[2] += 1
+    return {
+        coords: (xyz / count, np.rint(color / count), count)
+        for coords, (xyz, color, count) in voxels.items()
+    }
+
+
+def _frames(num_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(num_frames):
+        points = rng.normal(0, 2, (300, 3)) + np.array([i * 0.5, 0, 0])
+        points[::50] = np.nan
+        colors = rng.integers(0, 256, (300, 3))
+        frames.append((points, colors))
+    return frames
+
+
+def test_voxel_map_matches_grouping():
+    frames = _frames(8)
+    voxel_map = VoxelMap(voxel_size=0.7)
+    for points, colors in frames:
+        voxel_map.insert(points, colors)
+    points, colors, counts = voxel_map.export()
+    expected = _grouped(frames, 0.7)
+
+    assert len(voxel_map) == len(points) == len(expected)
+    assert counts.sum() == sum(count for _, _, count in expected.values())
+    for point, color, count in zip(points, colors, counts):
+        coords = tuple(np.floor(point / 0.7).astype(int))
+        expected_point, expected_color, expected_count = expected[coords]
+        np.testing.assert_allclose(point, expected_point, rtol=1e-12)
+        np.testing.assert_array_equal(color, expected_color)
+        assert count == expected_count
+    assert colors.dtype == np.uint8
+
+
+def test_voxel_map_without_colors():
+    voxel_map = VoxelMap(voxel_size=1.0)
+    voxel_map.insert([[0.5, 0.5, 0.5], [0.1, 0.2, 0.3], [5.0, 0.0, 0.0]])
+    voxel_map.insert(np.empty((0, 3)))
+    points, colors, counts = voxel_map.export()
+    np.testing.assert_allclose(points, [[0.3, 0.35, 0.4], [5.0, 0.0, 0.0]])
+    assert np.all(colors == 0)
+    assert list(counts) == [2, 1]
+    assert voxel_map.inserts == 2
+
+
+def test_voxel_map_eviction():
+    voxel_map = VoxelMap(voxel_size=1.0, max_points=12)
+    old = np.arange(10)[:, np.newaxis] * np.array([[1.0, 0.0, 0.0]]) + 0.5
+    new = old + np.array([0.0, 5.0, 0.0])
+    voxel_map.insert(old)
+    voxel_map.insert(new)
+    # the map is over the budget: the voxels seen the longest ago are evicted
+    # down to EVICTION_TARGET of the budget
+    assert len(voxel_map) == 9
+    assert voxel_map.evicted == 11
+    points, _, _ = voxel_map.export()
+    assert set(voxel_keys(points, 1.0)) <= set(voxel_keys(new, 1.0))
+
+    # the old voxels are added again from scratch
+    voxel_map.insert(old[:2])
+    points, _, counts = voxel_map.export()
+    assert len(voxel_map) == 11
+    np.testing.assert_allclose(points[-2:], old[:2])
+    assert list(counts[-2:]) == [1, 1]
+
+
+def test_voxel_keys():
+    points = np.array(
+        [[0.0, 0.0, 0.0], [0.99, 0.5, 0.1], [-0.01, 0.0, 0.0], [np.inf, 0, 0]]
+    )
+    keys = voxel_keys(points, 1.0)
+    assert keys[0] == keys[1] != keys[2]
+    assert keys[3] == -1
+    assert voxel_keys([[1e9, 0.0, 0.0]], 0.1)[0] == -1
+
+
+def test_voxel_map_arguments():
+    with pytest.raises(ValueError):
+        VoxelMap(voxel_size=0)
+    with pytest.raises(ValueError):
+        VoxelMap(max_points=0)
@@ -0,0 +1,311 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+
+# each histogram bucket spans a factor 2 ** (1 / HISTOGRAM_SUBBUCKETS) of durations,
+# so the percentiles are within about 2% of the exact value
+HISTOGRAM_SUBBUCKETS = 32
+
+
+class LatencyHistogram:
+    """This class counts durations in log-spaced buckets, to get their percentiles in constant memory."""
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, duration_ns):
+        """Add a duration in nanoseconds"""
+        bucket = (
+            int(math.log2(duration_ns) * HISTOGRAM_SUBBUCKETS)
+            if duration_ns > 0
+            else -1
+        )
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += duration_ns
+        self.max = max(self.max, duration_ns)
+
+    def percentile(self, q):
+        """Get the q-th percentile (0-100) of the durations in nanoseconds, 0 if there are no durations"""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                if bucket < 0:
+                    return 0.0
+                # the geometric center of the bucket, never over the max
+                return min(2 ** ((bucket + 0.5) / HISTOGRAM_SUBBUCKETS), self.max)
+        return float(self.max)
+
+
+class _NullSpan:
+    """The span returned by a disabled Tracer, it does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start", "nested")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.nested = self.tracer._open_span()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        children = self.tracer._close_span() if self.nested else 0
+        self.tracer.record(self.name, self.start, end, self.args, children)
+        return False
+
+
+class Tracer:
+    """This class measures the time spent in named spans of code.
+
+    Every span updates the latency histogram of its name and is kept as an event
+    (up to max_events, the oldest are dropped) for the Chrome trace export. The
+    spans run between begin_frame and end_frame, on the same thread, are also
+    summed in a per-frame record, with the milliseconds spent in each stage of the
+    frame. A stage gets the self time of its spans: the time of the spans nested in
+    them goes to their own stages, so the stages of a frame are not counted twice.
+
+    A disabled tracer returns a shared span that does nothing, so the instrumented
+    code can be left in place at almost no cost.
+
+    Usage example:
+        tracer = Tracer()
+        tracer.begin_frame(idx)
+        with tracer.span("track"):
+            app.process_image_mono(image, tframe)
+        tracer.end_frame()
+        tracer.save_chrome_trace("trace.json")
+        print(tracer.format_summary())
+    """
+
+    def __init__(self, enabled=True, max_events=1000000):
+        """Build the tracer
+
+        Args:
+            enabled (bool): if false, the spans are not measured. Defaults to True
+            max_events (int): the max number of events kept for the trace export. Defaults to 1000000
+        """
+        self.enabled = enabled
+        self.histograms = defaultdict(LatencyHistogram)
+        self.events = deque(maxlen=max_events)
+        self.frames = deque(maxlen=max_events)
+        self.thread_names = {}
+        self._frame = None
+        self._frame_stages = None
+        self._frame_thread = None
+        # the time spent in the children of each open span of the frame thread
+        self._children = []
+        self._lock = threading.Lock()
+
+    def span(self, name, **args):
+        """Get a context manager that measures the time spent in it
+
+        Args:
+            name (str): the name of the span
+            **args: extra values saved in the trace event
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, args)
+
+    def begin_frame(self, frame_id):
+        """Start a frame, the spans of this thread are summed in its record until end_frame
+
+        Args:
+            frame_id (int): the index of the frame
+        """
+        if not self.enabled:
+            return
+        self._frame = (frame_id, time.perf_counter_ns())
+        self._frame_thread = threading.get_ident()
+        self._frame_stages = {}
+        self._children = []
+
+    def end_frame(self):
+        """End the frame started by begin_frame, and save it as a "frame" span and a per-frame record"""
+        if not self.enabled or self._frame is None:
+            return
+        end = time.perf_counter_ns()
+        frame_id, start = self._frame
+        with self._lock:
+            record = {"frame": frame_id}
+            record.update(
+                {name: duration / 1e6 for name, duration in self._frame_stages.items()}
+            )
+            self._frame = None
+            self._frame_stages = None
+            self._children = []
+        self.record("frame", start, end, record)
+        self.frames.append(record)
+
+    def wrap(self, name, function):
+        """Get a function that runs `function` in a span (e.g. a job run on another thread)
+
+        Returns:
+            the wrapped function, or `function` itself if the tracer is disabled
+        """
+        if not self.enabled:
+            return function
+
+        def traced(*args, **kwargs):
+            with self.span(name):
+                return function(*args, **kwargs)
+
+        return traced
+
+    def _open_span(self):
+        """Start tracking the children of a span, if it runs in the frame thread
+
+        Returns:
+            true if the span must call _close_span when it ends
+        """
+        if self._frame_stages is None or threading.get_ident() != self._frame_thread:
+            return False
+        self._children.append(0)
+        return True
+
+    def _close_span(self):
+        """Get the time spent in the children of the span that ends"""
+        return self._children.pop() if self._children else 0
+
+    def record(self, name, start, end, args=None, children=0):
+        """Add a span measured by the caller
+
+        Args:
+            name (str): the name of the span
+            start (int): the start time, from time.perf_counter_ns
+            end (int): the end time, from time.perf_counter_ns
+            args (dict): extra values saved in the trace event. Defaults to None
+            children (int): the nanoseconds spent in the spans nested in this one, not counted in its stage. Defaults to 0
+        """
+        if not self.enabled:
+            return
+        thread_id = threading.get_ident()
+        duration = end - start
+        with self._lock:
+            if thread_id not in self.thread_names:
+                self.thread_names[thread_id] = threading.current_thread().name
+            self.histograms[name].add(duration)
+            self.events.append((name, start, duration, thread_id, args))
+            if self._frame_stages is not None and thread_id == self._frame_thread:
+                self._frame_stages[name] = (
+                    self._frame_stages.get(name, 0) + duration - children
+                )
+                if self._children:
+                    # the parent span does not count this one in its stage
+                    self._children[-1] += duration
+
+    def get_summary(self):
+        """Get the statistics of each span name
+
+        Returns:
+            a dict that maps each name to a dict with count, total, mean, p50, p95, p99 and max, in milliseconds
+        """
+        with self._lock:
+            summary = {}
+            for name, histogram in self.histograms.items():
+                summary[name] = {
+                    "count": histogram.count,
+                    "total": histogram.total / 1e6,
+                    "mean": histogram.total / histogram.count / 1e6,
+                    "p50": histogram.percentile(50) / 1e6,
+                    "p95": histogram.percentile(95) / 1e6,
+                    "p99": histogram.percentile(99) / 1e6,
+                    "max": histogram.max / 1e6,
+                }
+            return summary
+
+    def format_summary(self):
+        """Get the summary as a text table, sorted by total time"""
+        summary = self.get_summary()
+        lines = [
+            "{:<24} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+                "span", "count", "total(ms)", "mean", "p50", "p95", "p99", "max"
+            )
+        ]
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+            lines.append(
+                "{:<24} {:>8} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+                    name,
+                    stats["count"],
+                    stats["total"],
+                    stats["mean"],
+                    stats["p50"],
+                    stats["p95"],
+                    stats["p99"],
+                    stats["max"],
+                )
+            )
+        return "\n".join(lines)
+
+    def save_summary(self, filename):
+        """Save the summary table in a txt file"""
+        with open(filename, "w") as f:
+            f.write(self.format_summary() + "\n")
+
+    def save_chrome_trace(self, filename):
+        """Save the events in the Chrome trace event format (chrome://tracing or ui.perfetto.dev)
+
+        Args:
+            filename (str): path to the json file
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        trace = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in thread_names.items()
+        ]
+        for name, start, duration, thread_id, args in events:
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": start / 1e3,
+                "dur": duration / 1e3,
+                "pid": pid,
+                "tid": thread_id,
+            }
+            if args:
+                event["args"] = args
+            trace.append(event)
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+# the tracer used when the instrumented code is not given one
+NULL_TRACER = Tracer(enabled=False)
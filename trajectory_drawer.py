@@ -1,7 +1,6 @@
 import slampy
 import numpy as np
 import yaml
-import plotly.graph_objects as go
 import time
 
 
@@ -39,6 +38,8 @@ class TrajectoryDrawer:
         self.point_size = self.params["Drawer.point_size"]
         self.drawpointcloud = drawpointcloud
         # initialize the figure
+        import plotly.graph_objects as go
+
         if useFigureWidget == True:
             self.figure = go.FigureWidget()
         else:
@@ -79,13 +80,34 @@ class TrajectoryDrawer:
             ),
         )
         self.prec_camera_center = None
+        self.map_trace = None
 
     def get_figure(self):
         """Return the figure"""
         return self.figure
 
+    def _draw_global_map(self, points, colors, counts):
+        """Draw the global map of the system (see slampy.System.get_global_map) in a single trace, updated in place"""
+        if self.map_trace is None:
+            self.figure.add_scatter3d(
+                mode="markers",
+                marker=dict(size=self.point_size),
+                hoverinfo="skip",
+            )
+            self.map_trace = self.figure.data[-1]
+        with self.figure.batch_update():
+            self.map_trace.x = points[:, 0] * -1
+            self.map_trace.y = points[:, 1] * -1
+            self.map_trace.z = points[:, 2]
+            self.map_trace.marker.color = [
+                "rgb({},{},{})".format(*color) for color in colors.tolist()
+            ]
+
     def plot_trajcetory(self, slampy_app):
         """Compute the trajectory and add it to the figure
+
+        If the system has a global map (System.map_voxel_size), the map is drawn in place of the point cloud of each frame.
+
         Args:
             slampy_app (Slampy): the slampy instance used to compute the pose in the image
         """
@@ -94,7 +116,11 @@ class TrajectoryDrawer:
             pose = slampy_app.get_pose_to_target()
             depth = slampy_app.get_depth()
 
-            if self.drawpointcloud:
+            global_map = slampy_app.get_global_map() if self.drawpointcloud else None
+            if global_map is not None:
+                # the global map replaces the points of the previous frames
+                self._draw_global_map(*global_map)
+            elif self.drawpointcloud:
                 # get the colored point cloud
                 points_colored = slampy_app.get_point_cloud_colored()
 
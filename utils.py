@@ -1,10 +1,11 @@
 from datetime import datetime
+import re
 import time
 import numpy as np
 import os
 import glob
-import cv2
-from PIL import Image
+from slampy import SparseDepth
+from sidecar_cache import load_cached
 
 
 def load_images_KITTI(path_to_sequence):
@@ -37,6 +38,46 @@ def load_images_KITTI(path_to_sequence):
     ], timestamps
 
 
+def load_image(image_name, gray=False, reduction=1):
+    """Load an image from file as an RGB ndarray
+
+    Args:
+        image_name: path to the image file
+        gray (bool): if true, decode the image directly in grayscale. Defaults to False
+        reduction (int): decode the image at 1/reduction of its resolution (1, 2, 4 or 8), the JPEG files are decoded at the reduced size. Defaults to 1
+
+    Returns:
+        the image as ndarray HxWx3 in RGB order, or HxW if gray is true
+
+    Raises:
+        ValueError: if the image cannot be loaded
+    """
+    import cv2
+
+    if reduction not in (1, 2, 4, 8):
+        raise ValueError(f"the reduction must be 1, 2, 4 or 8, not {reduction}")
+    if gray:
+        flags = {
+            1: cv2.IMREAD_GRAYSCALE,
+            2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+            4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+            8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+        }[reduction]
+    else:
+        flags = {
+            1: cv2.IMREAD_COLOR,
+            2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4,
+            8: cv2.IMREAD_REDUCED_COLOR_8,
+        }[reduction]
+    image = cv2.imread(image_name, flags)
+    if image is None:
+        raise ValueError(f"failed to load image {image_name}")
+    if gray:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
 def load_images_TUM(path_to_sequence, file_name):
     """Return the sequence of the images found in the path and the corrispondent timestamp
 
@@ -162,6 +203,8 @@ def get_error_KITTI(points, gt_filename):
 
 def read_depth_KITTI(filename):
     """loads depth map D from png file and returns it as a numpy array,"""
+    from PIL import Image
+
     depth_png = np.array(Image.open(filename), dtype=int)
     # make sure we have a proper 16bit depth map here.. not 8bit!
     assert np.max(depth_png) > 255
@@ -173,6 +216,8 @@ def read_depth_KITTI(filename):
 
 def read_depth_TUM(filename):
     """loads depth map D from png file and returns it as a numpy array,"""
+    from PIL import Image
+
     depth_png = np.array(Image.open(filename), dtype=int)
     # make sure we have a proper 16bit depth map here.. not 8bit!
     assert np.max(depth_png) > 255
@@ -195,6 +240,8 @@ def create_dir(directory):
 def save_depth(dest, depth):
     """Save depth as 16 bit png file
 
+    The depth is stored as depth * 256, the invalid values (<= 0) are stored as 0.
+
     Args:
         dest: path to new 16 bit png image wiht depth, w/o exension
         depth: depth to save, as ndarray HxW
@@ -202,7 +249,47 @@ def save_depth(dest, depth):
     Returns:
         None, but a new 16 bit png image will be saved at dest
     """
-    cv2.imwrite(f"{dest}.png", (depth * 256).astype(np.uint16))
+    import cv2
+
+    depth_raw = np.clip(np.nan_to_num(depth * 256), 0, 65535)
+    cv2.imwrite(f"{dest}.png", depth_raw.astype(np.uint16))
+
+
+def save_sparse_depth(dest, depth):
+    """Save a sparse depth as npz file
+
+    Args:
+        dest: path to new npz file with the depth, w/o exension
+        depth: SparseDepth to save
+
+    Returns:
+        None, but a new npz file will be saved at dest
+    """
+    np.savez(
+        f"{dest}.npz",
+        u=depth.u.astype(np.uint16),
+        v=depth.v.astype(np.uint16),
+        z=depth.z.astype(np.float32),
+        shape=np.array(depth.shape),
+    )
+
+
+def load_sparse_depth(filename):
+    """Load a sparse depth saved with save_sparse_depth
+
+    Args:
+        filename: path to the npz file
+
+    Returns:
+        the SparseDepth stored in the file
+    """
+    with np.load(filename) as data:
+        return SparseDepth(
+            data["u"].astype(np.int64),
+            data["v"].astype(np.int64),
+            data["z"].astype(np.float64),
+            tuple(int(size) for size in data["shape"]),
+        )
 
 
 def save_pose(dest, pose):
@@ -322,17 +409,18 @@ def compute_ate(gtruth_xyz, pred_xyz_o):
     return rmse
 
 
-def save_depth_err_results(file_path, filename, err):
+def save_depth_err_results(file_path, filename, err, verbose=True):
     f = open(file_path, "a+")
-    print("----------------------------------------------")
-    print("image id:{}".format(filename))
-    print(
-        "\n  "
-        + ("{:>8} | " * 7).format(
-            "abs_rel", "sq_rel", "rmse", "rmse_log", "a1", "a2", "a3"
+    if verbose:
+        print("----------------------------------------------")
+        print("image id:{}".format(filename))
+        print(
+            "\n  "
+            + ("{:>8} | " * 7).format(
+                "abs_rel", "sq_rel", "rmse", "rmse_log", "a1", "a2", "a3"
+            )
         )
-    )
-    print(("&{: 8.3f}  " * 7).format(*err) + "\\\\")
+        print(("&{: 8.3f}  " * 7).format(*err) + "\\\\")
 
     f.writelines("----------------------------------------------\n")
     f.writelines("image id:{}".format(filename))
@@ -352,29 +440,58 @@ def get_error(args, filename, points, gt_filename):
     """Get the realtive gt from it's filename and convert the scale of the predictions in order to compute the error
 
     Args:
-        points: the predictions depth
-        gt_filename: the gt references filename
+        points: the predictions depth, as dense ndarray HxW or as SparseDepth
+        gt_filename: the gt references filename, or the 16 bit gt depth already loaded as ndarray
 
     Returns:
         the error computed on this examples
     """
+    if isinstance(gt_filename, np.ndarray):
+        gt_raw = gt_filename
+    else:
+        import cv2
+
+        gt_raw = cv2.imread(gt_filename, -1)
+        if gt_raw is None:
+            print("gt path err {}".format(gt_filename))
+            return None
+    err = compute_depth_errors(points, gt_raw, args.data_type)
+    if err is None:
+        return None
+
+    save_results = os.path.join(args.dest, "results.txt")
+    save_depth_err_results(save_results, filename, err)
+
+    return err
+
+
+def compute_depth_errors(points, gt_raw, data_type):
+    """Scale the predictions with the median ratio to the gt and compute the error
+
+    Args:
+        points: the predictions depth, as dense ndarray HxW (invalid <= 0) or as SparseDepth
+        gt_raw: the 16 bit gt depth as ndarray HxW
+        data_type (str): the dataset type, KITTI_VO or TUM
+
+    Returns:
+        the error computed on this examples, None if the data type is not supported
+    """
     MIN_DEPTH = 1e-3
-    if args.data_type == "KITTI_VO":
+    if data_type == "KITTI_VO":
         MAX_DEPTH = 100
-        gt_depth = cv2.imread(gt_filename, -1) / 256
-        if gt_depth is None:
-            print("gt path err {}".gt_filename)
-            return None
-    elif args.data_type == "TUM":
+        gt_depth = gt_raw / 256
+    elif data_type == "TUM":
         MAX_DEPTH = 10
-        gt_depth = (cv2.imread(gt_filename, -1) / 256) / 5000.0
-        if gt_depth is None:
-            print("gt path err {}".gt_filename)
-            return None
+        gt_depth = (gt_raw / 256) / 5000.0
+    else:
+        print("Error data type {}".format(data_type))
+        return None
+    if isinstance(points, SparseDepth):
+        # compare only the pixels with a prediction, without building the dense map
+        gt_depth = gt_depth[points.v, points.u]
+        pred_depth = points.z
     else:
-        print("Error data type {}".format(args.data_type))
-        return
-    pred_depth = points
+        pred_depth = points
 
     mask_pred = pred_depth > 0
     mask_gt = gt_depth > 0
@@ -387,12 +504,7 @@ def get_error(args, filename, points, gt_filename):
 
     pred_depth[pred_depth < MIN_DEPTH] = MIN_DEPTH
     pred_depth[pred_depth > MAX_DEPTH] = MAX_DEPTH
-    err = compute_errors(gt_depth, pred_depth)
-
-    save_results = os.path.join(args.dest, "results.txt")
-    save_depth_err_results(save_results, filename, err)
-
-    return err
+    return compute_errors(gt_depth, pred_depth)
 
 
 def load_images_KITTI_VO(path_to_sequence):
@@ -532,3 +644,129 @@ def load_IMU_datas_TUM_VI(path_to_sequence):
                 )
 
     return acc_data, gyro_data, timestamp
+
+
+def load_IMU_array(path_to_sequence, use_cache=True):
+    """Load the imu measurements of a TUM_VI or EuRoC sequence in a single array
+
+    The csv file is parsed in bulk and, if use_cache is true, the array is saved
+    in a binary sidecar next to it (see sidecar_cache) and reused until the csv
+    file changes.
+
+    Args:
+        path_to_sequence (str): the path to the sequence, the measurements are in mav0/imu0/data.csv
+        use_cache (bool): if true, use the npy cache of the csv file. Defaults to True
+
+    Returns:
+        an Nx7 float64 array, one imu measure for each row in the form of [acc x, acc y, acc z, gyro x, gyro y, gyro z, timestamp]
+    """
+    csv_path = os.path.join(path_to_sequence, "mav0/imu0/data.csv")
+    return load_cached(csv_path, _parse_IMU_csv, use_cache)
+
+
+def _parse_IMU_csv(csv_path):
+    """Parse the imu csv file of a sequence in the array of load_IMU_array"""
+    # the csv rows are [timestamp (ns), gyro x, gyro y, gyro z, acc x, acc y, acc z]
+    rows = np.loadtxt(csv_path, delimiter=",", comments="#", ndmin=2)
+    imu = np.empty((rows.shape[0], 7))
+    imu[:, 0:3] = rows[:, 4:7]
+    imu[:, 3:6] = rows[:, 1:4]
+    imu[:, 6] = rows[:, 0] * 1e-9
+    return imu
+
+
+def get_IMU_windows(imu_timestamps, frame_timestamps):
+    """Get the imu measurements of each frame, as row ranges of the array of load_IMU_array
+
+    The first frame gets no measurements, the second one gets the measurements
+    from the last one before (or at) the first frame up to its timestamp, the
+    other frames the measurements after the previous frame up to their timestamp.
+
+    Args:
+        imu_timestamps (ndarray): the sorted timestamps of the imu measurements
+        frame_timestamps (list): the timestamps of the frames
+
+    Returns:
+        the arrays start and end, the measurements of frame i are the rows start[i]:end[i]
+
+    Examples:
+        >>> imu = load_IMU_array(dataset)
+        >>> start, end = get_IMU_windows(imu[:, 6], timestamps)
+        >>> app.process_image_imu_mono(image, timestamps[i], imu[start[i] : end[i]])
+    """
+    end = np.searchsorted(imu_timestamps, frame_timestamps, side="right")
+    start = np.empty_like(end)
+    start[0] = end[0]
+    start[1:] = end[:-1]
+    if len(end) > 1:
+        # the second frame starts from the last measurement before the first frame
+        start[1] = max(end[0] - 1, 0)
+    end[0] = start[0]
+    return start, end
+
+
+# the settings that are in pixels, they are scaled with the image resolution
+_PIXEL_SETTINGS = re.compile(
+    r"^(\s*(?:Camera|Mock)\.(fx|fy|cx|cy|bf|width|height)\s*:\s*)([-+0-9.eE]+)(.*)$"
+)
+
+
+def _scale_pixel_setting(match, reduction):
+    """Get the line of a pixel setting for the images decoded at 1/reduction of the resolution"""
+    name, value = match.group(2), float(match.group(3))
+    if name in ("width", "height"):
+        value = str(int(value) // reduction)
+    elif name in ("cx", "cy"):
+        # the pixel centers are scaled, not their corners
+        value = repr((value + 0.5) / reduction - 0.5)
+    else:
+        value = repr(value / reduction)
+    return match.group(1) + value + match.group(4)
+
+
+def write_reduced_settings(settings_file, reduction, dest):
+    """Write the settings for the images decoded at 1/reduction of the resolution
+
+    The camera intrinsics (fx, fy, cx, cy), the stereo baseline times fx (bf) and
+    the image size of the settings file and of the method settings file
+    (SLAM.settings_path) are rescaled, the other settings are copied as they are.
+
+    Args:
+        settings_file (str): the .yaml file of the wrapper
+        reduction (int): the reduction factor of the images
+        dest (str): the directory where the new settings are saved
+
+    Returns:
+        the path to the new settings file of the wrapper
+    """
+
+    def scale_file(path, new_path, replace=None):
+        with open(path) as f:
+            lines = f.read().split("\n")
+        for i, line in enumerate(lines):
+            match = _PIXEL_SETTINGS.match(line)
+            if match is not None:
+                lines[i] = _scale_pixel_setting(match, reduction)
+            elif replace is not None and line.startswith(replace[0]):
+                lines[i] = replace[1]
+        with open(new_path, "w") as f:
+            f.write("\n".join(lines))
+
+    import yaml
+
+    create_dir(dest)
+    with open(settings_file) as f:
+        params = yaml.safe_load(f)
+    replace = None
+    if "SLAM.settings_path" in params:
+        name, ext = os.path.splitext(os.path.basename(params["SLAM.settings_path"]))
+        method_settings = os.path.abspath(
+            os.path.join(dest, f"{name}_reduced_{reduction}{ext}")
+        )
+        scale_file(params["SLAM.settings_path"], method_settings)
+        replace = ("SLAM.settings_path:", f'SLAM.settings_path: "{method_settings}"')
+
+    name, ext = os.path.splitext(os.path.basename(settings_file))
+    new_settings = os.path.join(dest, f"{name}_reduced_{reduction}{ext}")
+    scale_file(settings_file, new_settings, replace)
+    return new_settings
@@ -0,0 +1,192 @@
+from itertools import repeat
+import numpy as np
+
+
+# the layout of a voxel stored in the VoxelMap
+VOXEL_DTYPE = np.dtype(
+    [
+        ("key", np.int64),
+        ("xyz_sum", np.float64, (3,)),
+        ("color_sum", np.float64, (3,)),
+        ("count", np.int64),
+        ("color_count", np.int64),
+        ("last_insert", np.int64),
+    ]
+)
+
+# the bits of each voxel coordinate in a key, the map spans 2 ** KEY_BITS voxels
+# along each axis, centered in the origin
+KEY_BITS = 21
+
+# when the map is over its budget, the stalest voxels are evicted until this fraction of
+# the budget is left, so the eviction (that rebuilds the index) runs only now and then
+EVICTION_TARGET = 0.75
+
+
+def voxel_keys(points, voxel_size):
+    """Get the key of the voxel of each point
+
+    Args:
+        points: ndarray Nx3 with the 3D points
+        voxel_size (float): the edge of a voxel
+
+    Returns:
+        ndarray with the int64 key of the voxel of each point, -1 for the points out of the map or not finite
+    """
+    scaled = np.floor(np.asarray(points, dtype=np.float64) / voxel_size)
+    half = 1 << (KEY_BITS - 1)
+    inside = np.all(np.isfinite(scaled) & (np.abs(scaled) < half), axis=1)
+    coords = scaled[inside].astype(np.int64) + half
+    keys = np.full(len(scaled), -1, dtype=np.int64)
+    keys[inside] = (
+        (coords[:, 0] << (2 * KEY_BITS)) | (coords[:, 1] << KEY_BITS) | coords[:, 2]
+    )
+    return keys
+
+
+class VoxelMap:
+    """This class accumulates the points of many frames in a global map, one point for each voxel.
+
+    The space is split in cubic voxels of edge voxel_size and the points that fall
+    in the same voxel are merged: the map keeps, for each voxel, the mean of its
+    points and of their colors. The voxels are stored in a single structured
+    ndarray (VOXEL_DTYPE) and found through a dict from the voxel key to its row,
+    so the map grows only with the observed space, not with the number of frames.
+
+    If max_points is set, once the map holds more voxels the ones not seen for the
+    longest time are evicted, down to EVICTION_TARGET of the budget, so the memory
+    stays bounded in unbounded runs.
+
+    Usage example:
+        global_map = VoxelMap(voxel_size=0.2, max_points=500000)
+        global_map.insert(points, colors)  # for each frame
+        points, colors, counts = global_map.export()
+    """
+
+    def __init__(self, voxel_size=0.1, max_points=None):
+        """Build an empty map
+
+        Args:
+            voxel_size (float): the edge of a voxel, in the unit of the points. Defaults to 0.1
+            max_points (int): the max number of voxels, None for no limit. Defaults to None
+
+        Raises:
+            ValueError: if voxel_size or max_points are not positive
+        """
+        if voxel_size <= 0:
+            raise ValueError(f"the voxel size must be positive, not {voxel_size}")
+        if max_points is not None and max_points < 1:
+            raise ValueError(
+                f"the max number of points must be positive, not {max_points}"
+            )
+        self.voxel_size = voxel_size
+        self.max_points = max_points
+        self.clear()
+
+    def clear(self):
+        """Drop all the voxels"""
+        self._voxels = np.empty(0, dtype=VOXEL_DTYPE)
+        self._rows = {}  # voxel key: row in _voxels
+        self.size = 0
+        self.inserts = 0  # the number of insert calls since the creation
+        self.evicted = 0  # the number of voxels evicted since the creation
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        """The memory used by the voxel array"""
+        return self._voxels.nbytes
+
+    def insert(self, points, colors=None):
+        """Add the points of a frame to the map
+
+        Args:
+            points: ndarray Nx3 with the 3D points, in the reference frame of the map
+            colors: ndarray Nx3 with the RGB color of each point, None if the points are not colored. Defaults to None
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.inserts += 1
+        keys = voxel_keys(points, self.voxel_size)
+        valid = keys >= 0
+        points, keys = points[valid], keys[valid]
+        if len(keys) == 0:
+            return
+
+        # merge the points of the frame that fall in the same voxel
+        unique, inverse = np.unique(keys, return_inverse=True)
+        xyz_sum = np.stack(
+            [np.bincount(inverse, points[:, i], len(unique)) for i in range(3)], axis=1
+        )
+        count = np.bincount(inverse, minlength=len(unique))
+
+        rows = np.fromiter(
+            map(self._rows.get, unique.tolist(), repeat(-1)),
+            dtype=np.int64,
+            count=len(unique),
+        )
+        new = np.flatnonzero(rows < 0)
+        if len(new) > 0:
+            self._reserve(self.size + len(new))
+            rows[new] = np.arange(self.size, self.size + len(new))
+            self._voxels[self.size : self.size + len(new)] = np.zeros(
+                len(new), dtype=VOXEL_DTYPE
+            )
+            self._voxels["key"][rows[new]] = unique[new]
+            self._rows.update(zip(unique[new].tolist(), rows[new].tolist()))
+            self.size += len(new)
+
+        self._voxels["xyz_sum"][rows] += xyz_sum
+        self._voxels["count"][rows] += count
+        if colors is not None:
+            colors = np.asarray(colors).reshape(-1, 3)[valid]
+            self._voxels["color_sum"][rows] += np.stack(
+                [np.bincount(inverse, colors[:, i], len(unique)) for i in range(3)],
+                axis=1,
+            )
+            self._voxels["color_count"][rows] += count
+        self._voxels["last_insert"][rows] = self.inserts
+
+        if self.max_points is not None and self.size > self.max_points:
+            self._evict(int(self.max_points * EVICTION_TARGET))
+
+    def _reserve(self, size):
+        """Grow the voxel array, if needed, to hold size voxels"""
+        if size <= len(self._voxels):
+            return
+        capacity = max(size, 2 * len(self._voxels))
+        if self.max_points is not None:
+            # the array grows over the budget only by the voxels of a single insert
+            capacity = min(capacity, max(size, self.max_points))
+        voxels = np.empty(capacity, dtype=VOXEL_DTYPE)
+        voxels[: self.size] = self._voxels[: self.size]
+        self._voxels = voxels
+
+    def _evict(self, size):
+        """Evict the voxels not seen for the longest time, until size voxels are left"""
+        voxels = self._voxels[: self.size]
+        # the least recently seen go first, and among them the ones seen less times
+        order = np.lexsort((voxels["count"], voxels["last_insert"]))
+        keep = np.sort(order[self.size - size :])
+        self._voxels[:size] = voxels[keep]
+        self.evicted += self.size - size
+        self.size = size
+        self._rows = dict(zip(self._voxels["key"][:size].tolist(), range(size)))
+
+    def export(self):
+        """Get the map as contiguous arrays, the voxels are in insertion order
+
+        Returns:
+            points (ndarray Nx3 with the mean of the points of each voxel),
+            colors (uint8 ndarray Nx3 with their mean color, 0 for the voxels without colored points)
+            and counts (ndarray N with the number of points merged in each voxel)
+        """
+        voxels = self._voxels[: self.size]
+        counts = voxels["count"].copy()
+        points = voxels["xyz_sum"] / counts[:, np.newaxis]
+        color_count = np.maximum(voxels["color_count"], 1)
+        colors = np.rint(voxels["color_sum"] / color_count[:, np.newaxis]).astype(
+            np.uint8
+        )
+        return points, colors, counts